@@ -0,0 +1,150 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+# --- AI 生成結果快取 ---
+# 同一份錄音 (以 SHA-256 識別) + 同一個模型 + 同一段提示詞，直接回傳上次生成的講義；
+# 就算提示詞不同 (例如換了輸出語言)，只要 Gemini 上的檔案還有效就不必重新上傳。
+# 逐字稿另外存放、不受大小上限淘汰：每份錄音只聽寫一次，之後的講義與各語言版本都從逐字稿衍生。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS remote_files (
+    audio_sha TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    uploaded REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transcripts (
+    audio_sha TEXT NOT NULL,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (audio_sha, model)
+);
+"""
+
+# Gemini Files API 的檔案 48 小時後會被刪除，留一點緩衝
+REMOTE_FILE_TTL = 46 * 3600
+TRANSCRIPT_MAX_AGE = 180 * 24 * 3600  # 大約一個學期
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def result_key(audio_sha, model_name, prompt):
+    return f"{audio_sha}:{model_name}:{hash_text(prompt)}"
+
+
+class AICache:
+    def __init__(self, db_path, max_age=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"result_hits": 0, "result_misses": 0, "file_hits": 0, "file_misses": 0,
+                      "transcript_hits": 0, "transcript_misses": 0}
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get_result(self, audio_sha, model_name, prompt):
+        key = result_key(audio_sha, model_name, prompt)
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT text FROM results WHERE key = ? AND created >= ?", (key, now - self.max_age)
+        ).fetchone()
+        if row is None:
+            self._count("result_misses")
+            return None
+        self._conn().execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        self._count("result_hits")
+        return row[0]
+
+    def put_result(self, audio_sha, model_name, prompt, text):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO results (key, text, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (result_key(audio_sha, model_name, prompt), text, len(text.encode("utf-8")), now, now),
+        )
+        self.evict()
+
+    def get_transcript(self, audio_sha, model_name):
+        row = self._conn().execute(
+            "SELECT text FROM transcripts WHERE audio_sha = ? AND model = ? AND created >= ?",
+            (audio_sha, model_name, time.time() - TRANSCRIPT_MAX_AGE),
+        ).fetchone()
+        self._count("transcript_hits" if row is not None else "transcript_misses")
+        return row[0] if row is not None else None
+
+    def put_transcript(self, audio_sha, model_name, text):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO transcripts (audio_sha, model, text, created) VALUES (?, ?, ?, ?)",
+            (audio_sha, model_name, text, time.time()),
+        )
+
+    def get_remote_file(self, audio_sha, genai):
+        """回傳仍然有效 (ACTIVE) 的 Gemini 檔案物件，失效或不存在則回傳 None。"""
+        row = self._conn().execute(
+            "SELECT file_name FROM remote_files WHERE audio_sha = ? AND uploaded >= ?",
+            (audio_sha, time.time() - REMOTE_FILE_TTL),
+        ).fetchone()
+        if row is not None:
+            try:
+                file = genai.get_file(row[0])
+                if file.state.name == "ACTIVE":
+                    self._count("file_hits")
+                    return file
+            except Exception:
+                pass
+            self._conn().execute("DELETE FROM remote_files WHERE audio_sha = ?", (audio_sha,))
+        self._count("file_misses")
+        return None
+
+    def put_remote_file(self, audio_sha, file_name):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO remote_files (audio_sha, file_name, uploaded) VALUES (?, ?, ?)",
+            (audio_sha, file_name, time.time()),
+        )
+
+    def evict(self):
+        # 先依存活時間淘汰，再依總大小淘汰最久沒用的結果
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM results WHERE created < ?", (now - self.max_age,))
+        conn.execute("DELETE FROM remote_files WHERE uploaded < ?", (now - REMOTE_FILE_TTL,))
+        conn.execute("DELETE FROM transcripts WHERE created < ?", (now - TRANSCRIPT_MAX_AGE,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
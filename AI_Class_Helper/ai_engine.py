@@ -0,0 +1,310 @@
+import functools
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import audio_tools
+import metrics
+from ai_cache import hash_file, hash_text
+from quiz_schema import ITEM_SCHEMA, OPTION_COUNT, QUIZ_LENGTH, QUIZ_SCHEMA, parse_quiz_json, question_key, validate_quiz
+from rate_limiter import PRIORITY_STUDENT, PRIORITY_TEACHER, estimate_tokens, shared_limiter
+
+# --- Gemini 呼叫核心 ---
+# 不依賴 Streamlit，讓網頁介面與背景工作都能共用；需要顯示訊息時透過 notify(訊息) 回呼。
+# google.generativeai 匯入要將近 1 秒，第一次真的呼叫 Gemini 時才載入，網頁冷啟動不必等；
+# 模型物件每種設定只建立一次，所有 session 與背景工作共用。
+
+
+def _genai():
+    import google.generativeai as genai
+    return genai
+
+
+def configure(api_key):
+    _genai().configure(api_key=api_key)
+    # 換了金鑰，已建立的模型物件綁的是舊的連線，全部重建
+    get_model.cache_clear()
+    _json_model.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_model(model_name):
+    return _genai().GenerativeModel(model_name)
+
+
+def upload_and_wait(file_path, preprocess=False, notify=None, trim_silence=True):
+    # 上傳前可先在本機壓縮 (單聲道 / 降取樣 / 剪長靜音 / MP3)，壓縮檔上傳後即刪除；
+    # 需要對照原始時間軸的用途 (例如帶時間戳記的逐字稿) 要傳 trim_silence=False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if preprocess and audio_tools.has_ffmpeg():
+            with metrics.span("audio.preprocess"):
+                stats = audio_tools.preprocess_audio(file_path, os.path.join(tmp_dir, "preprocessed.mp3"), trim_silence=trim_silence)
+            metrics.count("audio.preprocess_saved_bytes", stats["saved_bytes"])
+            if notify:
+                notify(
+                    f"🗜️ 錄音壓縮：{audio_tools.format_bytes(stats['input_bytes'])} → "
+                    f"{audio_tools.format_bytes(stats['output_bytes'])} "
+                    f"(省下 {stats['saved_bytes'] / max(stats['input_bytes'], 1):.0%})，耗時 {stats['seconds']:.1f} 秒"
+                )
+            file_path = stats["path"]
+        with metrics.span("gemini.upload"):
+            file = _genai().upload_file(file_path)
+    with metrics.span("gemini.processing_wait"):
+        while file.state.name == "PROCESSING":
+            time.sleep(2)
+            file = _genai().get_file(file.name)
+    if file.state.name == "FAILED":
+        raise Exception("檔案處理失敗")
+    return file
+
+
+def analyze_audio_with_ai(model_name, file_path, prompt, cache=None, notify=None, priority=PRIORITY_STUDENT, preprocess=False,
+                          trim_silence=True):
+    # 快取以原始錄音的雜湊為鍵：壓縮只發生在真的需要上傳時，命中快取就完全不必壓縮
+    audio_sha = None
+    if cache is not None:
+        audio_sha = hash_file(file_path)
+        cached_text = cache.get_result(audio_sha, model_name, prompt)
+        metrics.count("ai_cache.hit" if cached_text is not None else "ai_cache.miss")
+        if cached_text is not None:
+            return cached_text
+
+    model = get_model(model_name)
+    file = cache.get_remote_file(audio_sha, _genai()) if cache is not None else None
+    if file is None:
+        file = upload_and_wait(file_path, preprocess=preprocess, notify=notify, trim_silence=trim_silence)
+        if cache is not None:
+            cache.put_remote_file(audio_sha, file.name)
+
+    text = generate_with_retry(model, [file, prompt], notify=notify, priority=priority)
+    if cache is not None:
+        cache.put_result(audio_sha, model_name, prompt, text)
+    return text
+
+
+def generate_with_retry(model, contents, notify=None, priority=PRIORITY_STUDENT):
+    # 所有 generate_content 都經過全行程共用的限流器 (RPM/TPM 令牌桶 + 429 指數退避)
+    def call():
+        try:
+            with metrics.span("gemini.generate"):
+                return model.generate_content(contents).text
+        except Exception as e:
+            if "404" in str(e):
+                raise Exception(f"模型無法使用，請切換模型。")
+            raise
+    return shared_limiter().call(call, priority=priority, tokens=estimate_tokens(contents), notify=notify)
+
+
+def stream_with_retry(model, contents, priority=PRIORITY_STUDENT):
+    """以串流方式產生回答，逐段 yield 文字。
+
+    呼叫端中途停止讀取時 (例如使用者送出新問題、Streamlit 中斷這次執行)，請呼叫產生器的 close()，
+    finally 會立刻關閉連線並歸還串流名額。
+    """
+    limiter = shared_limiter()
+    start = time.perf_counter()
+    first_chunk = True
+    with limiter.stream_slot(), metrics.span("gemini.stream"):
+        # 429 通常在建立串流時就會發生，交給限流器退避重試
+        response = limiter.call(
+            lambda: model.generate_content(contents, stream=True), priority=priority, tokens=estimate_tokens(contents),
+        )
+        chunks = iter(response)
+        try:
+            for chunk in chunks:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # 被安全過濾或沒有內容的片段
+                    continue
+                if text:
+                    if first_chunk:
+                        metrics.observe("gemini.stream_first_token", time.perf_counter() - start)
+                        first_chunk = False
+                    yield text
+        finally:
+            close = getattr(chunks, "close", None)
+            if close: close()
+
+
+# --- 逐字稿優先：錄音只聽寫一次，講義與各語言版本都從逐字稿衍生 ---
+# 文字比音訊便宜又快：換輸出語言、學生另做筆記都不必重新上傳與分析錄音。
+TRANSCRIPT_PROMPT = """
+請把這段課堂錄音逐字聽寫成逐字稿，使用錄音原本的語言，不要翻譯、不要摘要、不要加上評論。
+每一行以時間戳記開頭，格式為 [HH:MM:SS] (從這段錄音開頭算起)，大約每一句話或每 15-30 秒換一行。
+聽不清楚的地方寫「(聽不清楚)」，不要自行補上內容。只輸出逐字稿本身。
+"""
+
+TRANSCRIPT_NOTE_PROMPT = """
+以下是一堂課錄音的逐字稿，每一行開頭是時間戳記。請把它當成你剛聽完的錄音，嚴格依照下列要求輸出 (不必照抄時間戳記)：
+{note_prompt}
+
+【逐字稿】：
+{transcript}
+"""
+
+TIMESTAMP_RE = re.compile(r"\[(?:(\d+):)?(\d{1,2}):(\d{2})\]")
+
+
+def shift_timestamps(text, offset_seconds):
+    """把逐字稿裡的 [HH:MM:SS] / [MM:SS] 時間戳記往後移 offset_seconds 秒 (分段聽寫後接回整堂課的時間)。"""
+    def shift(match):
+        hours, minutes, seconds = (int(g) if g else 0 for g in match.groups())
+        return f"[{audio_tools.format_timestamp(hours * 3600 + minutes * 60 + seconds + offset_seconds)}]"
+    return TIMESTAMP_RE.sub(shift, text)
+
+
+def transcribe_audio(model_name, file_path, cache=None, audio_sha=None, segmented=False, max_workers=4, notify=None,
+                     on_progress=None, priority=PRIORITY_STUDENT, preprocess=False):
+    """產生帶時間戳記的逐字稿。同一份錄音 (同一模型) 只聽寫一次，之後直接從快取取出。
+
+    preprocess 只壓縮、不剪靜音，逐字稿的時間戳記才會對得上原始錄音。
+    segmented 時在靜音處切段、平行聽寫後依序接起來 (時間戳記換算回整堂課的時間)，不需要再呼叫一次合併。
+    on_progress(完成段數, 總段數, 剛完成的段落編號) 在呼叫端的執行緒中被呼叫。
+    """
+    if cache is not None:
+        audio_sha = audio_sha or hash_file(file_path)
+        transcript = cache.get_transcript(audio_sha, model_name)
+        metrics.count("transcript.hit" if transcript is not None else "transcript.miss")
+        if transcript is not None:
+            return transcript
+
+    with metrics.span("transcript.audio"), tempfile.TemporaryDirectory() as segment_dir:
+        segments = None
+        if segmented:
+            with metrics.span("audio.split"):
+                segments = audio_tools.split_on_silence(file_path, segment_dir)
+        if not segments or len(segments) == 1:
+            transcript = analyze_audio_with_ai(
+                model_name, file_path, TRANSCRIPT_PROMPT, cache=cache, notify=notify, priority=priority, preprocess=preprocess,
+                trim_silence=False,
+            )
+        else:
+            total = len(segments)
+            parts = [None] * total
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {
+                    pool.submit(analyze_audio_with_ai, model_name, path, TRANSCRIPT_PROMPT, cache, None, priority): i
+                    for i, (path, _, _) in enumerate(segments)
+                }
+                # 每段各自重試，遇到 429 只會重送該段
+                for done, future in enumerate(as_completed(futures), start=1):
+                    i = futures[future]
+                    parts[i] = shift_timestamps(future.result().strip(), segments[i][1])
+                    if on_progress: on_progress(done, total, i)
+            transcript = "\n".join(parts)
+
+    if cache is not None:
+        cache.put_transcript(audio_sha, model_name, transcript)
+    return transcript
+
+
+def note_from_transcript(model_name, transcript, prompt, cache=None, notify=None, priority=PRIORITY_STUDENT):
+    """依講義提示詞從逐字稿產生講義；快取以逐字稿的雜湊為鍵。"""
+    transcript_sha, cache_model_key = hash_text(transcript), f"{model_name}/transcript"
+    if cache is not None:
+        cached_text = cache.get_result(transcript_sha, cache_model_key, prompt)
+        metrics.count("ai_cache.hit" if cached_text is not None else "ai_cache.miss")
+        if cached_text is not None:
+            return cached_text
+    with metrics.span("transcript.derive"):
+        text = generate_with_retry(
+            get_model(model_name), TRANSCRIPT_NOTE_PROMPT.format(note_prompt=prompt, transcript=transcript),
+            notify=notify, priority=priority,
+        )
+    if cache is not None:
+        cache.put_result(transcript_sha, cache_model_key, prompt, text)
+    return text
+
+
+def derive_notes(model_name, transcript, prompts_by_key, max_workers=4, cache=None, notify=None, on_progress=None,
+                 priority=PRIORITY_STUDENT):
+    """從同一份逐字稿平行產生多份講義 (例如多個語言版本)，回傳 {鍵: 講義}，順序與 prompts_by_key 相同。"""
+    notes = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts_by_key)))) as pool:
+        futures = {
+            pool.submit(note_from_transcript, model_name, transcript, prompt, cache, notify, priority): key
+            for key, prompt in prompts_by_key.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            notes[futures[future]] = future.result()
+            if on_progress: on_progress(done, len(futures), futures[future])
+    return {key: notes[key] for key in prompts_by_key}
+
+
+# --- 互動測驗 (結構化 JSON 輸出 + 逐題檢查修補) ---
+QUIZ_PROMPT = """
+請根據以下講義內容中的「課內教學重點」，設計 {count} 題適合學生的「單選題」測驗。
+這是一個類似 Kahoot 的互動遊戲，請確保題目有趣、難易適中，且涵蓋核心觀念。
+注意：請「絕對不要」把「課外延伸與閒聊」的內容拿來出題！
+每題剛好 {options} 個不重複的選項，answer 必須與 options 裡其中一個選項的文字完全一模一樣，explanation 為解析說明。
+
+【講義內容】：
+{note_content}
+"""
+
+QUIZ_ITEM_PROMPT = """
+請根據以下講義內容中的「課內教學重點」，再設計 1 題適合學生的「單選題」(這是第 {slot} 題補題)。
+不可與下列已經出過的題目重複或考同一個觀念：
+{existing}
+
+每題剛好 {options} 個不重複的選項，answer 必須與 options 裡其中一個選項的文字完全一模一樣，explanation 為解析說明。
+請「絕對不要」把「課外延伸與閒聊」的內容拿來出題！
+
+【講義內容】：
+{note_content}
+"""
+
+
+JSON_SCHEMAS = {"quiz": QUIZ_SCHEMA, "item": ITEM_SCHEMA}
+
+
+@functools.lru_cache(maxsize=None)
+def _json_model(model_name, schema_name):
+    return _genai().GenerativeModel(
+        model_name, generation_config={"response_mime_type": "application/json", "response_schema": JSON_SCHEMAS[schema_name]},
+    )
+
+
+def _regenerate_item(model, note_content, existing_questions, slot, notify=None):
+    existing = "\n".join(f"- {q}" for q in existing_questions) or "(無)"
+    prompt = QUIZ_ITEM_PROMPT.format(slot=slot, existing=existing, options=OPTION_COUNT, note_content=note_content)
+    items, _ = validate_quiz(parse_quiz_json(generate_with_retry(model, prompt, notify=notify, priority=PRIORITY_TEACHER)), limit=1)
+    return items[0] if items else None
+
+
+def generate_interactive_quiz(model_name, note_content, title, count=QUIZ_LENGTH, max_repair_rounds=3, max_workers=4,
+                              notify=None):
+    """出一份 count 題的測驗。格式有誤、修補不了的題目會平行地逐題補出，不必整份重新生成。"""
+    text = generate_with_retry(
+        _json_model(model_name, "quiz"), QUIZ_PROMPT.format(count=count, options=OPTION_COUNT, note_content=note_content),
+        notify=notify, priority=PRIORITY_TEACHER,
+    )
+    items, problems = validate_quiz(parse_quiz_json(text), limit=count)
+
+    item_model = _json_model(model_name, "item")
+    for _ in range(max_repair_rounds):
+        missing = count - len(items)
+        if missing <= 0:
+            break
+        if notify: notify(f"🔧 「{title}」有 {missing} 題格式不符，正在逐題補題...")
+        metrics.count("quiz.regenerated_items", missing)
+        existing = [item["question"] for item in items]
+        seen = {question_key(q) for q in existing}
+        with ThreadPoolExecutor(max_workers=min(max_workers, missing)) as pool:
+            futures = [
+                pool.submit(_regenerate_item, item_model, note_content, existing, len(items) + i + 1, notify)
+                for i in range(missing)
+            ]
+            for future in futures:
+                item = future.result()
+                # 同一輪平行補出的題目可能彼此重複，重複的留到下一輪再補
+                if item is not None and question_key(item["question"]) not in seen:
+                    items.append(item)
+                    seen.add(question_key(item["question"]))
+
+    if len(items) < count:
+        raise Exception(f"AI 出題格式錯誤，只取得 {len(items)}/{count} 題有效題目 ({len(problems)} 題無法修補)，請稍後再試。")
+    return items
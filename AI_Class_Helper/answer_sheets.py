@@ -0,0 +1,165 @@
+import csv
+import io
+import re
+from datetime import datetime
+
+import metrics
+
+# --- 匯入答案卷批次批改 (紙本測驗、其他平台匯出的作答) ---
+# 試算表 (CSV 或 Excel) 第一列為標題：一欄姓名/學號、每題一欄 (Q1、Q2… 或 1、2…，也可以是「第1題」)，
+# 可另有「交卷時間」欄；課程包匯出的成績表可以直接匯回。
+# 作答可以寫選項字母 (A-D)、選項編號 (1-4) 或選項全文，空白視為未作答，認不得的內容也當作未作答並另外計數。
+#
+# 批改完全向量化：每一欄整欄查表換成選項編號，得到 (人數 x 題數) 的作答矩陣後
+# 與正確答案列一次比對，分數 = 答對題數 x 100 // 題數。
+# 寫入由 QuizResultStore.add_answer_matrix 在同一個交易內完成。
+# openpyxl 只有匯入 Excel 時才用得到，用到時才匯入。
+
+QUESTION_HEADER_RE = re.compile(r"^\s*(?:[Qq]|第)?\s*(\d+)\s*題?\s*$")
+NAME_HEADERS = {"姓名", "學號", "姓名/學號", "學生", "name", "id", "student"}
+TIME_HEADERS = {"交卷時間", "時間", "timestamp", "time"}
+SKIP_HEADERS = {"分數", "score"}
+CSV_ENCODINGS = ("utf-8-sig", "cp950")  # Excel 在繁中 Windows 另存 CSV 時是 Big5 (cp950)
+
+
+def read_sheet(data, filename):
+    """把上傳的 CSV / XLSX 讀成 (標題, 資料列)；每個儲存格都轉成去掉前後空白的字串。"""
+    if filename.lower().endswith(".xlsx"):
+        rows = _read_xlsx(data)
+    else:
+        rows = _read_csv(data)
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        raise ValueError("答案卷是空的。")
+    width = len(rows[0])
+    # 每列補齊 (或截斷) 成與標題同寬，方便整欄轉成陣列
+    return rows[0], [(row + [""] * width)[:width] for row in rows[1:]]
+
+
+def _read_csv(data):
+    for encoding in CSV_ENCODINGS:
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError("無法辨識 CSV 的文字編碼，請另存為 UTF-8。")
+    return [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text))]
+
+
+def _read_xlsx(data):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("伺服器沒有安裝 openpyxl，請把答案卷另存為 CSV 再上傳。")
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        return [[_cell_text(value) for value in row] for row in workbook.worksheets[0].iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # Excel 把選項編號 2 存成 2.0
+    return str(value).strip()
+
+
+def locate_columns(header, n_questions):
+    """找出姓名欄、交卷時間欄 (可能沒有) 與依題號排序的作答欄；題數對不上時丟出 ValueError。"""
+    questions = {}
+    name_col = time_col = None
+    for col, title in enumerate(header):
+        match = QUESTION_HEADER_RE.match(title)
+        if match:
+            questions.setdefault(int(match.group(1)), col)
+        elif title.lower() in TIME_HEADERS:
+            time_col = col
+        elif name_col is None and title.lower() in NAME_HEADERS:
+            name_col = col
+    if name_col is None:
+        # 沒有明確的姓名標題時，取第一個不是題目、時間或分數的欄位
+        name_col = next(
+            (col for col, title in enumerate(header)
+             if col not in questions.values() and col != time_col and title.lower() not in SKIP_HEADERS),
+            None,
+        )
+    if name_col is None:
+        raise ValueError("找不到姓名/學號欄。")
+    if sorted(questions) != list(range(1, n_questions + 1)):
+        raise ValueError(f"答案卷需要 Q1 到 Q{n_questions} 共 {n_questions} 個作答欄，實際找到 {len(questions)} 欄。")
+    return name_col, time_col, [questions[i + 1] for i in range(n_questions)]
+
+
+UNKNOWN = -2  # 認不得的作答，計數後當作未作答
+
+
+def _option_lookup(options):
+    # 同一題的作答寫法 → 選項編號：字母、從 1 起算的編號、選項全文；空白為未作答
+    lookup = {"": -1}
+    for i, option in enumerate(options):
+        lookup[chr(ord("A") + i)] = lookup[chr(ord("a") + i)] = lookup[str(i + 1)] = i
+        lookup.setdefault(option.strip(), i)
+    return lookup
+
+
+def answer_matrix(quiz_data, columns):
+    """把每題一欄的作答字串轉成 (人數 x 題數) 的 int8 選項編號矩陣 (未作答為 -1)，並回傳認不得的儲存格數。"""
+    import numpy as np
+    n_rows = len(columns[0]) if columns else 0
+    matrix = np.empty((n_rows, len(quiz_data)), dtype=np.int8)
+    for q, (item, column) in enumerate(zip(quiz_data, columns)):
+        # 整欄一次查表 (dict.get 在 C 裡逐格執行)，直接填進矩陣的一欄
+        lookup = _option_lookup(item["options"]).get
+        matrix[:, q] = np.fromiter(map(lookup, column, [UNKNOWN] * n_rows), dtype=np.int8, count=n_rows)
+    unknown = matrix == UNKNOWN
+    matrix[unknown] = -1
+    return matrix, int(unknown.sum())
+
+
+def grade_matrix(matrix, key_indices):
+    """向量化批改：回傳每位學生的分數 (0-100 整數) 與 (人數 x 題數) 的答對矩陣。"""
+    import numpy as np
+    key = np.asarray(key_indices, dtype=np.int8)
+    # 正確答案不在選項裡的題目 (編號 -1) 不能讓未作答算成答對
+    correct = (matrix == key[np.newaxis, :]) & (matrix >= 0)
+    n_questions = max(1, len(key))
+    scores = correct.sum(axis=1, dtype=np.int32) * 100 // n_questions
+    return scores, correct
+
+
+def grade_rows(quiz_data, header, rows, timestamp=None):
+    """批改已讀進來的答案卷，回傳 {"names", "timestamps", "matrix", "scores", "key_indices", "unknown", "skipped"}。
+
+    沒有姓名的列會略過 (計入 skipped)；答案卷沒有交卷時間欄時，全部使用 timestamp (預設為現在)。
+    """
+    name_col, time_col, question_cols = locate_columns(header, len(quiz_data))
+    with metrics.span("answer_sheets.grade"):
+        kept = [row for row in rows if row[name_col]]
+        if not kept:
+            raise ValueError("答案卷裡沒有任何學生的作答。")
+        columns = list(zip(*kept))
+        matrix, unknown = answer_matrix(quiz_data, [columns[col] for col in question_cols])
+        key_indices = [q["options"].index(q["answer"]) if q["answer"] in q["options"] else -1 for q in quiz_data]
+        scores, _ = grade_matrix(matrix, key_indices)
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    metrics.count("answer_sheets.rows", len(kept))
+    return {
+        "names": list(columns[name_col]),
+        "timestamps": [t or timestamp for t in columns[time_col]] if time_col is not None else [timestamp] * len(kept),
+        "matrix": matrix,
+        "scores": scores,
+        "key_indices": key_indices,
+        "unknown": unknown,
+        "skipped": len(rows) - len(kept),
+    }
+
+
+def grade_sheet(quiz_data, data, filename, timestamp=None):
+    """讀取並批改上傳的答案卷 (CSV / XLSX 的原始 bytes)，回傳值同 grade_rows。"""
+    with metrics.span("answer_sheets.read"):
+        header, rows = read_sheet(data, filename)
+    return grade_rows(quiz_data, header, rows, timestamp)
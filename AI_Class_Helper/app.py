@@ -1,88 +1,184 @@
 import streamlit as st
-import google.generativeai as genai
-import tempfile
 import os
+import re
 import time
-import markdown
 import json
-import re
+import hashlib
+import functools
+import random
+import uuid
 from datetime import datetime
+from quiz_store import QuizResultStore, item_analysis
+from comment_store import CommentStore
+from pdf_cache import PdfCache
+from catalog import Catalog
+from search_index import SearchIndex
+from ai_cache import AICache, hash_file
+from ai_engine import configure, derive_notes, generate_interactive_quiz, get_model, stream_with_retry, transcribe_audio
+from quiz_schema import apply_variant, make_variants
+from publishing import make_display_note, publish_quiz
+import publishing
+import prompts
+from jobs import JobManager, DONE, FAILED
+from live_quiz import FINISHED, LOBBY, QUESTION, QUESTION_SECONDS, REVEAL, LiveQuizError, LiveQuizHub
+from tutor_context import NoteIndex, build_chat_context
+from tutor_cache import TutorAnswerCache, note_key
+from rate_limiter import PRIORITY_CHAT, PRIORITY_STUDENT, PRIORITY_TEACHER, shared_limiter
+import answer_sheets
+import audio_tools
+import course_pack
+import live_notes
+import metrics
+from uploads import UploadBudget, spool_to_disk, upload_size
 
 # --- 0. 初始化系統資料夾與資料庫 ---
 SHARED_DIR = "shared_notes"
 QUIZ_DIR = "shared_quizzes"
 os.makedirs(SHARED_DIR, exist_ok=True)
 os.makedirs(QUIZ_DIR, exist_ok=True)
-COMMENTS_FILE = os.path.join(SHARED_DIR, "comments.json")
-QUIZ_RESULTS_FILE = os.path.join(QUIZ_DIR, "quiz_results.json") # 新增：成績儲存庫
+COMMENTS_FILE = os.path.join(SHARED_DIR, "comments.json") # 舊版留言檔 (僅供一次性匯入)
+COMMENTS_DIR = os.path.join(SHARED_DIR, "comments") # 新增：每份講義一個留言分片
+PDF_CACHE_DIR = "pdf_cache" # 新增：PDF 排版快取
+AI_CACHE_DB = "ai_cache.db" # 新增：錄音去重與 AI 生成結果快取
+JOBS_DIR = "jobs" # 新增：背景工作狀態與結果
+COURSE_PACK_DIR = "course_packs" # 新增：期末課程包 ZIP (以內容雜湊命名，保留最近幾份)
+CATALOG_FILE = "catalog.json" # 新增：已發布講義與測驗的目錄索引
+CATALOG_PAGE_SIZE = 20 # 下拉選單每頁顯示幾份講義/測驗
+SEARCH_DB = "search_index.db" # 新增：講義全文搜尋索引 (僅含學生可見內容)
+CHAT_TOKEN_BUDGET = 3000 # AI 助教每次提問最多送出的上下文 token 數 (講義段落 + 對話)
+QUIZ_RESULTS_FILE = os.path.join(QUIZ_DIR, "quiz_results.json") # 舊版成績檔 (僅供一次性匯入)
+QUIZ_RESULTS_DB = os.path.join(QUIZ_DIR, "quiz_results.db") # 新增：成績儲存庫 (SQLite)
+METRICS_PROM_FILE = "metrics.prom" # 新增：各階段耗時與事件計數 (Prometheus 文字格式，定時覆寫)
+METRICS_JSONL_FILE = "metrics.jsonl" # 新增：同上，JSONL 快照 (定時追加)
+QUIZ_VARIANTS_DIR = os.path.join(QUIZ_DIR, "variants") # 新增：測驗洗牌版本 (題目與選項順序)
+MAX_QUIZ_VARIANTS = 6
+os.makedirs(QUIZ_VARIANTS_DIR, exist_ok=True)
+STYLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css") # 新增：全站樣式
+
+@st.cache_resource
+def load_css():
+    # 讀檔並去掉註解與多餘空白只做一次；每次重跑仍要送出樣式，但送的是精簡過的版本
+    with open(STYLE_FILE, "r", encoding="utf-8") as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    return re.sub(r"\s*([{};>,])\s*", r"\1", re.sub(r"\s+", " ", css)).strip()
+
+@st.cache_resource(max_entries=1)
+def configure_gemini(api_key):
+    # genai.configure 是整個行程共用的設定，同一把金鑰只需設定一次 (第一次呼叫時才載入 google.generativeai)
+    configure(api_key)
+
+@st.cache_resource
+def get_comment_store():
+    store = CommentStore(COMMENTS_DIR)
+    store.migrate_from_json(COMMENTS_FILE)
+    return store
+
+@st.cache_resource
+def get_pdf_cache():
+    return PdfCache(PDF_CACHE_DIR)
+
+@st.cache_resource
+def get_catalog():
+    return Catalog(SHARED_DIR, QUIZ_DIR, CATALOG_FILE)
+
+@st.cache_resource
+def get_search_index():
+    return SearchIndex(SEARCH_DB)
+
+def read_shared_note(note_filename):
+    with open(os.path.join(SHARED_DIR, note_filename), "r", encoding="utf-8") as f:
+        return f.read()
+
+@st.cache_resource
+def get_ai_cache():
+    return AICache(AI_CACHE_DB)
+
+@st.cache_resource
+def get_rate_limiter():
+    # 所有 session 共用同一組額度；可在 Secrets 設定 GEMINI_RPM / GEMINI_TPM 配合帳號方案
+    rpm = int(st.secrets["GEMINI_RPM"]) if "GEMINI_RPM" in st.secrets else 60
+    tpm = int(st.secrets["GEMINI_TPM"]) if "GEMINI_TPM" in st.secrets else 1_000_000
+    return shared_limiter(rpm=rpm, tpm=tpm)
+
+@st.cache_resource(max_entries=32)
+def get_note_index(note_text):
+    # 同一份講義只切段、建索引一次，所有 session 共用
+    return NoteIndex(note_text)
+
+@st.cache_resource
+def get_tutor_cache():
+    # 整個伺服器行程共用：同一份講義上相近的問題，第一個人問完後其他人直接拿到答案
+    return TutorAnswerCache()
 
-def load_comments():
-    if os.path.exists(COMMENTS_FILE):
-        with open(COMMENTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+@st.cache_resource
+def get_metrics():
+    # 整個行程共用；背景執行緒定時把統計寫到 metrics.prom / metrics.jsonl
+    shared = metrics.shared_metrics()
+    shared.start_export(METRICS_PROM_FILE, METRICS_JSONL_FILE)
+    return shared
 
-def save_comments(comments_data):
-    with open(COMMENTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(comments_data, f, ensure_ascii=False, indent=2)
+@st.cache_resource
+def get_job_manager():
+    return JobManager(JOBS_DIR)
 
-def load_quiz_results():
-    if os.path.exists(QUIZ_RESULTS_FILE):
-        with open(QUIZ_RESULTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+@st.cache_resource
+def get_live_notes():
+    # 上課中即時筆記：所有 session 共用一個背景執行緒池，完整逐字稿存進 AI 快取
+    return live_notes.LiveNoteHub(get_ai_cache())
 
-def save_quiz_results(results_data):
-    with open(QUIZ_RESULTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(results_data, f, ensure_ascii=False, indent=2)
+# 已收下但還沒處理完的錄音總量上限 (整個伺服器 / 每個 session)，避免多人同時上傳長錄音時撐爆暫存空間
+MAX_INFLIGHT_UPLOAD_BYTES = 1024 * 1024 * 1024
+MAX_SESSION_UPLOAD_BYTES = 400 * 1024 * 1024 # 與 .streamlit/config.toml 的 server.maxUploadSize (MB) 一致
+AUDIO_PREVIEW_MAX_BYTES = 20 * 1024 * 1024 # 超過就不提供試聽，試聽播放器會在記憶體裡再存一份錄音
+
+@st.cache_resource
+def get_upload_budget():
+    return UploadBudget(MAX_INFLIGHT_UPLOAD_BYTES, MAX_SESSION_UPLOAD_BYTES)
+
+def publish_note(note_filename, raw_note):
+    # 原子寫入講義，同時更新目錄、搜尋索引並預先排版 PDF
+    publishing.publish_note(SHARED_DIR, note_filename, raw_note, get_catalog(), get_search_index(), get_pdf_cache())
+
+SEARCH_RESULTS_LIMIT = 10
+
+def load_shared_note(note_filename):
+    st.session_state.generated_note = read_shared_note(note_filename)
+    st.session_state.note_filename = note_filename
+    st.session_state.current_shared_file = note_filename
+    st.session_state.note_versions = {}
+    st.session_state.note_source = None
+    st.session_state.chat_history = []
+    st.rerun()
+
+def catalog_selectbox(label, kind, key):
+    # 依發布時間由新到舊排序；項目太多時分頁，只把目前這一頁放進下拉選單
+    catalog = get_catalog()
+    total = catalog.count(kind)
+    page = 1
+    if total > CATALOG_PAGE_SIZE:
+        pages = (total + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE
+        page = st.number_input(f"📄 頁數 (共 {pages} 頁、{total} 份)", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    entries = catalog.query(kind, sort="newest", offset=(page - 1) * CATALOG_PAGE_SIZE, limit=CATALOG_PAGE_SIZE)
+    labels = {e["file"]: f"{e['title']}  ·  {datetime.fromtimestamp(e['created']).strftime('%Y-%m-%d')}{' 🎮' if e.get('has_quiz') else ''}" for e in entries}
+    return st.selectbox(label, ["-- 請選擇 --"] + list(labels), key=key, format_func=lambda f: labels.get(f, f))
+
+@st.cache_resource
+def get_quiz_store():
+    # 整個伺服器行程共用一個成績庫，並在第一次啟動時匯入舊版 JSON 成績
+    store = QuizResultStore(QUIZ_RESULTS_DB)
+    store.migrate_from_json(QUIZ_RESULTS_FILE)
+    return store
+
+@st.cache_resource
+def get_live_hub():
+    # 即時測驗的房間狀態整個行程共用 (所有學生 session 看到同一份)，結束時成績寫進同一個成績庫
+    return LiveQuizHub(get_quiz_store())
 
 # --- 1. 設定頁面基礎 ---
 st.set_page_config(page_title="AI 課堂速記與教學系統", page_icon="📝", layout="centered")
 
-# --- 終極版 CSS 魔法：完美分離導覽列與測驗題 ---
-st.markdown("""
-    <style>
-    .stApp { background-color: #F5F7F9; }
-    .stButton>button { color: white; background-color: #FF4B4B; border-radius: 20px; height: 3em; width: 100%; }
-    
-    /* 1. 隱藏「水平」單選按鈕的圓圈 (!important 強制覆蓋原生樣式) */
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label > div:first-child { 
-        display: none !important; 
-    }
-    
-    /* 2. 將「水平」選項的背景變成按鈕外觀 */
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label { 
-        padding: 10px 20px !important; 
-        background-color: #FFFFFF !important; 
-        border: 1px solid #E0E0E0 !important; 
-        border-radius: 8px !important; 
-        margin-right: 10px !important;
-        margin-bottom: 5px !important;
-        cursor: pointer !important;
-        transition: all 0.2s ease !important;
-    }
-    
-    /* 3. 懸停時的視覺效果 */
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label:hover {
-        background-color: #F8F9FA !important;
-        border-color: #FF4B4B !important;
-    }
-    
-    /* 4. 選中時的效果 (使用最新 CSS :has 選擇器捕捉內部 radio 的選取狀態) */
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label:has(input:checked),
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label:has(div[data-checked="true"]) { 
-        background-color: #FF4B4B !important; 
-        border-color: #FF4B4B !important; 
-    }
-    
-    /* 5. 選中時的文字變為白色 */
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label:has(input:checked) p,
-    div[data-testid="stRadio"] div[role="radiogroup"][aria-orientation="horizontal"] > label:has(div[data-checked="true"]) p { 
-        color: #FFFFFF !important; 
-        font-weight: 600 !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+# --- 終極版 CSS 魔法：完美分離導覽列與測驗題 (樣式在 style.css) ---
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
 
 # --- 2. 帳號登入與狀態管理 ---
 USERS = {
@@ -92,10 +188,15 @@ USERS = {
 
 if 'logged_in' not in st.session_state: st.session_state.logged_in = False
 if 'user_role' not in st.session_state: st.session_state.user_role = None
+if 'username' not in st.session_state: st.session_state.username = None
 if 'generated_note' not in st.session_state: st.session_state.generated_note = None
 if 'note_filename' not in st.session_state: st.session_state.note_filename = ""
 if 'chat_history' not in st.session_state: st.session_state.chat_history = []
 if 'current_shared_file' not in st.session_state: st.session_state.current_shared_file = None
+if 'pending_note_job' not in st.session_state: st.session_state.pending_note_job = None
+if 'note_versions' not in st.session_state: st.session_state.note_versions = {} # 新增：同一份錄音的各語言版本 {語言: 講義}
+if 'live_note_session' not in st.session_state: st.session_state.live_note_session = None # 新增：進行中的即時筆記
+if 'note_source' not in st.session_state: st.session_state.note_source = None # 新增：(錄音雜湊, 身分)，可從逐字稿再衍生其他語言
 
 if not st.session_state.logged_in:
     st.title("🔐 AI 課堂速記與教學系統")
@@ -108,6 +209,7 @@ if not st.session_state.logged_in:
         if st.button("登入系統", type="primary", use_container_width=True):
             if username in USERS and USERS[username]["password"] == password:
                 st.session_state.logged_in = True
+                st.session_state.username = username
                 st.session_state.user_role = USERS[username]["role"]
                 st.rerun()
             else:
@@ -116,6 +218,98 @@ if not st.session_state.logged_in:
 
 role = st.session_state.user_role
 
+# --- 背景工作面板 (fragment：定時查詢工作狀態) ---
+JOB_ICONS = {"queued": "🕒", "running": "⚙️", "done": "✅", "failed": "❌"}
+
+def load_note_from_job(job):
+    result = job["result"]
+    source = (result["audio_sha"], result["view"]) if "audio_sha" in result else None
+    # 同一份錄音衍生的其他語言版本併入目前的版本清單
+    if source is None or source != st.session_state.note_source:
+        st.session_state.note_versions = {}
+    st.session_state.note_versions.update(result.get("notes", {}))
+    st.session_state.note_source = source
+    st.session_state.generated_note = result["note"]
+    st.session_state.note_filename = result["filename"]
+    st.session_state.chat_history = []
+    st.session_state.current_shared_file = None
+
+def my_jobs_panel():
+    # 有排隊中、執行中的工作 (或等著自動載入的講義) 才每 3 秒更新；
+    # 沒有的話只畫一次，不讓每個 session 都在背景定時重跑
+    if st.session_state.pending_note_job or get_job_manager().has_active(st.session_state.username):
+        live_jobs_panel()
+    else:
+        jobs_list()
+
+@st.fragment(run_every=3)
+def live_jobs_panel():
+    if not jobs_list():
+        st.rerun()  # 工作都結束了：整頁重跑一次，換回不輪詢的版本
+
+def jobs_list():
+    """畫出自己最近的背景工作；回傳是否還需要繼續更新。"""
+    manager = get_job_manager()
+    # 本 session 送出的講義工作一完成就自動載入
+    pending_id = st.session_state.pending_note_job
+    if pending_id:
+        job = manager.get(pending_id)
+        if job is None or job["status"] == FAILED:
+            st.session_state.pending_note_job = None
+        elif job["status"] == DONE:
+            st.session_state.pending_note_job = None
+            load_note_from_job(job)
+            st.toast("✅ 講義生成完成！請至下方預覽。", icon="🎉")
+            st.rerun()
+
+    jobs = manager.list_jobs(st.session_state.username, limit=5)
+    if not jobs:
+        st.caption("目前沒有背景工作。")
+    for job in jobs:
+        st.markdown(f"{JOB_ICONS[job['status']]} **{job['title']}**")
+        if job["status"] in ("queued", "running"):
+            st.progress(job["progress"], text=job["message"])
+        elif job["status"] == FAILED:
+            st.caption(f"❌ {job['error']}")
+        elif job["kind"] in ("note", "translate"):
+            if st.button("📄 載入此講義", key=f"load_job_{job['id']}", use_container_width=True):
+                load_note_from_job(job)
+                st.rerun()
+    return bool(st.session_state.pending_note_job) or manager.has_active(st.session_state.username)
+
+@st.fragment(run_every=5)
+def rate_limiter_panel(rate_limiter):
+    stats = rate_limiter.stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("排隊中", stats["queued"])
+    col2.metric("被限流", stats["throttled"])
+    col3.metric("429 重試", stats["retried"])
+    st.caption("各優先順序排隊數：" + "、".join(f"{lane} {n}" for lane, n in stats["queued_by_lane"].items()))
+    st.caption(f"累計呼叫 {stats['calls']} 次，放棄 {stats['failed']} 次，進行中串流 {stats['streams_active']} 個")
+    uploads = get_upload_budget().stats()
+    st.caption(f"📥 處理中的上傳錄音 {audio_tools.format_bytes(uploads['in_flight_bytes'])} / {audio_tools.format_bytes(MAX_INFLIGHT_UPLOAD_BYTES)} ({uploads['sessions']} 個 session)")
+
+@st.fragment(run_every=10)
+def metrics_panel():
+    snapshot = get_metrics().snapshot()
+    if not snapshot["stages"]:
+        st.info("目前還沒有任何紀錄，生成講義、出題或下載 PDF 後這裡就會出現各階段的耗時。")
+    else:
+        st.markdown(f"**⏱️ 各階段耗時** (百分位數以每階段最近 {metrics.RECENT_SAMPLES} 次計算)")
+        st.dataframe(
+            [
+                {"階段": stage, "次數": s["count"], "p50 (ms)": round(s["p50"] * 1000, 1), "p95 (ms)": round(s["p95"] * 1000, 1),
+                 "最大 (ms)": round(s["max"] * 1000, 1), "累計 (秒)": round(s["sum"], 1)}
+                for stage, s in sorted(snapshot["stages"].items(), key=lambda x: -x[1]["sum"])
+            ],
+            hide_index=True, use_container_width=True,
+        )
+    if snapshot["counters"]:
+        st.markdown("**🔢 事件計數** (重試、429、失敗、快取命中等)")
+        st.dataframe([{"事件": k, "次數": v} for k, v in sorted(snapshot["counters"].items())], hide_index=True, use_container_width=True)
+    st.download_button("📥 下載 Prometheus 格式", data=get_metrics().to_prometheus(snapshot), file_name=METRICS_PROM_FILE, mime="text/plain")
+    st.caption(f"同樣的資料每 {metrics.EXPORT_INTERVAL_SECONDS} 秒寫到 {METRICS_PROM_FILE} 與 {METRICS_JSONL_FILE}，可交給 Prometheus / 其他監控工具收集。")
+
 # --- 3. 側邊欄設定 ---
 with st.sidebar:
     st.title("⚙️ 系統設定")
@@ -126,6 +320,10 @@ with st.sidebar:
         st.session_state.generated_note = None
         st.session_state.chat_history = []
         st.session_state.current_shared_file = None
+        st.session_state.pending_note_job = None
+        st.session_state.note_versions = {}
+        st.session_state.note_source = None
+        st.session_state.live_note_session = None
         st.rerun()
         
     st.divider()
@@ -139,113 +337,712 @@ with st.sidebar:
 
     model_name = "gemini-2.5-flash"
     
-    output_language = st.selectbox(
-        "🌐 選擇生成的筆記語言",
-        ["繁體中文", "English", "日本語", "한국어", "Español", "簡體中文", "自動偵測 (與錄音相同)"]
+    output_language = st.selectbox("🌐 選擇生成的筆記語言", prompts.OUTPUT_LANGUAGES)
+    extra_languages = st.multiselect(
+        "🌍 同時產生其他語言版本", [lang for lang in prompts.OUTPUT_LANGUAGES if lang != output_language],
+        help="錄音只聽寫成逐字稿一次，各語言版本都從逐字稿平行產生，不必重新分析錄音",
     )
 
+    segment_workers = st.slider("✂️ 長錄音分段平行處理數", min_value=1, max_value=8, value=4, help="分段模式下同時分析的段落數量")
+    # 需要 ffmpeg；沒有安裝時直接上傳原始錄音
+    compress_audio = audio_tools.has_ffmpeg() and st.toggle(
+        "🗜️ 上傳前先壓縮錄音", value=True, help="轉成單聲道 16kHz 並壓成 MP3，長錄音上傳與處理都快很多",
+    )
+
+
+    st.divider()
+    with st.expander("📋 我的背景工作", expanded=True):
+        # 內容留到腳本最後才畫 (見檔案結尾)
+        jobs_box = st.container()
+
+    # 第一次取得限流器時套用 Secrets 內的 RPM/TPM 設定
+    rate_limiter = get_rate_limiter()
+    get_metrics()
+    if "教師" in role:
+        with st.expander("🚦 Gemini 流量狀態"):
+            rate_limiter_panel(rate_limiter)
+
 # --- 4. 定義核心 AI 與處理函式 ---
-def create_pdf(md_content):
-    from weasyprint import HTML
-    html = markdown.markdown(md_content, extensions=['tables'])
-    html_template = f"""
-    <html>
-      <head>
-        <meta charset="UTF-8">
-        <style>
-          body {{ font-family: "Noto Sans CJK TC", sans-serif; line-height: 1.6; padding: 2em; }}
-          table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
-          th, td {{ border: 1px solid #ccc; padding: 10px; text-align: left; }}
-          th {{ background-color: #f8f9fa; font-weight: bold; }}
-        </style>
-      </head>
-      <body>{html}</body>
-    </html>
-    """
-    return HTML(string=html_template).write_pdf()
-
-def analyze_audio_with_ai(model_name, file_path, prompt):
-    model = genai.GenerativeModel(model_name)
-    file = genai.upload_file(file_path)
-    
-    while file.state.name == "PROCESSING":
-        time.sleep(2)
-        file = genai.get_file(file.name)
-    if file.state.name == "FAILED":
-        raise Exception("檔案處理失敗")
-
-    max_retries = 5
-    for i in range(max_retries):
-        try:
-            response = model.generate_content([file, prompt])
-            return response.text
-        except Exception as e:
-            if "429" in str(e):
-                wait_time = 10 * (i + 1)
-                st.toast(f"⚠️ 伺服器忙碌中。冷卻 {wait_time} 秒後重試...", icon="⏳")
-                time.sleep(wait_time)
-                continue
-            elif "404" in str(e):
-                raise Exception(f"模型無法使用，請切換模型。")
-            else:
-                raise e
-    raise Exception("系統忙碌中，請過幾分鐘再試。")
-
-def generate_and_store_note(file_path_to_analyze, ai_prompt, download_filename):
-    genai.configure(api_key=api_key)
-    with st.spinner("🚀 啟動 AI 引擎，這可能需要一點時間..."):
-        try:
-            final_content = analyze_audio_with_ai(model_name, file_path_to_analyze, ai_prompt)
-            
-            st.session_state.generated_note = final_content
-            st.session_state.note_filename = download_filename
-            st.session_state.chat_history = []
-            st.session_state.current_shared_file = None 
-            
-            st.success("✅ 講義生成完成！請至下方預覽。")
-        except Exception as e:
-            st.error(f"❌ 發生錯誤: {e}")
+def run_note_job(report, model_name, file_path, audio_sha, view, languages, download_filename, segmented, workers, cache, priority,
+                 preprocess=False, release=None):
+    # 在背景工作池中執行：先把錄音聽寫成逐字稿 (每份錄音只做一次)，再從逐字稿平行產生各語言講義；
+    # 錄音暫存檔在逐字稿完成後就用不到了，不論成功失敗都會刪除，並歸還上傳額度
+    try:
+        notify = lambda msg: report(message=msg)
+        report(message="📝 AI 聽寫逐字稿中 (同一份錄音只需要一次)...")
+        transcript = transcribe_audio(
+            model_name, file_path, cache=cache, audio_sha=audio_sha, segmented=segmented, max_workers=workers, notify=notify,
+            on_progress=lambda done, total, index: report(f"✅ 第 {index + 1} 段逐字稿完成 ({done}/{total})", 0.7 * done / total),
+            priority=priority, preprocess=preprocess,
+        )
+    finally:
+        try: os.remove(file_path)
+        except OSError: pass
+        if release: release()
+    return run_translate_job(report, model_name, audio_sha, view, languages, download_filename, cache, priority, transcript=transcript)
+
+def run_translate_job(report, model_name, audio_sha, view, languages, download_filename, cache, priority, transcript=None):
+    # 從快取的逐字稿衍生講義，完全不碰錄音
+    if transcript is None:
+        transcript = cache.get_transcript(audio_sha, model_name)
+        if transcript is None:
+            raise Exception("這份錄音的逐字稿已經過期，請重新上傳錄音。")
+    report(f"✍️ 從逐字稿產生講義 ({'、'.join(languages)})...", 0.7)
+    notes = derive_notes(
+        model_name, transcript, {lang: prompts.note_prompt(view, lang) for lang in languages}, cache=cache,
+        notify=lambda msg: report(message=msg), priority=priority,
+        on_progress=lambda done, total, lang: report(f"✅ {lang} 版完成 ({done}/{total})", 0.7 + 0.3 * done / total),
+    )
+    return {"note": notes[languages[0]], "notes": notes, "filename": download_filename, "audio_sha": audio_sha, "view": view}
+
+def run_quiz_job(report, model_name, note_content, safe_title, catalog, n_variants=1):
+    report(message="🎲 正在叫 AI 自動出題 (10題)...")
+    quiz_json = generate_interactive_quiz(model_name, note_content, safe_title, notify=lambda msg: report(message=msg))
+    return publish_quiz(QUIZ_DIR, QUIZ_VARIANTS_DIR, safe_title, quiz_json, catalog, n_variants)
+
+def generate_and_store_note(file_path_to_analyze, view, download_filename, segmented=False, release=None):
+    # 暫存檔交給背景工作後由工作負責刪除；重複的工作或送出前出錯時，在這裡刪除並歸還額度
+    def discard():
+        try: os.remove(file_path_to_analyze)
+        except OSError: pass
+        if release: release()
 
-def analyze_from_buffer(audio_buffer, ai_prompt, download_filename):
+    try:
+        configure_gemini(api_key)
+        # 同一份錄音 + 同樣的語言只會有一個工作，重複點擊會拿到同一個工作編號
+        audio_sha = hash_file(file_path_to_analyze)
+        languages = [output_language] + extra_languages
+        dedupe_key = f"note:{audio_sha}:{model_name}:{view}:{'+'.join(languages)}:{segmented}"
+        job_id = get_job_manager().submit(
+            "note", st.session_state.username, download_filename, run_note_job,
+            model_name, file_path_to_analyze, audio_sha, view, languages, download_filename, segmented, segment_workers, get_ai_cache(),
+            PRIORITY_TEACHER if "教師" in role else PRIORITY_STUDENT, compress_audio, release,
+            dedupe_key=dedupe_key, on_duplicate=discard,
+        )
+    except BaseException:
+        discard()
+        raise
+    st.session_state.pending_note_job = job_id
+    st.info("🚀 已排入背景生成，完成後會自動載入。您可以在側邊欄「📋 我的背景工作」查看進度，切換頁面也不會中斷。")
+
+def spool_upload(audio_buffer):
+    """檢查大小與上傳額度後把錄音寫到暫存檔，回傳 (暫存檔路徑, 歸還額度的函式)；超過額度時顯示提示並回傳 None。"""
     file_ext = f".{audio_buffer.name.split('.')[-1]}" if hasattr(audio_buffer, "name") and audio_buffer.name else ".wav"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-        tmp.write(audio_buffer.getvalue())
-        tmp_path = tmp.name
-    generate_and_store_note(tmp_path, ai_prompt, download_filename)
-    try: os.remove(tmp_path)
-    except: pass
-
-def generate_interactive_quiz(note_content, title):
-    model = genai.GenerativeModel(model_name)
-    quiz_prompt = f"""
-    請根據以下講義內容中的「課內教學重點」，設計 10 題適合學生的「單選題」測驗。
-    這是一個類似 Kahoot 的互動遊戲，請確保題目有趣、難易適中，且涵蓋核心觀念。
-    注意：請「絕對不要」把「課外延伸與閒聊」的內容拿來出題！
-    
-    【講義內容】：
-    {note_content}
-    
-    【輸出格式要求】：
-    請嚴格只輸出 JSON 格式的陣列（Array），不要加上任何其他文字或 Markdown 標記（如 ```json）。
-    JSON 格式範例：
-    [
-      {{
-        "question": "題目內容",
-        "options": ["選項A", "選項B", "選項C", "選項D"],
-        "answer": "正確的選項內容 (必須與 options 裡的字完全一模一樣)",
-        "explanation": "解析說明"
-      }}
-    ]
-    """
-    response = model.generate_content(quiz_prompt)
-    text = response.text
-    match = re.search(r'\[\s*\{.*\}\s*\]', text, re.DOTALL)
-    if match:
-        text = match.group(0)
-    
-    return json.loads(text)
+    size = upload_size(audio_buffer)
+    if size > MAX_SESSION_UPLOAD_BYTES:
+        st.error(f"⚠️ 錄音檔太大 ({audio_tools.format_bytes(size)})，單次上限為 {audio_tools.format_bytes(MAX_SESSION_UPLOAD_BYTES)}。")
+        return None
+    if "upload_session_id" not in st.session_state:
+        st.session_state.upload_session_id = uuid.uuid4().hex
+    session_id = st.session_state.upload_session_id
+    budget = get_upload_budget()
+    if not budget.try_acquire(session_id, size):
+        st.warning("⏳ 目前處理中的錄音已達上限，請等前面的錄音處理完 (看側邊欄「📋 我的背景工作」) 再送出。")
+        return None
+    release = lambda: budget.release(session_id, size)
+    # 逐塊寫到暫存檔，不另外複製一份完整的錄音到記憶體
+    try:
+        return spool_to_disk(audio_buffer, file_ext), release
+    except BaseException:
+        release()
+        raise
+
+def analyze_from_buffer(audio_buffer, view, download_filename, segmented=False):
+    spooled = spool_upload(audio_buffer)
+    if spooled:
+        tmp_path, release = spooled
+        generate_and_store_note(tmp_path, view, download_filename, segmented=segmented, release=release)
+
+def preview_audio(audio):
+    if upload_size(audio) <= AUDIO_PREVIEW_MAX_BYTES:
+        st.audio(audio)
+    else:
+        st.caption(f"🎧 錄音檔較大 ({audio_tools.format_bytes(upload_size(audio))})，為節省伺服器記憶體不提供試聽。")
+
+def segmented_toggle(key):
+    # 需要 ffmpeg 才能在靜音處切段；沒有安裝時隱藏此選項
+    if not audio_tools.has_ffmpeg():
+        return False
+    return st.toggle("✂️ 長錄音分段平行處理 (適合 1 小時以上的錄音)", key=key)
+
+# --- 測驗與成績分析 ---
+SCORE_BIN_LABELS = [f"{i * 10}-{i * 10 + 9}" for i in range(10)] + ["100"]
+RECENT_RESULTS_LIMIT = 50
+
+def load_quiz(quiz_file):
+    quiz_path = os.path.join(QUIZ_DIR, quiz_file)
+    if not os.path.exists(quiz_path):
+        return None
+    with metrics.span("quiz.load_json"), open(quiz_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_quiz_variants(quiz_file, quiz_data):
+    # 沒有版本檔、或版本檔與目前測驗對不上 (例如舊測驗) 時，只有原順序一個版本
+    try:
+        with open(os.path.join(QUIZ_VARIANTS_DIR, quiz_file), "r", encoding="utf-8") as f:
+            variants = json.load(f)
+    except (OSError, ValueError):
+        variants = []
+    valid = [v for v in variants if sorted(q for q, _ in v) == list(range(len(quiz_data)))]
+    return valid or make_variants(quiz_data, 1)
+
+def answer_key_indices(quiz_data, user_answers):
+    # 把作答與正確答案換成選項編號，方便緊湊儲存與向量化分析
+    answer_indices = [q["options"].index(user_answers[i]) if user_answers[i] in q["options"] else None for i, q in enumerate(quiz_data)]
+    key_indices = [q["options"].index(q["answer"]) if q["answer"] in q["options"] else -1 for q in quiz_data]
+    return answer_indices, key_indices
+
+@st.cache_data(max_entries=32)
+def cached_item_analysis(quiz_file, answered_count):
+    # answered_count 作為快取鍵的一部分：有新的交卷才重新計算
+    quiz_data = load_quiz(quiz_file)
+    _, key_indices = answer_key_indices(quiz_data, {i: None for i in range(len(quiz_data))})
+    matrix, scores = get_quiz_store().get_answer_matrix(quiz_file, len(quiz_data))
+    return item_analysis(matrix, scores, key_indices)
+
+def answer_sheet_importer(selected_quiz):
+    # 紙本測驗或其他平台的作答：整份答案卷向量化批改，確認後一次寫入成績庫
+    with st.expander("📥 匯入答案卷批次批改 (紙本測驗 / 其他平台，CSV 或 Excel)"):
+        st.caption("第一列為標題：姓名/學號一欄、每題一欄 (Q1、Q2…)，可另有「交卷時間」欄；作答可寫選項字母、編號或選項全文。")
+        uploaded = st.file_uploader("上傳答案卷", type=["csv", "xlsx"], key=f"answer_sheet_{selected_quiz}")
+        if uploaded is None:
+            return
+        # 同一份檔案只批改一次，之後的重跑直接用暫存的結果
+        preview = st.session_state.get("answer_sheet_preview")
+        if not preview or preview["file_id"] != uploaded.file_id or preview["quiz"] != selected_quiz:
+            try:
+                graded = answer_sheets.grade_sheet(load_quiz(selected_quiz), uploaded.getvalue(), uploaded.name)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                return
+            preview = st.session_state.answer_sheet_preview = {"file_id": uploaded.file_id, "quiz": selected_quiz, "graded": graded, "saved": False}
+        graded = preview["graded"]
+        scores = graded["scores"]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("學生人數", len(scores))
+        col2.metric("平均分數", f"{scores.mean():.1f}")
+        col3.metric("認不得的作答", graded["unknown"])
+        if graded["skipped"]:
+            st.warning(f"⚠️ 有 {graded['skipped']} 列沒有姓名/學號，已略過。")
+        st.table([{"姓名/學號": n, "分數": int(s)} for n, s in zip(graded["names"][:5], scores[:5])])
+        if preview["saved"]:
+            st.success("✅ 這份答案卷已經寫入成績庫。")
+        elif st.button(f"✅ 寫入 {len(scores)} 筆成績", type="primary", use_container_width=True):
+            get_quiz_store().add_answer_matrix(
+                selected_quiz, graded["names"], scores, graded["timestamps"], graded["matrix"], graded["key_indices"],
+            )
+            preview["saved"] = True
+            st.toast(f"✅ 已匯入 {len(scores)} 筆成績！", icon="📤")
+            st.rerun()
+
+@st.fragment
+def student_quiz(selected_quiz):
+    # 交卷只重跑測驗區
+    quiz_data = load_quiz(selected_quiz)
+    # 每個 session 隨機分到一個洗牌版本，鄰座同學的題目與選項順序不同
+    variants = load_quiz_variants(selected_quiz, quiz_data)
+    variant_key = f"quiz_variant_{selected_quiz}"
+    if st.session_state.get(variant_key, len(variants)) >= len(variants):
+        st.session_state[variant_key] = random.randrange(len(variants))
+    shown_quiz = apply_variant(quiz_data, variants[st.session_state[variant_key]])
+
+    st.info(f"🎯 本次測驗共有 {len(quiz_data)} 題，開始作答！" + (f" (試卷 {chr(ord('A') + st.session_state[variant_key])} 卷)" if len(variants) > 1 else ""))
+    st.markdown("---")
+
+    with st.form("quiz_form"):
+        # 學生作答前必須先輸入姓名或學號
+        st.info("📝 作答前請先填寫基本資料：")
+        student_name = st.text_input("👤 請輸入您的姓名或學號 (必填)：", placeholder="例如：王小明 或 112001")
+        st.markdown("---")
+
+        user_answers = {}
+        for i, q in enumerate(shown_quiz):
+            st.markdown(f"**Q{i+1}: {q['question']}**")
+            user_answers[i] = st.radio("請選擇：", q['options'], key=f"q_{i}", index=None)
+            st.markdown("<br>", unsafe_allow_html=True)
+
+        submitted = st.form_submit_button("🚀 交卷看成績！", type="primary", use_container_width=True)
+
+        if submitted:
+            # 檢查是否有輸入姓名
+            if not student_name.strip():
+                st.error("⚠️ 繳交失敗：請先在最上方輸入您的「姓名或學號」才能交卷喔！")
+            else:
+                st.divider()
+                st.subheader("📊 測驗結果")
+                score = 0
+                total = len(quiz_data)
+
+                for i, q in enumerate(shown_quiz):
+                    ans = user_answers[i]
+                    if ans == q['answer']:
+                        score += 1
+                        st.success(f"**Q{i+1}: 答對了！✅** (您的答案: {ans})")
+                    else:
+                        st.error(f"**Q{i+1}: 答錯了 ❌** (您的答案: {ans}，正確答案: **{q['answer']}**)")
+                    st.caption(f"💡 解析：{q['explanation']}")
+                    st.markdown("---")
+
+                final_score = int((score / total) * 100)
+                st.header(f"🏆 您的總分：{final_score} / 100")
+
+                if final_score >= 80:
+                    st.balloons()
+                    st.success("太棒了！您已經完全掌握了這堂課的精華！🎉")
+                elif final_score >= 60:
+                    st.info("表現不錯！再複習一下會更好喔！💪")
+                else:
+                    st.warning("要加油囉！建議多聽幾次老師的錄音或再看一次講義！📚")
+
+                # --- 紀錄成績並儲存回資料庫 ---
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                # 換回原測驗的題號與選項編號，各版本的成績可以合併做試題分析
+                canonical_answers = {q["source"]: user_answers[i] for i, q in enumerate(shown_quiz)}
+                answer_indices, key_indices = answer_key_indices(quiz_data, canonical_answers)
+                get_quiz_store().add_result(
+                    selected_quiz, student_name.strip(), final_score, timestamp,
+                    answer_indices=answer_indices, key_indices=key_indices,
+                )
+                st.toast("✅ 成績已自動回傳給老師！", icon="📤")
+
+@st.fragment
+def note_downloads(display_note, note_view):
+    # 按「產生 PDF」只重跑下載按鈕這一區，不必重畫整份講義
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("📥 下載 (.md)", data=display_note, file_name=st.session_state.note_filename, mime="text/markdown", use_container_width=True)
+    with col2:
+        # 只有快取命中或使用者按下按鈕時才排版，避免每次 rerun 都跑一次 WeasyPrint
+        pdf_data = get_pdf_cache().get_cached(display_note, note_view)
+        if pdf_data is None and st.button("🖨️ 產生 PDF", use_container_width=True):
+            try:
+                with st.spinner("🖨️ PDF 排版中..."):
+                    pdf_data = get_pdf_cache().render(display_note, note_view)
+            except TimeoutError:
+                st.warning("⏳ PDF 仍在排版中，請稍候再按一次。")
+            except Exception as pdf_err:
+                st.error(f"⚠️ PDF 生成失敗：{pdf_err}")
+        if pdf_data is not None:
+            st.download_button("📥 下載 (.pdf)", data=pdf_data, file_name=st.session_state.note_filename.replace(".md", ".pdf"), mime="application/pdf", use_container_width=True)
+
+# --- 上課中即時筆記 (分段錄音，每段送出後立刻在背景聽寫並更新草稿) ---
+LIVE_NOTES_POLL_SECONDS = 3
+
+def live_note_recorder(view, download_filename):
+    hub = get_live_notes()
+    session = hub.get(st.session_state.live_note_session) if st.session_state.live_note_session else None
+    if session is None:
+        st.info("💡 上課時把錄音分成幾段：每錄完一段 (建議 3-5 分鐘) 按停止就會自動送出並開始整理，接著再按錄音繼續下一段。下課後幾秒內就能拿到完整講義。")
+        if not api_key: st.warning("請在側邊欄輸入 API Key")
+        elif st.button("▶️ 開始即時筆記", type="primary", use_container_width=True):
+            configure_gemini(api_key)
+            st.session_state.live_note_session = hub.start(
+                st.session_state.username, model_name, view, output_language,
+                priority=PRIORITY_TEACHER if view == "teacher" else PRIORITY_STUDENT,
+            ).id
+            st.rerun()
+        return
+
+    snapshot = session.snapshot()
+    if snapshot["status"] == live_notes.RECORDING:
+        # 每送出一段就換一個 key，錄音元件回到空白，可以直接錄下一段
+        segment = st.audio_input(f"🎙️ 錄製第 {snapshot['segments'] + 1} 段", key=f"live_segment_{session.id}_{snapshot['segments']}")
+        if segment:
+            spooled = spool_upload(segment)
+            if spooled:
+                tmp_path, release = spooled
+                session.add_segment(tmp_path, release=release)
+                st.rerun()
+    live_notes_panel(session.id, download_filename)
+
+@st.fragment(run_every=LIVE_NOTES_POLL_SECONDS)
+def live_notes_panel(session_id, download_filename):
+    session = get_live_notes().get(session_id)
+    if session is None:
+        st.session_state.live_note_session = None
+        st.rerun()
+    snapshot = session.snapshot()
+    st.caption(
+        f"⏺️ 已送出 {snapshot['segments']} 段 ({audio_tools.format_timestamp(snapshot['recorded_seconds'])})，"
+        f"已聽寫 {snapshot['transcribed']} 段，草稿涵蓋前 {snapshot['draft_through']} 段"
+    )
+    if snapshot["error"] and snapshot["status"] != live_notes.FAILED:
+        st.warning(f"⚠️ {snapshot['error']}")
+
+    if snapshot["status"] == live_notes.RECORDING:
+        with st.expander("📝 即時草稿 (每段聽寫完就更新)", expanded=True):
+            st.markdown(snapshot["draft"] or "等第一段錄音送出後就會出現草稿...")
+        if snapshot["segments"]:
+            st.button("⏹️ 下課，產生完整講義", type="primary", use_container_width=True, on_click=session.stop)
+    elif snapshot["status"] == live_notes.FINALIZING:
+        st.info("⏳ 正在聽寫最後一段並從完整逐字稿產生講義...")
+        st.markdown(snapshot["draft"])
+    elif snapshot["status"] == live_notes.DONE:
+        st.session_state.generated_note = snapshot["final_note"]
+        st.session_state.note_filename = download_filename
+        st.session_state.note_versions = {session.language: snapshot["final_note"]}
+        st.session_state.note_source = (live_notes.transcript_key(session.id), session.view)
+        st.session_state.chat_history = []
+        st.session_state.current_shared_file = None
+        st.session_state.live_note_session = None
+        get_live_notes().discard(session.id)
+        st.toast("✅ 完整講義已產生！請至下方預覽。", icon="🎉")
+        st.rerun()
+    else:
+        st.error(f"❌ 產生講義失敗：{snapshot['error']}")
+        if st.button("🔄 重新開始", use_container_width=True):
+            st.session_state.live_note_session = None
+            get_live_notes().discard(session.id)
+            st.rerun()
+
+# --- 期末課程包 (背景工作產生 ZIP，產生中由 fragment 定時更新進度) ---
+def run_course_pack_job(report, catalog, quiz_store, pdf_cache):
+    return course_pack.build_course_pack(SHARED_DIR, QUIZ_DIR, catalog, quiz_store, pdf_cache, COURSE_PACK_DIR, report=report)
+
+def read_course_pack(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def course_pack_panel():
+    # 課程包排隊或產生中才每 2 秒更新進度；其餘時候只畫一次，
+    # 不必每 2 秒都重算內容雜湊 (查目錄、讀成績版本)
+    job_id = st.session_state.get("course_pack_job")
+    job = get_job_manager().get(job_id) if job_id else None
+    if job and job["status"] in ("queued", "running"):
+        live_course_pack_progress()
+    else:
+        course_pack_result(job)
+
+@st.fragment(run_every=2)
+def live_course_pack_progress():
+    job = get_job_manager().get(st.session_state.course_pack_job)
+    if job is None or job["status"] not in ("queued", "running"):
+        st.rerun()  # 產生完了：整頁重跑一次，換回不輪詢的版本
+    st.progress(job["progress"], text=job["message"])
+
+def course_pack_result(job):
+    if job and job["status"] == FAILED:
+        st.error(f"❌ 課程包產生失敗：{job['error']}")
+
+    # 講義、測驗或成績有變動時鍵就會改變；完全沒變時直接提供上次產生的課程包
+    path = course_pack.pack_path(COURSE_PACK_DIR, course_pack.pack_key(get_catalog(), get_quiz_store()))
+    result = job["result"] if job and job["status"] == DONE else None
+    if result and (result["key"] not in path or not os.path.exists(result["path"])):
+        result = None  # 產生之後內容又變了 (或檔案已被清掉)，需要重新產生
+    if result:
+        st.success(
+            f"✅ 課程包已完成：{result['notes']} 份講義、{result['quizzes']} 份測驗，{audio_tools.format_bytes(result['size'])}"
+            + (f" (沿用 {result['pdf_reused']} 份已排版的 PDF)" if result["pdf_reused"] else "")
+        )
+        if result["pdf_failed"]:
+            st.warning(f"⚠️ 有 {result['pdf_failed']} 份 PDF 排版失敗 (可能沒有安裝 WeasyPrint)，課程包裡仍有這些講義的 Markdown 版本。")
+        path = result["path"]
+    if os.path.exists(path):
+        # 按下時才讀檔，不會每次重跑都把 ZIP 載入記憶體
+        st.download_button(
+            "📥 下載課程包 (.zip)", data=functools.partial(read_course_pack, path),
+            file_name=f"課程包_{datetime.now():%Y%m%d}.zip", mime="application/zip", on_click="ignore",
+            type="primary", use_container_width=True,
+        )
+    if not os.path.exists(path) or path.endswith(".partial.zip"):
+        st.button("📦 產生課程包", type="primary", use_container_width=True, on_click=submit_course_pack)
+
+def submit_course_pack():
+    st.session_state.course_pack_job = get_job_manager().submit(
+        "pack", st.session_state.username, "期末課程包", run_course_pack_job, get_catalog(), get_quiz_store(), get_pdf_cache(),
+    )
+
+# --- 講義語言版本 (都從同一份逐字稿衍生) ---
+def switch_note_language():
+    st.session_state.generated_note = st.session_state.note_versions[st.session_state.note_language]
+
+def submit_translation(language):
+    audio_sha, view = st.session_state.note_source
+    configure_gemini(api_key)
+    st.session_state.pending_note_job = get_job_manager().submit(
+        "translate", st.session_state.username, f"{st.session_state.note_filename} ({language})", run_translate_job,
+        model_name, audio_sha, view, [language], st.session_state.note_filename, get_ai_cache(),
+        PRIORITY_TEACHER if view == "teacher" else PRIORITY_STUDENT,
+        dedupe_key=f"translate:{audio_sha}:{model_name}:{view}:{language}",
+    )
+    st.toast(f"🌍 正在從逐字稿產生「{language}」版本，完成後會自動載入。")
+
+def note_language_bar():
+    versions = st.session_state.note_versions
+    if len(versions) > 1:
+        current = next((lang for lang, note in versions.items() if note == st.session_state.generated_note), None)
+        if st.session_state.get("note_language") not in versions or current != st.session_state.note_language:
+            st.session_state.note_language = current or next(iter(versions))
+        st.radio("🌍 語言版本", list(versions), key="note_language", horizontal=True, on_change=switch_note_language)
+    if st.session_state.note_source is None:
+        return
+    col1, col2 = st.columns(2)
+    if output_language not in versions and api_key:
+        col1.button(
+            f"🌍 產生「{output_language}」版本", use_container_width=True, on_click=submit_translation, args=(output_language,),
+            help="從這份錄音已經存好的逐字稿產生，不必重新上傳或分析錄音",
+        )
+    transcript = get_ai_cache().get_transcript(st.session_state.note_source[0], model_name)
+    if transcript:
+        col2.download_button(
+            "📜 下載逐字稿 (.txt)", data=transcript, file_name=st.session_state.note_filename.replace(".md", "_transcript.txt"),
+            mime="text/plain", use_container_width=True,
+        )
+
+# --- 即時測驗 (Kahoot 模式；fragment 定時讀取房間快照，只重跑測驗區) ---
+LIVE_HOST_POLL_SECONDS = 1
+LIVE_PLAYER_POLL_SECONDS = 2 # 全班幾百人同時輪詢，學生端每 2 秒更新一次即可
+
+def live_leaderboard(snapshot):
+    if snapshot["leaderboard"]:
+        st.table([{"名次": i + 1, "姓名": name, "分數": score} for i, (name, score) in enumerate(snapshot["leaderboard"])])
 
-lang_instruction = f"【重要指令】不論錄音檔原本是什麼語言，請務必將所有輸出的內容翻譯並撰寫為：「{output_language}」。" if "自動偵測" not in output_language else "【重要指令】請使用與錄音檔相同的語言來輸出內容。"
+def live_countdown(snapshot):
+    remaining = max(0.0, snapshot["deadline"] - time.time())
+    st.progress(remaining / snapshot["time_limit"], text=f"⏳ 剩 {remaining:.0f} 秒 · 已作答 {snapshot['answered']}/{snapshot['players']} 人")
+
+def live_host_action(code, action):
+    hub = get_live_hub()
+    try:
+        if action == "next":
+            hub.next_question(code)
+        elif action == "reveal":
+            hub.reveal(code)
+        elif action == "finish":
+            saved = hub.finish(code)
+            st.toast(f"✅ 已把 {saved} 位學生的成績寫入「📊 學生測驗成績」", icon="💾")
+        elif action == "close":
+            hub.close_room(code)
+            st.session_state.live_host_room = None
+    except LiveQuizError as e:
+        st.toast(f"⚠️ {e}")
+
+@st.fragment(run_every=LIVE_HOST_POLL_SECONDS)
+def live_host_panel(code):
+    try:
+        snapshot = get_live_hub().snapshot(code)
+    except LiveQuizError:
+        st.session_state.live_host_room = None
+        st.rerun()
+    st.markdown(f"### 🔢 房間代碼：`{code}`")
+    st.caption(f"學生在「🎯 即時測驗」分頁輸入代碼加入 · 目前 {snapshot['players']} 人 · {snapshot['quiz_file'][:-5]}")
+
+    if snapshot["phase"] == LOBBY:
+        st.info("🙋 等待學生加入中，人到齊後就可以開始！")
+        st.button("▶️ 開始第一題", type="primary", use_container_width=True, on_click=live_host_action, args=(code, "next"))
+        return
+
+    st.subheader(f"Q{snapshot['index'] + 1}/{snapshot['total']}：{snapshot['question']}")
+    if snapshot["phase"] == QUESTION:
+        for j, option in enumerate(snapshot["options"]):
+            st.markdown(f"**{chr(ord('A') + j)}.** {option}")
+        live_countdown(snapshot)
+        st.button("⏹️ 提前揭曉答案", use_container_width=True, on_click=live_host_action, args=(code, "reveal"))
+    elif snapshot["phase"] == REVEAL:
+        st.success(f"✅ 正確答案：{snapshot['answer']}")
+        st.bar_chart({"人數": {f"{chr(ord('A') + j)}. {option[:12]}": n for j, (option, n) in enumerate(zip(snapshot["options"], snapshot["distribution"]))}})
+        live_leaderboard(snapshot)
+        if snapshot["index"] + 1 < snapshot["total"]:
+            st.button("➡️ 下一題", type="primary", use_container_width=True, on_click=live_host_action, args=(code, "next"))
+        else:
+            st.button("🏁 結束並寫入成績", type="primary", use_container_width=True, on_click=live_host_action, args=(code, "finish"))
+    else:
+        st.markdown("### 🏆 最終排行榜")
+        live_leaderboard(snapshot)
+        if not snapshot["saved"]:
+            st.button("💾 寫入成績", type="primary", use_container_width=True, on_click=live_host_action, args=(code, "finish"))
+        st.button("🚪 關閉房間", use_container_width=True, on_click=live_host_action, args=(code, "close"))
+
+def live_answer(code, name, option_index):
+    if not get_live_hub().answer(code, name, option_index):
+        st.toast("⏰ 這題已經結束，沒有計分。")
+
+@st.fragment(run_every=LIVE_PLAYER_POLL_SECONDS)
+def live_player_panel(code, name):
+    hub = get_live_hub()
+    try:
+        snapshot = hub.snapshot(code)
+        status = hub.player_status(code, name)
+    except LiveQuizError:
+        st.session_state.live_player = None
+        st.rerun()
+    if status is None:
+        # 房間還在，但名單裡找不到這位學生 (例如老師關掉後用同一個代號重開)：回到加入畫面
+        st.session_state.live_player = None
+        st.rerun()
+    st.caption(f"🔢 房間 {code} · 👤 {name} · 目前 {snapshot['players']} 人")
+
+    if snapshot["phase"] == LOBBY:
+        st.info("✅ 已加入！等待老師開始第一題...")
+        return
+    if snapshot["phase"] == FINISHED:
+        st.markdown(f"### 🏁 測驗結束！您的總分 {status['score']} 分，第 {status['rank']} 名")
+        live_leaderboard(snapshot)
+        if st.button("🚪 離開房間", use_container_width=True):
+            st.session_state.live_player = None
+            st.rerun()
+        return
+
+    st.subheader(f"Q{snapshot['index'] + 1}/{snapshot['total']}：{snapshot['question']}")
+    choice = status["choice"]
+    if snapshot["phase"] == QUESTION:
+        live_countdown(snapshot)
+        if choice is None:
+            cols = st.columns(2)
+            for j, option in enumerate(snapshot["options"]):
+                cols[j % 2].button(
+                    f"{chr(ord('A') + j)}. {option}", key=f"live_option_{snapshot['index']}_{j}", use_container_width=True,
+                    on_click=live_answer, args=(code, name, j),
+                )
+        else:
+            st.info(f"📨 已作答：{snapshot['options'][choice]}，等待老師揭曉...")
+    else:
+        if choice is not None and snapshot["options"][choice] == snapshot["answer"]:
+            st.success(f"🎉 答對了！+{status['last_points']} 分")
+        else:
+            st.error(f"❌ {'沒有作答' if choice is None else '答錯了'}，正確答案：{snapshot['answer']}")
+        if snapshot["explanation"]:
+            st.caption(f"💡 解析：{snapshot['explanation']}")
+        col1, col2 = st.columns(2)
+        col1.metric("目前總分", status["score"])
+        col2.metric("目前名次", f"{status['rank']} / {snapshot['players']}")
+        live_leaderboard(snapshot)
+
+# --- AI 助教 (fragment：問答只重跑對話區，不必重畫整份講義) ---
+@st.fragment
+def tutor_chat(display_note):
+    for msg in st.session_state.chat_history:
+        avatar = "🤖" if msg["role"] == "assistant" else "👨‍🎓"
+        with st.chat_message(msg["role"], avatar=avatar):
+            st.markdown(msg["content"])
+            if msg.get("cached"):
+                st.caption("⚡ 同學問過相近的問題，直接提供 AI 助教先前的解答")
+            elif "ttft" in msg:
+                st.caption(f"⚡ 首字 {msg['ttft']:.1f} 秒 · 完成 {msg['latency']:.1f} 秒")
+
+    if user_q := st.chat_input("請輸入您的問題，例如：請用更簡單的例子解釋第二點..."):
+        st.session_state.chat_history.append({"role": "user", "content": user_q})
+        with st.chat_message("user", avatar="👨‍🎓"):
+            st.markdown(user_q)
+
+        with st.chat_message("assistant", avatar="🤖"):
+            message_placeholder = st.empty()
+            # 只有對話的第一個問題共用答案：追問的答案取決於先前的對話，不能給別人用
+            shared_note = st.session_state.current_shared_file
+            cache_key = note_key(display_note, model_name) if shared_note and len(st.session_state.chat_history) == 1 else None
+            cached = get_tutor_cache().lookup(cache_key, user_q, title=shared_note) if cache_key else None
+            if cached is not None:
+                message_placeholder.markdown(cached)
+                st.caption("⚡ 同學問過相近的問題，直接提供 AI 助教先前的解答")
+                st.session_state.chat_history.append({"role": "assistant", "content": cached, "cached": True})
+                return
+            message_placeholder.markdown("🧠 思考中...")
+
+            try:
+                # 只送出與問題相關的講義段落與精簡過的對話，提示詞長度不再隨對話無限增長
+                chat_context = build_chat_context(
+                    get_note_index(display_note), st.session_state.chat_history[:-1], user_q,
+                    token_budget=CHAT_TOKEN_BUDGET,
+                )
+
+                chat_prompt = prompts.chat_prompt(chat_context, user_q)
+                configure_gemini(api_key)
+                chat_model = get_model(model_name)
+                # 逐段串流顯示；使用者中途送出新問題時 Streamlit 會中斷這次執行，finally 立刻關閉串流
+                start_time = time.perf_counter()
+                ttft = None
+                answer = ""
+                stream = stream_with_retry(chat_model, chat_prompt, priority=PRIORITY_CHAT)
+                try:
+                    for piece in stream:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start_time
+                        answer += piece
+                        message_placeholder.markdown(answer + "▌")
+                finally:
+                    stream.close()
+                latency = time.perf_counter() - start_time
+
+                message_placeholder.markdown(answer)
+                st.caption(f"⚡ 首字 {ttft or latency:.1f} 秒 · 完成 {latency:.1f} 秒")
+                st.session_state.chat_history.append(
+                    {"role": "assistant", "content": answer, "ttft": ttft or latency, "latency": latency}
+                )
+                if cache_key:
+                    get_tutor_cache().store(cache_key, user_q, answer, title=shared_note)
+            except Exception as e:
+                message_placeholder.error(f"抱歉，AI 助教遇到了一點問題：{e}")
+
+def tutor_faq_panel(note_file):
+    # 老師端：學生在 AI 助教問了這份講義哪些問題 (本伺服器行程啟動以來)
+    stats = get_tutor_cache().stats(note_file)
+    with st.expander(f"🤖 AI 助教常見問題 (共 {stats['asks']} 次提問)"):
+        if not stats["asks"]:
+            st.info("目前還沒有學生向 AI 助教詢問這份講義。")
+            return
+        col1, col2 = st.columns(2)
+        col1.metric("提問次數", stats["asks"])
+        col2.metric("共用答案命中率", f"{stats['hit_rate']:.0%}")
+        st.table([{"問題": q, "被問次數": n} for q, n in stats["top"]])
+        st.caption("相近的問題會合併計算；被問很多次的問題，可以考慮在課堂上或講義裡補充說明。")
+
+# --- 留言板 (fragment：定時輪詢新留言，只重跑留言板本身) ---
+COMMENT_POLL_SECONDS = 5
+
+def render_comments(course_comments):
+    for c in course_comments:
+        avatar = "👨‍🎓" if c['role'] == "student" else "👨‍🏫"
+        with st.chat_message(c['role'], avatar=avatar):
+            st.write(c['content'])
+
+def post_comment(lecture, role, input_key):
+    # 按鈕回呼在這次重跑之前執行：下方留言列表直接包含新留言，不必再 st.rerun，也順便清空輸入框
+    content = st.session_state.get(input_key, "").strip()
+    if content:
+        get_comment_store().append(lecture, role, content)
+        st.session_state[input_key] = ""
+
+def notify_new_comments(lecture, from_role):
+    # 以 cursor 記錄本 session 已看過幾則，只對「新進」且來自對方的留言跳通知
+    cursor_key = f"comment_cursor_{lecture}"
+    new_comments, cursor = get_comment_store().read_since(lecture, st.session_state.get(cursor_key, 0))
+    if cursor_key in st.session_state and any(c['role'] == from_role for c in new_comments):
+        st.toast(f"💬 「{lecture}」有新的留言！", icon="🔔")
+    st.session_state[cursor_key] = cursor
+
+@st.fragment(run_every=COMMENT_POLL_SECONDS)
+def teacher_comment_board(lecture):
+    store = get_comment_store()
+    notify_new_comments(lecture, "student")
+    course_comments = store.get_messages(lecture)
+    if course_comments:
+        render_comments(course_comments)
+        
+        st.markdown("<br>", unsafe_allow_html=True)
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.text_input("回覆學生...", key="teacher_reply", label_visibility="collapsed")
+        with col2:
+            st.button("送出回覆", type="primary", use_container_width=True, on_click=post_comment, args=(lecture, "teacher", "teacher_reply"))
+    else:
+        st.info("這份講義目前還沒有學生提問喔！")
+
+@st.fragment(run_every=COMMENT_POLL_SECONDS)
+def student_comment_board(lecture):
+    store = get_comment_store()
+    notify_new_comments(lecture, "teacher")
+    course_comments = store.get_messages(lecture)
+    if course_comments:
+        render_comments(course_comments)
+    else:
+        st.info("還沒有留言，有不懂的地方可以直接發問，老師會親自回覆！")
+    
+    st.markdown("<br>", unsafe_allow_html=True)
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.text_input("留言給老師...", key="student_comment_input", label_visibility="collapsed")
+    with col2:
+        st.button("送出給老師", type="primary", use_container_width=True, on_click=post_comment, args=(lecture, "student", "student_comment_input"))
 
 # ==========================================
 # 👨‍🏫 教師專屬介面
@@ -254,100 +1051,86 @@ if "教師" in role:
     st.title("👨‍🏫 教師備課與教材發布中心")
     st.caption("管理您的授課錄音、發布講義、生成隨堂測驗，並回覆學生的提問")
     
-    ai_prompt = f"""
-    你是一位專業教學助理。請仔細聆聽這段授課錄音，產出課後教材。
-    【自動區分機制】：請嚴格分辨錄音中的「課內教學重點」與「課外閒聊/延伸補充」，並將其分開整理。
-    {lang_instruction}
-    
-    請嚴格遵守以下結構，並務必在第3點和第4點之間插入「---TEACHER_ONLY---」作為系統分隔線：
-    1. 📚 課程內容大綱 (僅限課內核心教學內容)
-    2. 🌍 課外話題與閒聊紀錄 (請摘要老師分享的課外故事、時事補充、笑話或與主課程無關的閒聊，若無則寫「無特別課外延伸」)
-    3. 🎯 核心教學目標
-    ---TEACHER_ONLY---
-    4. 📝 課後隨堂測驗 (3題單選含解析，請僅針對課內重點出題)
-    5. 💡 學生易錯點提醒
-    
-    請直接輸出 Markdown 內容。
-    """
-    
     # 新增了「📊 學生測驗成績」分頁
-    teacher_mode = st.radio("功能導覽", ["📂 上傳錄音產製教材", "🎙️ 網頁錄音產製教材", "💬 學生提問留言板", "📊 學生測驗成績"], horizontal=True, label_visibility="collapsed")
+    teacher_mode = st.radio("功能導覽", ["📂 上傳錄音產製教材", "🎙️ 網頁錄音產製教材", "💬 學生提問留言板", "📊 學生測驗成績", "🎯 即時測驗", "📦 課程包匯出", "📈 系統效能"], horizontal=True, label_visibility="collapsed")
     audio_data = None 
 
     if teacher_mode == "📂 上傳錄音產製教材":
         uploaded = st.file_uploader("請上傳您的授課錄音以生成講義", type=['mp3', 'wav', 'm4a', 'aac'])
-        if uploaded: audio_data = uploaded; st.audio(audio_data)
+        if uploaded: audio_data = uploaded; preview_audio(audio_data)
 
     elif teacher_mode == "🎙️ 網頁錄音產製教材":
-        st.info("💡 允許麥克風後即可開始錄音。")
-        recorded = st.audio_input("開始錄製授課內容")
-        if recorded: audio_data = recorded
+        if st.toggle("⚡ 上課中即時筆記 (邊錄邊整理)", key="teacher_live_notes"):
+            live_note_recorder("teacher", "Teacher_Materials.md")
+        else:
+            st.info("💡 允許麥克風後即可開始錄音。")
+            recorded = st.audio_input("開始錄製授課內容")
+            if recorded: audio_data = recorded
 
     if audio_data:
         st.divider()
         st.subheader("🤖 生成課後講義")
+        segmented = segmented_toggle("teacher_segmented")
         if not api_key: st.warning("請在側邊欄輸入 API Key")
         elif st.button("🚀 開始生成教材", type="primary", use_container_width=True):
-            analyze_from_buffer(audio_data, ai_prompt, "Teacher_Materials.md")
+            analyze_from_buffer(audio_data, "teacher", "Teacher_Materials.md", segmented=segmented)
 
     elif teacher_mode == "💬 學生提問留言板":
         st.subheader("💬 管理學生提問與留言")
-        shared_md_files = [f for f in os.listdir(SHARED_DIR) if f.endswith('.md')]
-        
-        if shared_md_files:
-            selected_file = st.selectbox("選擇要查看的講義", ["-- 請選擇 --"] + shared_md_files, key="teacher_select")
+        if get_catalog().count("notes"):
+            selected_file = catalog_selectbox("選擇要查看的講義", "notes", key="teacher_select")
             if selected_file != "-- 請選擇 --":
                 with st.expander("📖 展開預覽此份講義內容"):
                     with open(os.path.join(SHARED_DIR, selected_file), "r", encoding="utf-8") as f:
                         preview_content = f.read().replace("---TEACHER_ONLY---", "\n\n---\n**🔒 以下為教師專屬內容 (學生端不可見)：**\n\n")
                         st.markdown(preview_content)
                         
-                all_comments = load_comments()
-                course_comments = all_comments.get(selected_file, [])
-                
+                tutor_faq_panel(selected_file)
                 st.divider()
-                if course_comments:
-                    for c in course_comments:
-                        avatar = "👨‍🎓" if c['role'] == "student" else "👨‍🏫"
-                        with st.chat_message(c['role'], avatar=avatar):
-                            st.write(c['content'])
-                    
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    col1, col2 = st.columns([4, 1])
-                    with col1:
-                        reply_text = st.text_input("回覆學生...", key="teacher_reply", label_visibility="collapsed")
-                    with col2:
-                        if st.button("送出回覆", type="primary", use_container_width=True):
-                            if reply_text:
-                                course_comments.append({"role": "teacher", "content": reply_text})
-                                all_comments[selected_file] = course_comments
-                                save_comments(all_comments)
-                                st.rerun()
-                else:
-                    st.info("這份講義目前還沒有學生提問喔！")
+                teacher_comment_board(selected_file)
         else:
             st.warning("目前還沒有發布任何講義。請先在左側分頁生成並發布。")
 
     # --- 教師端：查看學生測驗成績 ---
     elif teacher_mode == "📊 學生測驗成績":
         st.subheader("📊 班級測驗成績總覽")
-        # 排除成績記錄檔本身
-        quiz_files = [f for f in os.listdir(QUIZ_DIR) if f.endswith('.json') and f != "quiz_results.json"]
-        
-        if quiz_files:
-            selected_quiz = st.selectbox("選擇要查看成績的測驗", ["-- 請選擇 --"] + quiz_files, key="teacher_quiz_select")
+        if get_catalog().count("quizzes"):
+            selected_quiz = catalog_selectbox("選擇要查看成績的測驗", "quizzes", key="teacher_quiz_select")
             if selected_quiz != "-- 請選擇 --":
-                all_results = load_quiz_results()
-                quiz_results = all_results.get(selected_quiz, [])
+                answer_sheet_importer(selected_quiz)
+                store = get_quiz_store()
+                stats = store.get_stats(selected_quiz)
                 
                 st.divider()
-                if quiz_results:
-                    st.success(f"🎉 目前共有 {len(quiz_results)} 位學生完成測驗！")
+                if stats and stats["count"]:
+                    st.success(f"🎉 目前共有 {stats['count']} 位學生完成測驗！")
                     
-                    # 計算並顯示平均分數
-                    total_score = sum(r['score'] for r in quiz_results)
-                    avg_score = total_score / len(quiz_results)
-                    st.info(f"📈 班級平均分數：{avg_score:.1f} 分")
+                    # 直接讀取交卷時累計好的統計，不必重新掃描全部成績
+                    st.info(f"📈 班級平均分數：{stats['mean']:.1f} 分")
+                    st.markdown("**📊 分數分布**")
+                    st.bar_chart({"人數": dict(zip(SCORE_BIN_LABELS, stats["histogram"]))})
+                    
+                    quiz_data = load_quiz(selected_quiz)
+                    if stats["answered"] and quiz_data and stats["n_questions"] == len(quiz_data):
+                        st.markdown(f"**🔍 逐題分析** (共 {stats['answered']} 份逐題作答紀錄)")
+                        analysis = cached_item_analysis(selected_quiz, stats["answered"])
+                        item_rows = []
+                        for i, q in enumerate(quiz_data):
+                            counts = stats["options"][i] + [0] * (len(q["options"]) - len(stats["options"][i]))
+                            item_rows.append({
+                                "題號": f"Q{i+1}",
+                                "答對率": f"{stats['correct_rate'][i] * 100:.0f}%",
+                                "鑑別度": f"{analysis['discrimination'][i]:.2f}",
+                                "各選項人數": " / ".join(
+                                    f"{'✅' if opt == q['answer'] else ''}{opt[:12]}：{counts[j]}" for j, opt in enumerate(q["options"])
+                                ),
+                            })
+                        st.table(item_rows)
+                        st.caption("答對率過低 (< 30%) 或鑑別度偏低 (< 0.2) 的題目，建議在課堂上再講解一次。")
+                    
+                    # 只顯示最新的幾筆，人數再多也不會拖慢頁面
+                    quiz_results = store.get_results(selected_quiz, limit=RECENT_RESULTS_LIMIT)
+                    st.markdown(f"**🕒 最新 {len(quiz_results)} 筆交卷紀錄**")
                     
                     # 整理資料並透過 st.table 美觀顯示
                     formatted_results = [
@@ -361,6 +1144,37 @@ if "教師" in role:
         else:
             st.warning("目前還沒有發布任何互動測驗。")
 
+    # --- 教師端：即時課堂測驗 ---
+    elif teacher_mode == "🎯 即時測驗":
+        st.subheader("🎯 即時課堂測驗 (Kahoot 模式)")
+        if st.session_state.get("live_host_room"):
+            live_host_panel(st.session_state.live_host_room)
+        elif get_catalog().count("quizzes"):
+            st.info("💡 開放房間後，學生輸入房間代碼加入；由您逐題推進，學生在倒數時間內作答，每題揭曉後排行榜即時更新。")
+            selected_quiz = catalog_selectbox("選擇要進行的測驗", "quizzes", key="live_quiz_select")
+            seconds = st.slider("⏱️ 每題作答秒數", min_value=10, max_value=60, value=QUESTION_SECONDS, step=5, key="live_seconds")
+            if selected_quiz != "-- 請選擇 --" and st.button("🚪 開放房間", type="primary", use_container_width=True):
+                st.session_state.live_host_room = get_live_hub().create_room(
+                    selected_quiz, load_quiz(selected_quiz), st.session_state.username, time_limit=seconds,
+                )
+                st.rerun()
+        else:
+            st.warning("目前還沒有發布任何互動測驗。")
+
+    # --- 教師端：期末課程包 ---
+    elif teacher_mode == "📦 課程包匯出":
+        st.subheader("📦 期末課程包")
+        st.info("💡 一次打包所有已發布的講義 (合輯 PDF + 每份講義的 PDF 與 Markdown)、互動測驗與成績試算表 (CSV)。在背景產生，切換頁面也不會中斷；內容沒有變的 PDF 直接沿用，完全沒變時直接沿用上次的課程包。")
+        col1, col2 = st.columns(2)
+        col1.metric("已發布講義", get_catalog().count("notes"))
+        col2.metric("互動測驗", get_catalog().count("quizzes"))
+        course_pack_panel()
+
+    # --- 教師端 (管理者)：各階段耗時 ---
+    elif teacher_mode == "📈 系統效能":
+        st.subheader("📈 系統效能 (本伺服器行程啟動以來)")
+        metrics_panel()
+
 # ==========================================
 # 👩‍🎓 學生專屬介面
 # ==========================================
@@ -368,159 +1182,90 @@ else:
     st.title("👩‍🎓 學生課堂速記助手")
     st.caption("閱讀講義、向老師提問，或是參加隨堂 Kahoot 挑戰！")
     
-    ai_prompt = f"""
-    你是一位學霸助教。請仔細聆聽這段課堂錄音，幫學生整理出一份結構清晰的 Markdown 複習筆記。
-    【自動區分機制】：請幫學生過濾雜訊，明確區分出「考試必考的課內重點」與「老師分享的課外話題」。
-    {lang_instruction}
-    
-    結構請嚴格包含以下 5 點：
-    1. 📖 課程核心摘要 (摘要本次課堂重點)
-    2. 🔑 關鍵名詞解釋 (請用表格呈現：名詞 | 解釋)
-    3. 💡 重點觀念詳解 (針對課內核心知識進行條列式說明)
-    4. 🌍 課外補充與趣事 (請摘要老師在錄音中提到的課外故事、生活經驗分享、時事或非考試範圍的閒聊，若無則寫「無特別課外延伸」)
-    5. 🎯 考試重點預測
+    student_mode = st.radio("功能導覽", ["📖 老師分享的講義", "🎮 互動測驗", "🎯 即時測驗", "📂 上傳自己的錄音", "🎙️ 網頁錄音", "💬 師生留言板"], horizontal=True, label_visibility="collapsed")
     
-    請直接輸出 Markdown 內容。
-    """
-    
-    student_mode = st.radio("功能導覽", ["📖 老師分享的講義", "🎮 互動測驗", "📂 上傳自己的錄音", "🎙️ 網頁錄音", "💬 師生留言板"], horizontal=True, label_visibility="collapsed")
-    
-    shared_md_files = [f for f in os.listdir(SHARED_DIR) if f.endswith('.md')]
     audio_data = None 
 
     if student_mode == "📖 老師分享的講義":
         st.info("👇 選擇老師發布的講義直接閱讀，或呼叫 AI 助教為您解答。")
-        if shared_md_files:
-            selected_file = st.selectbox("請選擇要複習的講義", ["-- 請選擇 --"] + shared_md_files, key="student_select")
+        if get_catalog().count("notes"):
+            search_query = st.text_input("🔍 搜尋所有講義", placeholder="輸入關鍵字，例如：需求彈性", key="student_note_search")
+            if search_query.strip():
+                search_index = get_search_index()
+                # 補上在程式外新增/修改的講義 (只比對雜湊，沒變動就不會重建)
+                search_index.sync(get_catalog().query("notes"), read_shared_note)
+                hits = search_index.search(search_query, limit=SEARCH_RESULTS_LIMIT)
+                if hits:
+                    for hit in hits:
+                        col1, col2 = st.columns([4, 1])
+                        with col1:
+                            st.markdown(f"**📄 {hit['file'][:-3]}**  \n{hit['snippet']}")
+                        with col2:
+                            if st.button("📖 載入", key=f"search_load_{hit['file']}", use_container_width=True):
+                                load_shared_note(hit["file"])
+                else:
+                    st.caption("找不到相關的講義，換個關鍵字試試看。")
+                st.divider()
+            
+            selected_file = catalog_selectbox("請選擇要複習的講義", "notes", key="student_select")
             if selected_file != "-- 請選擇 --":
                 if st.button("📖 載入講義內容", type="primary", use_container_width=True):
-                    file_path = os.path.join(SHARED_DIR, selected_file)
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        st.session_state.generated_note = f.read()
-                    st.session_state.note_filename = selected_file
-                    st.session_state.current_shared_file = selected_file
-                    st.session_state.chat_history = []
-                    st.rerun()
+                    load_shared_note(selected_file)
         else:
             st.warning("😴 目前老師還沒有發布任何講義喔！")
 
     elif student_mode == "🎮 互動測驗":
         st.subheader("🎮 隨堂互動測驗")
-        quiz_files = [f for f in os.listdir(QUIZ_DIR) if f.endswith('.json') and f != "quiz_results.json"]
-        if quiz_files:
-            selected_quiz = st.selectbox("選擇要挑戰的測驗", ["-- 請選擇 --"] + quiz_files)
+        if get_catalog().count("quizzes"):
+            selected_quiz = catalog_selectbox("選擇要挑戰的測驗", "quizzes", key="student_quiz_select")
             if selected_quiz != "-- 請選擇 --":
-                quiz_path = os.path.join(QUIZ_DIR, selected_quiz)
-                with open(quiz_path, "r", encoding="utf-8") as f:
-                    quiz_data = json.load(f)
-                
-                st.info(f"🎯 本次測驗共有 {len(quiz_data)} 題，開始作答！")
-                st.markdown("---")
-                
-                with st.form("quiz_form"):
-                    # 學生作答前必須先輸入姓名或學號
-                    st.info("📝 作答前請先填寫基本資料：")
-                    student_name = st.text_input("👤 請輸入您的姓名或學號 (必填)：", placeholder="例如：王小明 或 112001")
-                    st.markdown("---")
-                    
-                    user_answers = {}
-                    for i, q in enumerate(quiz_data):
-                        st.markdown(f"**Q{i+1}: {q['question']}**")
-                        user_answers[i] = st.radio("請選擇：", q['options'], key=f"q_{i}", index=None)
-                        st.markdown("<br>", unsafe_allow_html=True)
-                    
-                    submitted = st.form_submit_button("🚀 交卷看成績！", type="primary", use_container_width=True)
-                    
-                    if submitted:
-                        # 檢查是否有輸入姓名
-                        if not student_name.strip():
-                            st.error("⚠️ 繳交失敗：請先在最上方輸入您的「姓名或學號」才能交卷喔！")
-                        else:
-                            st.divider()
-                            st.subheader("📊 測驗結果")
-                            score = 0
-                            total = len(quiz_data)
-                            
-                            for i, q in enumerate(quiz_data):
-                                ans = user_answers[i]
-                                if ans == q['answer']:
-                                    score += 1
-                                    st.success(f"**Q{i+1}: 答對了！✅** (您的答案: {ans})")
-                                else:
-                                    st.error(f"**Q{i+1}: 答錯了 ❌** (您的答案: {ans}，正確答案: **{q['answer']}**)")
-                                st.caption(f"💡 解析：{q['explanation']}")
-                                st.markdown("---")
-                            
-                            final_score = int((score / total) * 100)
-                            st.header(f"🏆 您的總分：{final_score} / 100")
-                            
-                            if final_score >= 80:
-                                st.balloons()
-                                st.success("太棒了！您已經完全掌握了這堂課的精華！🎉")
-                            elif final_score >= 60:
-                                st.info("表現不錯！再複習一下會更好喔！💪")
-                            else:
-                                st.warning("要加油囉！建議多聽幾次老師的錄音或再看一次講義！📚")
-                            
-                            # --- 紀錄成績並儲存回資料庫 ---
-                            all_results = load_quiz_results()
-                            if selected_quiz not in all_results:
-                                all_results[selected_quiz] = []
-                            
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            all_results[selected_quiz].append({
-                                "name": student_name.strip(),
-                                "score": final_score,
-                                "timestamp": timestamp
-                            })
-                            save_quiz_results(all_results)
-                            st.toast("✅ 成績已自動回傳給老師！", icon="📤")
+                student_quiz(selected_quiz)
         else:
             st.info("老師還沒有開放任何測驗題喔！")
 
+    elif student_mode == "🎯 即時測驗":
+        st.subheader("🎯 即時課堂測驗")
+        if st.session_state.get("live_player"):
+            live_player_panel(*st.session_state.live_player)
+        else:
+            st.info("👇 輸入老師螢幕上的房間代碼，一起搶答！答得越快分數越高。")
+            live_code = st.text_input("🔢 房間代碼", max_chars=4, placeholder="例如：0427", key="live_join_code")
+            live_name = st.text_input("👤 姓名或學號", placeholder="例如：王小明 或 112001", key="live_join_name")
+            if st.button("🚀 加入房間", type="primary", use_container_width=True):
+                try:
+                    get_live_hub().join(live_code.strip(), live_name)
+                    st.session_state.live_player = (live_code.strip(), live_name.strip())
+                    st.rerun()
+                except LiveQuizError as e:
+                    st.error(f"⚠️ {e}")
+
     elif student_mode == "📂 上傳自己的錄音":
         uploaded = st.file_uploader("請上傳您自己錄的音檔", type=['mp3', 'wav', 'm4a', 'aac'])
-        if uploaded: audio_data = uploaded; st.audio(audio_data)
+        if uploaded: audio_data = uploaded; preview_audio(audio_data)
 
     elif student_mode == "🎙️ 網頁錄音":
-        st.info("💡 允許麥克風後即可開始錄音。")
-        recorded = st.audio_input("開始錄製語音")
-        if recorded: audio_data = recorded
+        if st.toggle("⚡ 上課中即時筆記 (邊錄邊整理)", key="student_live_notes"):
+            live_note_recorder("student", "Student_Notes.md")
+        else:
+            st.info("💡 允許麥克風後即可開始錄音。")
+            recorded = st.audio_input("開始錄製語音")
+            if recorded: audio_data = recorded
 
     if audio_data:
         st.divider()
         st.subheader("🤖 生成自己的筆記")
+        segmented = segmented_toggle("student_segmented")
         if not api_key: st.warning("請在側邊欄輸入 API Key")
         elif st.button("🚀 分析上傳/錄製的語音", type="primary", use_container_width=True):
-            analyze_from_buffer(audio_data, ai_prompt, "Student_Notes.md")
+            analyze_from_buffer(audio_data, "student", "Student_Notes.md", segmented=segmented)
 
     elif student_mode == "💬 師生留言板":
         st.subheader("💬 師生留言板")
-        if shared_md_files:
-            selected_comment_file = st.selectbox("請選擇要提問或查看回覆的講義", ["-- 請選擇 --"] + shared_md_files, key="student_comment_select")
+        if get_catalog().count("notes"):
+            selected_comment_file = catalog_selectbox("請選擇要提問或查看回覆的講義", "notes", key="student_comment_select")
             if selected_comment_file != "-- 請選擇 --":
-                all_comments = load_comments()
-                course_comments = all_comments.get(selected_comment_file, [])
                 st.divider()
-                if course_comments:
-                    for c in course_comments:
-                        avatar = "👨‍🎓" if c['role'] == "student" else "👨‍🏫"
-                        with st.chat_message(c['role'], avatar=avatar):
-                            st.write(c['content'])
-                else:
-                    st.info("還沒有留言，有不懂的地方可以直接發問，老師會親自回覆！")
-                
-                st.markdown("<br>", unsafe_allow_html=True)
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    new_comment = st.text_input("留言給老師...", key="student_comment_input", label_visibility="collapsed")
-                with col2:
-                    if st.button("送出給老師", type="primary", use_container_width=True):
-                        if new_comment:
-                            course_comments.append({"role": "student", "content": new_comment})
-                            all_comments[selected_comment_file] = course_comments
-                            save_comments(all_comments)
-                            st.rerun()
+                student_comment_board(selected_comment_file)
         else:
             st.warning("😴 目前老師還沒有發布任何講義喔！")
 
@@ -532,30 +1277,21 @@ if st.session_state.generated_note:
     if "教師" in role:
         show_global_notes = True
     elif "學生" in role:
-        if student_mode != "🎮 互動測驗":
+        if student_mode not in ("🎮 互動測驗", "🎯 即時測驗"):
             show_global_notes = True
 
 if show_global_notes:
     st.divider()
     st.header("📝 講義與筆記內容")
+    note_language_bar()
     
     raw_note = st.session_state.generated_note
-    if "學生" in role:
-        display_note = raw_note.split("---TEACHER_ONLY---")[0].strip()
-    else:
-        display_note = raw_note.replace("---TEACHER_ONLY---", "\n\n---\n**🔒 以下為教師專屬內容 (課後隨堂測驗 & 易錯提醒，學生端不可見)：**\n\n")
+    note_view = "student" if "學生" in role else "teacher"
+    display_note = make_display_note(raw_note, note_view)
         
     st.markdown(display_note)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.download_button("📥 下載 (.md)", data=display_note, file_name=st.session_state.note_filename, mime="text/markdown", use_container_width=True)
-    with col2:
-        try:
-            pdf_data = create_pdf(display_note)
-            st.download_button("📥 下載 (.pdf)", data=pdf_data, file_name=st.session_state.note_filename.replace(".md", ".pdf"), mime="application/pdf", use_container_width=True)
-        except Exception as pdf_err:
-            st.error("⚠️ PDF 生成失敗！")
+    note_downloads(display_note, note_view)
 
     # ==========================
     # 👨‍🏫 教師區塊：發布講義 & 一鍵生成題庫
@@ -566,15 +1302,14 @@ if show_global_notes:
         st.info("💡 您可以選擇只發布這份講義，或者點擊「發布並生成互動測驗」，讓 AI 幫您出 10 題選擇題給學生考！")
         
         share_title = st.text_input("輸入講義標題", key="teacher_share_title", placeholder="例如：第一週_經濟學導論")
+        n_variants = st.number_input("🔀 測驗洗牌版本數 (鄰座同學拿到不同題序與選項順序)", min_value=1, max_value=MAX_QUIZ_VARIANTS, value=1, key="teacher_quiz_variants")
         
         col_t1, col_t2 = st.columns(2)
         with col_t1:
             if st.button("💾 單純發布講義", type="primary", use_container_width=True):
                 if share_title:
                     safe_title = share_title.replace("/", "_").replace("\\", "_") + ".md"
-                    save_path = os.path.join(SHARED_DIR, safe_title)
-                    with open(save_path, "w", encoding="utf-8") as f:
-                        f.write(st.session_state.generated_note)
+                    publish_note(safe_title, st.session_state.generated_note)
                     st.success(f"✅ 成功發布講義：「{safe_title}」！")
                 else:
                     st.warning("⚠️ 請先輸入標題才能發布！")
@@ -583,21 +1318,15 @@ if show_global_notes:
             if st.button("🎲 發布講義 + 一鍵生成互動測驗", type="primary", use_container_width=True):
                 if share_title:
                     safe_title = share_title.replace("/", "_").replace("\\", "_")
-                    md_save_path = os.path.join(SHARED_DIR, f"{safe_title}.md")
-                    with open(md_save_path, "w", encoding="utf-8") as f:
-                        f.write(st.session_state.generated_note)
+                    publish_note(f"{safe_title}.md", st.session_state.generated_note)
                     
-                    with st.spinner("🎲 正在叫 AI 自動出題 (10題)..."):
-                        try:
-                            quiz_json = generate_interactive_quiz(display_note, safe_title)
-                            quiz_save_path = os.path.join(QUIZ_DIR, f"{safe_title}.json")
-                            with open(quiz_save_path, "w", encoding="utf-8") as f:
-                                json.dump(quiz_json, f, ensure_ascii=False, indent=2)
-                                
-                            st.success("✅ 講義與測驗皆已發布成功！")
-                            st.balloons()
-                        except Exception as e:
-                            st.error(f"❌ 出題失敗\n\n詳細錯誤：{e}\n\n可能是 AI 回傳格式不符，請重新點擊一次按鈕。")
+                    configure_gemini(api_key)
+                    get_job_manager().submit(
+                        "quiz", st.session_state.username, f"{safe_title} 互動測驗", run_quiz_job,
+                        model_name, display_note, safe_title, get_catalog(), int(n_variants),
+                        dedupe_key=f"quiz:{safe_title}:{n_variants}:{hashlib.sha256(display_note.encode('utf-8')).hexdigest()}",
+                    )
+                    st.success("✅ 講義已發布！AI 正在背景出題 (10題)，進度請看側邊欄「📋 我的背景工作」。")
                 else:
                     st.warning("⚠️ 請先輸入標題才能發布！")
 
@@ -609,36 +1338,8 @@ if show_global_notes:
         st.subheader("🤖 AI 助教一對一問答")
         st.info("對這份筆記有不懂的地方嗎？直接在這裡問 AI 助教！（AI 將根據上方內容為您即時解答）")
         
-        for msg in st.session_state.chat_history:
-            avatar = "🤖" if msg["role"] == "assistant" else "👨‍🎓"
-            with st.chat_message(msg["role"], avatar=avatar):
-                st.markdown(msg["content"])
-                
-        if user_q := st.chat_input("請輸入您的問題，例如：請用更簡單的例子解釋第二點..."):
-            st.session_state.chat_history.append({"role": "user", "content": user_q})
-            with st.chat_message("user", avatar="👨‍🎓"):
-                st.markdown(user_q)
-            
-            with st.chat_message("assistant", avatar="🤖"):
-                message_placeholder = st.empty()
-                message_placeholder.markdown("🧠 思考中...")
-                
-                try:
-                    chat_context = f"【課堂筆記內容】\n{display_note}\n\n【過去的對話紀錄】\n"
-                    for msg in st.session_state.chat_history[:-1]:
-                        role_name = "學生" if msg["role"] == "user" else "AI助教"
-                        chat_context += f"{role_name}: {msg['content']}\n"
-                        
-                    chat_prompt = f"""
-                    你是一位友善的 AI 助教。請根據【課堂筆記內容】來回答學生的問題。如果超出範圍，請溫柔提醒。
-                    {chat_context}
-                    學生最新問題: {user_q}
-                    AI助教回答:
-                    """
-                    chat_model = genai.GenerativeModel(model_name)
-                    response = chat_model.generate_content(chat_prompt)
-                    
-                    message_placeholder.markdown(response.text)
-                    st.session_state.chat_history.append({"role": "assistant", "content": response.text})
-                except Exception as e:
-                    message_placeholder.error(f"抱歉，AI 助教遇到了一點問題：{e}")
+        tutor_chat(display_note)
+
+# 背景工作面板最後才畫：這次執行中剛送出的工作也看得到，並開始定時更新
+with jobs_box:
+    my_jobs_panel()
@@ -0,0 +1,122 @@
+import os
+import re
+import shutil
+import subprocess
+import time
+
+# --- 錄音檔處理工具 (使用 ffmpeg / ffprobe) ---
+# ffmpeg 為選用套件 (packages.txt)；沒有安裝時 has_ffmpeg() 回傳 False，呼叫端應退回整檔處理。
+
+SEGMENT_MAX_SECONDS = 600    # 每段最長 10 分鐘
+SEGMENT_MIN_SECONDS = 120    # 太短的段落沒有意義，至少 2 分鐘才切
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_SECONDS = 0.6
+
+# 上傳前壓縮：單聲道 16kHz 的 32kbps MP3 對語音已經足夠，一小時約 14MB
+PREPROCESS_SAMPLE_RATE = 16000
+PREPROCESS_BITRATE = "32k"
+TRIM_SILENCE_SECONDS = 2.0   # 超過這個長度的靜音才剪掉
+TRIM_KEEP_SECONDS = 0.5      # 剪掉時保留的停頓，避免句子黏在一起
+
+
+def has_ffmpeg():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def probe_duration(path):
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(out.strip())
+
+
+def detect_silences(path, noise_db=SILENCE_NOISE_DB, min_silence=SILENCE_MIN_SECONDS):
+    """回傳每段靜音的中點 (秒)，作為可以下刀的位置。"""
+    proc = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", path,
+         "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    starts = [float(x) for x in re.findall(r"silence_start: (-?[\d.]+)", proc.stderr)]
+    ends = [float(x) for x in re.findall(r"silence_end: ([\d.]+)", proc.stderr)]
+    return [(max(s, 0.0) + e) / 2 for s, e in zip(starts, ends)]
+
+
+def plan_segments(duration, cut_points, max_len=SEGMENT_MAX_SECONDS, min_len=SEGMENT_MIN_SECONDS):
+    """在靜音處切段：每段不超過 max_len，盡量切在 [min_len, max_len] 區間內最後一個靜音點。"""
+    segments = []
+    start = 0.0
+    cut_points = sorted(cut_points)
+    while duration - start > max_len:
+        candidates = [p for p in cut_points if start + min_len <= p <= start + max_len]
+        end = candidates[-1] if candidates else start + max_len
+        segments.append((start, end))
+        start = end
+    segments.append((start, duration))
+    return segments
+
+
+def extract_segment(path, start, end, out_path):
+    # 轉成單聲道 16kHz MP3：語音辨識足夠，且比原始 WAV 小很多
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{start:.3f}", "-to", f"{end:.3f}",
+         "-i", path, "-vn", "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "48k", out_path],
+        check=True,
+    )
+    return out_path
+
+
+def split_on_silence(path, out_dir, max_len=SEGMENT_MAX_SECONDS, min_len=SEGMENT_MIN_SECONDS):
+    """把長錄音切成數段，回傳 [(段落檔案路徑, 開始秒, 結束秒), ...]，依時間順序排列。"""
+    duration = probe_duration(path)
+    if duration <= max_len:
+        return [(path, 0.0, duration)]
+    segments = plan_segments(duration, detect_silences(path), max_len, min_len)
+    return [
+        (extract_segment(path, start, end, os.path.join(out_dir, f"segment_{i:03d}.mp3")), start, end)
+        for i, (start, end) in enumerate(segments)
+    ]
+
+
+def preprocess_audio(path, out_path, trim_silence=True, sample_rate=PREPROCESS_SAMPLE_RATE, bitrate=PREPROCESS_BITRATE):
+    """轉成單聲道、降取樣、(選擇性) 剪掉長靜音，並壓成小的 MP3。
+
+    回傳 {"input_bytes", "output_bytes", "saved_bytes", "seconds", "path"}；
+    壓完沒有變小 (例如原本就是低位元率 MP3) 時 path 仍是原檔，呼叫端直接上傳原檔即可。
+    剪掉靜音後錄音時間軸會變短，需要對照原始時間的功能 (例如分段時間戳) 請不要開啟 trim_silence。
+    """
+    start = time.perf_counter()
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", path, "-vn", "-ac", "1", "-ar", str(sample_rate)]
+    if trim_silence:
+        command += ["-af", (
+            f"silenceremove=stop_periods=-1:stop_duration={TRIM_SILENCE_SECONDS}"
+            f":stop_threshold={SILENCE_NOISE_DB}dB:stop_silence={TRIM_KEEP_SECONDS}"
+        )]
+    command += ["-c:a", "libmp3lame", "-b:a", bitrate, out_path]
+    subprocess.run(command, check=True)
+
+    input_bytes = os.path.getsize(path)
+    output_bytes = os.path.getsize(out_path)
+    if output_bytes >= input_bytes:
+        out_path, output_bytes = path, input_bytes
+    return {
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "saved_bytes": input_bytes - output_bytes,
+        "seconds": time.perf_counter() - start,
+        "path": out_path,
+    }
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import audio_tools
+import prompts
+from ai_cache import AICache, hash_file
+from ai_engine import configure, derive_notes, generate_interactive_quiz, transcribe_audio
+from catalog import Catalog
+from publishing import make_display_note, publish_note, publish_quiz
+from rate_limiter import PRIORITY_TEACHER, shared_limiter
+from search_index import SearchIndex
+
+# --- 批次處理整個資料夾的錄音 (不需開網頁) ---
+# 用法：在 app.py 的工作目錄執行
+#     python batch.py 錄音資料夾 --quiz --workers 2
+# 講義與測驗直接發布到 shared_notes/、shared_quizzes/，網頁端馬上看得到。
+# 進度記在 batch_state.json：每個檔案的講義、測驗完成後各記一次，中斷後重跑會跳過已完成的步驟，
+# 錄音內容改變 (雜湊不同) 才重做；AI 結果另有快取，中斷在一半的檔案重跑也不會重複計費。
+# 每份錄音只聽寫一次逐字稿 (存在 AI 快取)，講義與 --extra-languages 的其他語言版本都從逐字稿平行產生。
+
+# 與 app.py 相同的資料位置
+SHARED_DIR = "shared_notes"
+QUIZ_DIR = "shared_quizzes"
+QUIZ_VARIANTS_DIR = os.path.join(QUIZ_DIR, "variants")
+CATALOG_FILE = "catalog.json"
+SEARCH_DB = "search_index.db"
+AI_CACHE_DB = "ai_cache.db"
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+STATE_FILE = "batch_state.json"
+AUDIO_SUFFIXES = (".mp3", ".wav", ".m4a", ".aac")
+
+
+class BatchState:
+    """每個錄音檔一筆：{"sha256", "note", "translations", "quiz", "error"}，每次更新都原子寫回檔案。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._files = json.load(f)
+        except (OSError, ValueError):
+            self._files = {}
+
+    def get(self, name):
+        with self._lock:
+            return dict(self._files.get(name, {}))
+
+    def update(self, name, **fields):
+        with self._lock:
+            self._files.setdefault(name, {}).update(fields)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._files, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def find_api_key(cli_key):
+    if cli_key:
+        return cli_key
+    if os.environ.get("GOOGLE_API_KEY"):
+        return os.environ["GOOGLE_API_KEY"]
+    try:
+        import tomllib  # Python 3.11+
+        with open(SECRETS_FILE, "rb") as f:
+            return tomllib.load(f).get("GOOGLE_API_KEY")
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def list_audio_files(audio_dir):
+    return sorted(
+        os.path.join(audio_dir, name) for name in os.listdir(audio_dir)
+        if name.lower().endswith(AUDIO_SUFFIXES) and os.path.isfile(os.path.join(audio_dir, name))
+    )
+
+
+def safe_title(path):
+    # 與網頁發布相同的檔名規則：標題就是錄音檔名 (去掉副檔名)
+    return os.path.splitext(os.path.basename(path))[0].replace("/", "_").replace("\\", "_")
+
+
+def process_file(path, args, state, catalog, search_index, cache, log):
+    name = os.path.basename(path)
+    title = safe_title(path)
+    audio_sha = hash_file(path)
+    record = state.get(name)
+    if record.get("sha256") != audio_sha or args.force:
+        record = {}
+        state.update(name, sha256=audio_sha, note=None, translations={}, quiz=None, error=None)
+
+    note = None
+    if record.get("note"):
+        try:
+            with open(os.path.join(SHARED_DIR, record["note"]), "r", encoding="utf-8") as f:
+                note = f.read()
+        except OSError:
+            note = None  # 講義被刪掉了，重新生成
+
+    # 還沒發布的語言版本 (主要語言 + 其他語言) 一起從逐字稿產生
+    translations = record.get("translations") or {}
+    missing = ([args.language] if note is None else []) + [
+        lang for lang in args.extra_languages
+        if lang != args.language and not (lang in translations and os.path.exists(os.path.join(SHARED_DIR, translations[lang])))
+    ]
+    if missing:
+        log(f"📝 {name}：AI 聽寫逐字稿中...")
+        notify = lambda msg: log(f"   {name}：{msg}")
+        transcript = transcribe_audio(
+            args.model, path, cache=cache, audio_sha=audio_sha, segmented=args.segmented, max_workers=args.segment_workers,
+            notify=notify, priority=PRIORITY_TEACHER, preprocess=args.preprocess,
+        )
+        log(f"✍️ {name}：從逐字稿產生講義 ({'、'.join(missing)})...")
+        notes = derive_notes(
+            args.model, transcript, {lang: prompts.note_prompt(args.view, lang) for lang in missing},
+            cache=cache, notify=notify, priority=PRIORITY_TEACHER,
+        )
+        for lang, text in notes.items():
+            note_file = f"{title}.md" if lang == args.language else f"{title} ({lang}).md"
+            publish_note(SHARED_DIR, note_file, text, catalog, search_index)
+            if lang == args.language:
+                note = text
+                state.update(name, note=note_file, error=None)
+            else:
+                translations[lang] = note_file
+                state.update(name, translations=translations, error=None)
+            log(f"📄 {name}：已發布講義 {note_file}")
+
+    if args.quiz and not record.get("quiz"):
+        log(f"🎲 {name}：AI 出題中...")
+        quiz = generate_interactive_quiz(
+            args.model, make_display_note(note, "teacher"), title, notify=lambda msg: log(f"   {name}：{msg}"),
+        )
+        quiz_file = publish_quiz(QUIZ_DIR, QUIZ_VARIANTS_DIR, title, quiz, catalog, args.variants)
+        state.update(name, quiz=quiz_file, error=None)
+        log(f"🎮 {name}：已發布測驗 {quiz_file}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批次把整個資料夾的課堂錄音產生講義 (與互動測驗) 並發布。")
+    parser.add_argument("audio_dir", help="錄音檔資料夾 (mp3 / wav / m4a / aac)")
+    parser.add_argument("--quiz", action="store_true", help="同時為每份講義生成 10 題互動測驗")
+    parser.add_argument("--variants", type=int, default=1, help="測驗洗牌版本數 (預設 1)")
+    parser.add_argument("--view", choices=["teacher", "student"], default="teacher", help="使用教師教材或學生筆記的提示詞")
+    parser.add_argument("--language", default=prompts.OUTPUT_LANGUAGES[0], help="講義語言 (預設繁體中文)")
+    parser.add_argument("--extra-languages", nargs="*", default=[], metavar="LANG",
+                        help="另外發布的語言版本 (檔名加上「 (語言)」)，與主要語言從同一份逐字稿平行產生")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--workers", type=int, default=2, help="同時處理的錄音檔數量 (預設 2)")
+    parser.add_argument("--segmented", action="store_true", help="長錄音在靜音處切段平行聽寫 (需要 ffmpeg)")
+    parser.add_argument("--segment-workers", type=int, default=4, help="分段模式下每個檔案同時聽寫的段落數")
+    parser.add_argument("--no-preprocess", dest="preprocess", action="store_false",
+                        help="不要在上傳前壓縮錄音 (預設有 ffmpeg 時會轉單聲道 16kHz 並壓成 MP3)")
+    parser.add_argument("--rpm", type=int, default=60, help="Gemini 每分鐘請求上限")
+    parser.add_argument("--tpm", type=int, default=1_000_000, help="Gemini 每分鐘 token 上限")
+    parser.add_argument("--state", default=STATE_FILE, help=f"進度檔位置 (預設 {STATE_FILE})")
+    parser.add_argument("--force", action="store_true", help="忽略進度檔，全部重做")
+    parser.add_argument("--api-key", help="Google API Key (預設讀環境變數 GOOGLE_API_KEY 或 .streamlit/secrets.toml)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    api_key = find_api_key(args.api_key)
+    if not api_key:
+        print("❌ 找不到 Google API Key：請用 --api-key、環境變數 GOOGLE_API_KEY 或 .streamlit/secrets.toml 設定。")
+        return 2
+    if args.segmented and not audio_tools.has_ffmpeg():
+        print("❌ 分段模式需要 ffmpeg，請先安裝或拿掉 --segmented。")
+        return 2
+    files = list_audio_files(args.audio_dir)
+    if not files:
+        print(f"📂 {args.audio_dir} 裡沒有錄音檔。")
+        return 0
+
+    configure(api_key)
+    shared_limiter(rpm=args.rpm, tpm=args.tpm)
+    for directory in (SHARED_DIR, QUIZ_DIR, QUIZ_VARIANTS_DIR):
+        os.makedirs(directory, exist_ok=True)
+    state = BatchState(args.state)
+    catalog = Catalog(SHARED_DIR, QUIZ_DIR, CATALOG_FILE)
+    search_index = SearchIndex(SEARCH_DB)
+    cache = AICache(AI_CACHE_DB)
+
+    print_lock = threading.Lock()
+    def log(message):
+        with print_lock:
+            print(message, flush=True)
+
+    failed = []
+    pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    try:
+        futures = {pool.submit(process_file, path, args, state, catalog, search_index, cache, log): path for path in files}
+        for done, future in enumerate(as_completed(futures), start=1):
+            name = os.path.basename(futures[future])
+            try:
+                future.result()
+                log(f"[{done}/{len(files)}] ✅ {name}")
+            except Exception as e:
+                failed.append(name)
+                state.update(name, error=str(e))
+                log(f"[{done}/{len(files)}] ❌ {name}：{e}")
+    except KeyboardInterrupt:
+        # 已完成的步驟都記在進度檔裡，重新執行同一個指令就會從中斷處繼續
+        log("⏹️ 已中斷，正在等待進行中的檔案結束...")
+        pool.shutdown(wait=True, cancel_futures=True)
+        return 130
+    pool.shutdown()
+
+    log(f"🏁 完成 {len(files) - len(failed)}/{len(files)} 個檔案" + (f"，失敗：{'、'.join(failed)}" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
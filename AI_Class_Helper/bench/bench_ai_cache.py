@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_genai
+fake_genai.install()
+
+from ai_cache import AICache
+from ai_engine import analyze_audio_with_ai
+
+# --- 錄音去重快取：同一份錄音重複上傳時，是否真的不再上傳/重新生成 ---
+# 用法：python bench/bench_ai_cache.py
+
+
+def main():
+    fake_genai.reset(upload_latency=0.3, processing_polls=2, latency=0.5)
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_path = os.path.join(tmp, "lecture.wav")
+        with open(audio_path, "wb") as f:
+            f.write(os.urandom(5 * 1024 * 1024))
+        cache = AICache(os.path.join(tmp, "ai_cache.db"))
+
+        timings = []
+        for prompt in ["教師講義提示詞", "教師講義提示詞", "學生筆記提示詞"]:
+            start = time.perf_counter()
+            analyze_audio_with_ai("gemini-2.5-flash", audio_path, prompt, cache=cache)
+            timings.append(time.perf_counter() - start)
+
+    print(f"第一次生成：{timings[0]:.2f}s  重複上傳：{timings[1]:.3f}s  換提示詞：{timings[2]:.2f}s")
+    print(f"快取統計：{cache.stats}")
+    print(f"假後端呼叫次數：{dict(fake_genai.calls)}")
+    assert fake_genai.calls["upload_file"] == 1, "同一份錄音不應重複上傳"
+    assert fake_genai.calls["generate_content"] == 2, "相同提示詞不應重新生成"
+    assert cache.stats["result_hits"] == 1 and cache.stats["file_hits"] == 1
+
+
+if __name__ == "__main__":
+    main()
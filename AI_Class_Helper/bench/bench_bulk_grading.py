@@ -0,0 +1,114 @@
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import answer_sheets
+from quiz_store import QuizResultStore
+
+# --- 答案卷批次批改：向量化 vs. 逐人逐題 ---
+# 用法：python bench/bench_bulk_grading.py [--rows 10000] [--questions 10] [--row-inserts 1000]
+# 產生一份 rows 位學生的 CSV 答案卷 (作答混用字母、編號、選項全文與空白)，比較：
+#   讀檔：answer_sheets.read_sheet (兩種批改共用，另外計時)
+#   批改：answer_sheets.grade_rows (整欄查表 + 矩陣比對) vs. 測驗表單的逐題 `答案 == 正確答案` 迴圈
+#   寫入：add_answer_matrix (一個交易) vs. 每人一次 add_result (每筆一個交易，只跑 row-inserts 筆再換算)
+# 兩種批改的分數會互相核對。
+
+QUIZ_FILE = "匯入測驗.json"
+
+
+def make_quiz(n):
+    return [
+        {"question": f"第 {i + 1} 題", "options": ["上升", "下降", "不變", "無法判斷"], "answer": ["上升", "下降", "不變", "無法判斷"][i % 4],
+         "explanation": ""}
+        for i in range(n)
+    ]
+
+
+def make_sheet(quiz, rows, rng):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["姓名/學號"] + [f"Q{i + 1}" for i in range(len(quiz))])
+    for r in range(rows):
+        cells = []
+        for q in quiz:
+            choice = q["options"].index(q["answer"]) if rng.random() < 0.7 else rng.randrange(4)
+            style = rng.random()
+            cells.append("" if style < 0.03 else chr(ord("A") + choice) if style < 0.6 else str(choice + 1) if style < 0.8 else q["options"][choice])
+        writer.writerow([f"S{r:06d}"] + cells)
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def grade_per_row(quiz, rows):
+    # 與測驗表單相同的逐題比對 (先把字母、編號換回選項全文)
+    scores = []
+    for row in rows:
+        score = 0
+        for i, q in enumerate(quiz):
+            cell = row[i + 1]
+            if len(cell) == 1 and cell.isalpha():
+                cell = q["options"][ord(cell.upper()) - ord("A")]
+            elif cell.isdigit():
+                cell = q["options"][int(cell) - 1]
+            if cell == q["answer"]:
+                score += 1
+        scores.append(score * 100 // len(quiz))
+    return scores
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000, help="答案卷人數")
+    parser.add_argument("--questions", type=int, default=10, help="題數")
+    parser.add_argument("--row-inserts", type=int, default=1000, help="逐筆寫入的對照組筆數 (再換算成 rows 筆)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    quiz = make_quiz(args.questions)
+    data = make_sheet(quiz, args.rows, random.Random(args.seed))
+    (header, rows), read_seconds = timed(answer_sheets.read_sheet, data, "sheet.csv")
+    answer_sheets.grade_rows(quiz, header, rows[:10])  # 先暖身一次，批改耗時不含第一次載入 numpy 的時間
+    graded, vector_seconds = timed(answer_sheets.grade_rows, quiz, header, rows)
+    loop_scores, loop_seconds = timed(grade_per_row, quiz, rows)
+    assert graded["scores"].tolist() == loop_scores, "向量化批改與逐題批改的分數不一致"
+
+    with tempfile.TemporaryDirectory(prefix="classroom_grading_") as workspace:
+        store = QuizResultStore(os.path.join(workspace, "bulk.db"))
+        _, bulk_seconds = timed(
+            store.add_answer_matrix, QUIZ_FILE, graded["names"], graded["scores"], graded["timestamps"], graded["matrix"], graded["key_indices"],
+        )
+        stats = store.get_stats(QUIZ_FILE)
+
+        row_store = QuizResultStore(os.path.join(workspace, "rows.db"))
+        n = min(args.row_inserts, args.rows)
+        start = time.perf_counter()
+        for i in range(n):
+            answers = [None if a < 0 else int(a) for a in graded["matrix"][i]]
+            row_store.add_result(QUIZ_FILE, graded["names"][i], int(graded["scores"][i]), graded["timestamps"][i], answers, graded["key_indices"])
+        row_seconds = (time.perf_counter() - start) * args.rows / n
+
+    print(f"📝 {args.rows:,} 位學生 x {args.questions} 題的答案卷 ({len(data) / 1024:.0f}KB，認不得的作答 {graded['unknown']} 格)")
+    print(f"{'步驟':<22}{'耗時':>10}")
+    print(f"{'讀檔 (CSV 解析)':<22}{read_seconds * 1000:>8.1f}ms")
+    print(f"{'向量化批改':<22}{vector_seconds * 1000:>8.1f}ms")
+    print(f"{'逐題迴圈批改':<22}{loop_seconds * 1000:>8.1f}ms")
+    print(f"{'一個交易批次寫入':<22}{bulk_seconds * 1000:>8.1f}ms")
+    print(f"{'逐筆交易寫入 (換算)':<22}{row_seconds * 1000:>8.1f}ms")
+    print(f"✅ 成績庫 {stats['count']:,} 筆，平均 {stats['mean']:.1f} 分，逐題答對率 {' / '.join(f'{r:.0%}' for r in stats['correct_rate'])}")
+    assert stats["count"] == args.rows and stats["answered"] == args.rows, "寫入筆數不符"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tutor_context import NoteIndex, build_chat_context
+
+# --- AI 助教提示詞大小：整份講義 + 全部對話 (舊) vs. 檢索段落 + 對話摘要 (新) ---
+# 用法：python bench/bench_chat_context.py [對話輪數]
+
+TOPICS = ["供給", "需求", "彈性", "均衡價格", "消費者剩餘", "生產者剩餘", "外部性", "公共財",
+          "獨占", "寡占", "完全競爭", "機會成本", "邊際效用", "價格管制", "稅負歸宿", "比較利益"]
+
+
+def make_note(rng):
+    parts = ["## 1. 📖 課程核心摘要\n本週介紹個體經濟學的核心概念，包含" + "、".join(TOPICS) + "。"]
+    for n, topic in enumerate(TOPICS, start=2):
+        body = "\n".join(
+            f"- {topic}的第 {i + 1} 個重點：{''.join(rng.choice(TOPICS) for _ in range(6))}，老師舉了生活中的例子說明。"
+            for i in range(12)
+        )
+        parts.append(f"## {n}. 💡 {topic}\n{body}")
+    return "\n\n".join(parts)
+
+
+def legacy_context(note, history):
+    # 與舊版 app.py 相同：整份講義 + 全部對話紀錄
+    chat_context = f"【課堂筆記內容】\n{note}\n\n【過去的對話紀錄】\n"
+    for msg in history:
+        role_name = "學生" if msg["role"] == "user" else "AI助教"
+        chat_context += f"{role_name}: {msg['content']}\n"
+    return chat_context
+
+
+def main(turns=30):
+    rng = random.Random(0)
+    note = make_note(rng)
+    start = time.perf_counter()
+    index = NoteIndex(note)
+    build_time = time.perf_counter() - start
+
+    history = []
+    legacy_sizes, new_sizes, new_times = [], [], []
+    for turn in range(turns):
+        question = f"請再解釋一次{rng.choice(TOPICS)}和{rng.choice(TOPICS)}的差別？"
+        legacy_sizes.append(len(legacy_context(note, history)) + len(question))
+        start = time.perf_counter()
+        context = build_chat_context(index, history, question)
+        new_times.append(time.perf_counter() - start)
+        new_sizes.append(len(context) + len(question))
+        history += [{"role": "user", "content": question},
+                    {"role": "assistant", "content": "以下用例子說明：" + "好的，" * 150}]
+
+    print(f"講義 {len(note)} 字，切成 {len(index.sections)} 段，建立索引 {build_time * 1000:.1f} ms")
+    print(f"{'輪次':>4} {'舊版字數':>10} {'新版字數':>10}")
+    for turn in [0, 4, 9, 19, turns - 1]:
+        if turn < turns:
+            print(f"{turn + 1:>4} {legacy_sizes[turn]:>10} {new_sizes[turn]:>10}")
+    print(f"總計：舊版 {sum(legacy_sizes)} 字，新版 {sum(new_sizes)} 字 "
+          f"(減少 {100 * (1 - sum(new_sizes) / sum(legacy_sizes)):.0f}%)")
+    print(f"每輪組提示詞平均 {1000 * sum(new_times) / len(new_times):.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_tools
+
+# --- 上傳前錄音壓縮：省下多少位元組、花多少時間 ---
+# 用法：python bench/bench_preprocess.py [--minutes 10]  (需要 ffmpeg)
+# 以合成的「課堂錄音」測試：44.1kHz 立體聲 16-bit WAV，3-8 秒的語音狀聲音 + 0.5-6 秒的停頓，模擬教室錄音機的輸出。
+
+SAMPLE_RATE = 44100
+UPLOAD_MBPS = 10  # 估算上傳時間用的頻寬
+
+
+def synthesize_lecture(path, minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        written = 0
+        while written < total:
+            # 一段「說話」：基頻 100-250Hz 加諧波，音節般的振幅起伏，再加一點底噪
+            n = min(int(rng.uniform(3, 8) * SAMPLE_RATE), total - written)
+            t = np.arange(n) / SAMPLE_RATE
+            f0 = rng.uniform(100, 250)
+            voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+            voice *= 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * t) ** 2
+            chunk = 0.2 * voice + 0.005 * rng.standard_normal(n)
+            # 接著一段停頓 (只有微弱底噪)
+            pause = min(int(rng.uniform(0.5, 6) * SAMPLE_RATE), total - written - n)
+            chunk = np.concatenate([chunk, 0.002 * rng.standard_normal(max(pause, 0))])
+            pcm = (np.clip(chunk, -1, 1) * 32767).astype("<i2")
+            w.writeframes(np.repeat(pcm[:, np.newaxis], 2, axis=1).tobytes())
+            written += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=10)
+    args = parser.parse_args()
+    if not audio_tools.has_ffmpeg():
+        print("需要 ffmpeg / ffprobe 才能執行這個基準測試。")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "lecture.wav")
+        start = time.perf_counter()
+        synthesize_lecture(source, args.minutes)
+        print(f"合成 {args.minutes:g} 分鐘錄音：{audio_tools.format_bytes(os.path.getsize(source))}  ({time.perf_counter() - start:.1f}s)")
+        source_duration = audio_tools.probe_duration(source)
+
+        for trim in (False, True):
+            stats = audio_tools.preprocess_audio(source, os.path.join(tmp, f"out_{trim}.mp3"), trim_silence=trim)
+            duration = audio_tools.probe_duration(stats["path"])
+            upload_before = stats["input_bytes"] * 8 / (UPLOAD_MBPS * 1e6)
+            upload_after = stats["output_bytes"] * 8 / (UPLOAD_MBPS * 1e6)
+            print(
+                f"{'單聲道+降取樣+MP3+剪靜音' if trim else '單聲道+降取樣+MP3':<16} "
+                f"{audio_tools.format_bytes(stats['input_bytes'])} → {audio_tools.format_bytes(stats['output_bytes'])} "
+                f"(省 {stats['saved_bytes'] / stats['input_bytes']:.1%})  壓縮耗時 {stats['seconds']:.1f}s  "
+                f"長度 {source_duration:.0f}s → {duration:.0f}s  "
+                f"上傳 @{UPLOAD_MBPS}Mbps：{upload_before:.1f}s → {upload_after:.1f}s"
+            )
+            assert stats["output_bytes"] < stats["input_bytes"] / 10, "語音壓縮後應小於原始 WAV 的十分之一"
+
+
+if __name__ == "__main__":
+    main()
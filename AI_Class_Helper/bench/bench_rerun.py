@@ -0,0 +1,201 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+# 與負載測試共用假 Gemini、共用編譯結果與測試資料
+from load_test import APP_PATH, NOTE_FILE, QUIZ, QUIZ_FILE, seed_workspace
+
+import fake_genai
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import local_script_runner
+
+# --- 每次互動的重跑成本與冷啟動時間 ---
+# 用法：python bench/bench_rerun.py [--repeat 20] [--cold-runs 3]
+# 冷啟動：每次開新的 Python 行程，量第一次執行 app.py (含匯入所有模組) 到登入頁畫完的時間。
+# 互動：學生登入、載入講義後，重複量幾種常見互動觸發的重跑時間：
+#     切換分頁、交卷、問 AI 助教 (假 Gemini 零延遲，只量腳本本身)、留言
+# 觸發互動的元件若在 st.fragment 裡，真正的伺服器只會重跑那個 fragment；
+# AppTest 一律整頁重跑，所以這裡記下每個元件屬於哪個 fragment，改送 fragment 範圍的重跑請求，量到的才是伺服器實際的成本。
+
+# 冷啟動用真正的 google.generativeai (登入頁不會呼叫 API)，才量得到它的匯入時間
+COLD_START_SNIPPET = """
+import os, time
+from streamlit.testing.v1 import AppTest
+os.chdir({workspace!r})
+start = time.perf_counter()
+AppTest.from_file({app_path!r}, default_timeout=120).run()
+print(time.perf_counter() - start)
+"""
+
+_widget_fragments = {}
+_fragment_rerun = None
+_last_payload = [0, 0]  # 上一次重跑送出的 (元素數, 位元組)
+_original_run = local_script_runner.LocalScriptRunner.run
+_original_parse = local_script_runner.parse_tree_from_messages
+
+
+def _parse_and_record(messages):
+    # 記下每個元件是由哪個 fragment 畫出來的
+    for msg in messages:
+        if msg.HasField("delta") and msg.delta.fragment_id and msg.delta.HasField("new_element"):
+            element = msg.delta.new_element
+            kind = element.WhichOneof("type")
+            widget_id = getattr(getattr(element, kind), "id", "") if kind else ""
+            if widget_id:
+                _widget_fragments[widget_id] = msg.delta.fragment_id
+    return _original_parse(messages)
+
+
+def _record_payload(messages, fragment_id=None):
+    # 這次重跑送給瀏覽器的元素數與位元組；fragment 重跑時佇列裡還留著上一次整頁的其他元素，只算這個 fragment 的
+    _last_payload[:] = [0, 0]
+    for msg in messages:
+        if msg.HasField("delta") and (fragment_id is None or msg.delta.fragment_id == fragment_id):
+            _last_payload[0] += 1
+            _last_payload[1] += msg.ByteSize()
+
+
+def _run_maybe_fragment(self, widget_state=None, query_params=None, timeout=3, page_hash=""):
+    if _fragment_rerun is None:
+        tree = _original_run(self, widget_state, query_params, timeout, page_hash)
+        _record_payload(self.forward_msgs())
+        return tree
+    self.request_rerun(RerunData(
+        widget_states=widget_state, page_script_hash=page_hash,
+        fragment_id_queue=[_fragment_rerun], is_fragment_scoped_rerun=True,
+    ))
+    try:
+        if not self._script_thread:
+            self.start()
+        local_script_runner.require_widgets_deltas(self, timeout)
+    finally:
+        self.join()
+    _record_payload(self.forward_msgs(), _fragment_rerun)
+    return _parse_and_record(self.forward_msgs())
+
+
+local_script_runner.parse_tree_from_messages = _parse_and_record
+local_script_runner.LocalScriptRunner.run = _run_maybe_fragment
+
+
+def timed_interaction(at, widget):
+    """觸發 widget 的互動並回傳 (秒數, 送出元素數, 送出位元組, 是否只重跑 fragment)；
+    fragment 重跑後會再整頁跑一次，讓元件樹回到完整狀態。"""
+    global _fragment_rerun
+    _fragment_rerun = _widget_fragments.get(widget.id)
+    start = time.perf_counter()
+    try:
+        at.run()
+    finally:
+        elapsed = time.perf_counter() - start
+        scoped = _fragment_rerun is not None
+        _fragment_rerun = None
+    elements, nbytes = _last_payload
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    if scoped:
+        at.run()
+    return elapsed, elements, nbytes, scoped
+
+
+def measure_cold_start(workspace, runs):
+    times = []
+    for _ in range(runs):
+        snippet = COLD_START_SNIPPET.format(workspace=workspace, app_path=APP_PATH)
+        out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True).stdout
+        times.append(float(out.strip().splitlines()[-1]))
+    return times
+
+
+def student_session():
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.text_input[0].input("student")
+    at.text_input[1].input("123")
+    at.button[0].click()
+    at.run()
+    at.radio[0].set_value("📖 老師分享的講義").run()
+    next(s for s in at.selectbox if "複習" in s.label).set_value(NOTE_FILE).run()
+    next(b for b in at.button if "載入講義內容" in b.label).click().run()
+    return at
+
+
+def measure_interactions(repeat):
+    results = {}
+    def record(name, elapsed, elements, nbytes, scoped):
+        times, payloads, _ = results.setdefault(name, ([], [], scoped))
+        times.append(elapsed)
+        payloads.append((elements, nbytes))
+
+    at = student_session()
+    tabs = ["📖 老師分享的講義", "💬 師生留言板"]
+    for i in range(repeat):
+        nav = at.radio[0]
+        nav.set_value(tabs[i % 2])
+        record("切換分頁", *timed_interaction(at, nav))
+
+    at.radio[0].set_value("📖 老師分享的講義").run()
+    for i in range(repeat):
+        chat = at.chat_input[0]
+        chat.set_value(f"請再解釋一次第 {i + 1} 點")
+        record("問 AI 助教", *timed_interaction(at, chat))
+
+    at.radio[0].set_value("💬 師生留言板").run()
+    next(s for s in at.selectbox if "提問" in s.label).set_value(NOTE_FILE).run()
+    for i in range(repeat):
+        at.text_input(key="student_comment_input").input(f"第 {i + 1} 個問題")
+        button = next(b for b in at.button if "送出給老師" in b.label)
+        button.click()
+        record("留言", *timed_interaction(at, button))
+
+    at.radio[0].set_value("🎮 互動測驗").run()
+    next(s for s in at.selectbox if "挑戰" in s.label).set_value(QUIZ_FILE).run()
+    for i in range(repeat):
+        next(t for t in at.text_input if "姓名" in t.label).input(f"學生{i:03d}")
+        for q in range(len(QUIZ)):
+            radio = at.radio(key=f"q_{q}")
+            radio.set_value(radio.options[i % len(radio.options)])
+        button = next(b for b in at.button if "交卷" in b.label)
+        button.click()
+        record("交卷", *timed_interaction(at, button))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="每種互動重複次數")
+    parser.add_argument("--cold-runs", type=int, default=3, help="冷啟動量測次數 (每次開新行程)")
+    args = parser.parse_args()
+
+    fake_genai.reset()
+    with tempfile.TemporaryDirectory(prefix="classroom_rerun_") as workspace:
+        seed_workspace(workspace)
+        cwd = os.getcwd()
+        os.chdir(workspace)
+        try:
+            cold = measure_cold_start(workspace, args.cold_runs)
+            interactions = measure_interactions(args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    print(f"🧊 冷啟動 (新行程第一次畫出登入頁)：中位數 {statistics.median(cold) * 1000:.0f} ms  ({', '.join(f'{t * 1000:.0f}' for t in cold)})")
+    print(f"{'互動':<10}{'重跑範圍':>10}{'p50 ms':>10}{'p95 ms':>10}{'送出元素':>10}{'送出 KB':>10}")
+    for name, (values, payloads, scoped) in interactions.items():
+        values.sort()
+        p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+        elements = statistics.median(e for e, _ in payloads)
+        kb = statistics.median(b for _, b in payloads) / 1024
+        print(f"{name:<10}{'fragment' if scoped else '整頁':>10}{statistics.median(values) * 1000:>10.1f}{p95 * 1000:>10.1f}"
+              f"{elements:>10.0f}{kb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_genai
+fake_genai.install()
+
+import prompts
+from ai_cache import AICache
+from ai_engine import analyze_audio_with_ai, derive_notes, transcribe_audio
+
+# --- 逐字稿優先 vs. 每份產出都重新分析錄音 ---
+# 用法：python bench/bench_transcript.py [--minutes 60] [--audio-latency 3] [--text-latency 1]
+# 同一份錄音要產出：教師教材 (繁中)、學生筆記 (繁中)、教師教材 (English、日本語) 共 4 份。
+#   舊流程：每份都把錄音 (已上傳的檔案) 連同提示詞送給 Gemini，逐份依序分析
+#   新流程：錄音聽寫成逐字稿一次，4 份講義從逐字稿平行產生
+# 假 Gemini 依「這次有沒有附上錄音」給不同延遲；輸入 token 以 Gemini 音訊每秒 32 tokens 估算，逐字稿以字數估算。
+
+AUDIO_TOKENS_PER_SECOND = 32
+TRANSCRIPT_CHARS_PER_MINUTE = 250
+OUTPUTS = [("teacher", "繁體中文"), ("student", "繁體中文"), ("teacher", "English"), ("teacher", "日本語")]
+
+
+class Usage:
+    def __init__(self, minutes, audio_latency, text_latency):
+        self.minutes = minutes
+        self.audio_latency = audio_latency
+        self.text_latency = text_latency
+        self.transcript = "\n".join(f"[00:{m:02d}:00] " + "今天我們談供給與需求。" * (TRANSCRIPT_CHARS_PER_MINUTE // 11) for m in range(minutes))
+        self.reset()
+
+    def reset(self):
+        self.audio_calls = self.text_calls = self.input_tokens = 0
+
+    def respond(self, contents):
+        # 附上錄音的呼叫：延遲較長，輸入 token 以錄音長度計；純文字呼叫以字數計
+        if isinstance(contents, list) and any(not isinstance(part, str) for part in contents):
+            self.audio_calls += 1
+            self.input_tokens += self.minutes * 60 * AUDIO_TOKENS_PER_SECOND + sum(len(p) for p in contents if isinstance(p, str))
+            time.sleep(self.audio_latency)
+            return self.transcript if "逐字聽寫" in contents[-1] else fake_genai.DEFAULT_NOTE
+        self.text_calls += 1
+        self.input_tokens += len(contents)
+        time.sleep(self.text_latency)
+        return fake_genai.DEFAULT_NOTE
+
+
+def per_output_audio(audio_path, cache):
+    for view, lang in OUTPUTS:
+        analyze_audio_with_ai("gemini-2.5-flash", audio_path, prompts.note_prompt(view, lang), cache=cache)
+
+
+def transcript_first(audio_path, cache):
+    transcript = transcribe_audio("gemini-2.5-flash", audio_path, cache=cache)
+    derive_notes(
+        "gemini-2.5-flash", transcript, {(view, lang): prompts.note_prompt(view, lang) for view, lang in OUTPUTS}, cache=cache,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=int, default=60, help="模擬的錄音長度 (分鐘)")
+    parser.add_argument("--audio-latency", type=float, default=3.0, help="附錄音的 Gemini 呼叫延遲 (秒)")
+    parser.add_argument("--text-latency", type=float, default=1.0, help="純文字 Gemini 呼叫延遲 (秒)")
+    args = parser.parse_args()
+
+    usage = Usage(args.minutes, args.audio_latency, args.text_latency)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_path = os.path.join(tmp, "lecture.wav")
+        with open(audio_path, "wb") as f:
+            f.write(os.urandom(1024 * 1024))
+        for name, flow in [("每份重新分析錄音", per_output_audio), ("逐字稿優先", transcript_first)]:
+            fake_genai.reset(text=usage.respond)
+            usage.reset()
+            cache = AICache(os.path.join(tmp, f"{flow.__name__}.db"))
+            start = time.perf_counter()
+            flow(audio_path, cache)
+            first = time.perf_counter() - start
+            # 之後換一種新語言：舊流程要再分析一次錄音，新流程只要從快取的逐字稿產生
+            start = time.perf_counter()
+            if flow is per_output_audio:
+                analyze_audio_with_ai("gemini-2.5-flash", audio_path, prompts.note_prompt("teacher", "한국어"), cache=cache)
+            else:
+                transcript = transcribe_audio("gemini-2.5-flash", audio_path, cache=cache)
+                derive_notes("gemini-2.5-flash", transcript, {"ko": prompts.note_prompt("teacher", "한국어")}, cache=cache)
+            extra = time.perf_counter() - start
+            results[name] = (first, extra, usage.audio_calls, usage.text_calls, usage.input_tokens, fake_genai.calls["upload_file"])
+
+    print(f"🎙️ {args.minutes} 分鐘錄音，產出 {len(OUTPUTS)} 份講義後再加一種語言 (附錄音呼叫 {args.audio_latency:g}s、純文字 {args.text_latency:g}s)")
+    print(f"{'流程':<14}{'4 份耗時':>10}{'加一種語言':>12}{'錄音呼叫':>10}{'文字呼叫':>10}{'輸入 tokens':>14}{'上傳':>6}")
+    for name, (first, extra, audio_calls, text_calls, tokens, uploads) in results.items():
+        print(f"{name:<14}{first:>9.1f}s{extra:>11.1f}s{audio_calls:>10}{text_calls:>10}{tokens:>14,}{uploads:>6}")
+
+
+if __name__ == "__main__":
+    main()
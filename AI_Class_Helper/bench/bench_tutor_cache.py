@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import percentile
+from tutor_cache import TutorAnswerCache, note_key
+
+# --- AI 助教共用答案快取：模擬一整班對同一份講義提問 ---
+# 用法：python bench/bench_tutor_cache.py [--students 300] [--latency 4] [--filler 1500]
+# 每位學生問一個問題：從 20 個基本問題依 Zipf 分布挑一個 (少數問題特別多人問)，
+# 再隨機改寫 (加「請問 / 老師」、換標點、甚麼/什麼、句尾語助詞)。
+# 比較「每次都呼叫 Gemini」與共用快取：Gemini 呼叫次數、學生等待總秒數 (以每次呼叫 latency 秒估算)，
+# 並檢查有沒有把別的問題的答案配給學生 (誤配)。
+# --filler 先放入其他講義的問答，量快取接近上限時的查詢延遲。
+
+BASE_QUESTIONS = [
+    "第二點是什麼意思", "第一點可以再解釋一次嗎", "供給曲線為什麼向右上方", "需求曲線為什麼向右下方",
+    "均衡價格是怎麼決定的", "價格上限會造成什麼結果", "什麼是消費者剩餘", "什麼是生產者剩餘",
+    "彈性大於一代表什麼", "替代品和互補品有什麼不同", "邊際效用遞減是什麼", "機會成本怎麼計算",
+    "為什麼會有無謂損失", "課稅會由誰負擔", "短期和長期有什麼差別", "獨占廠商怎麼訂價",
+    "外部性有哪些例子", "公共財的特性是什麼", "這題考試會考嗎", "第三點的例子可以換一個嗎",
+]
+PREFIXES = ["", "", "請問", "老師，", "想問", "不好意思，請問"]
+SUFFIXES = ["", "？", "?", "呢？", "。", " "]
+
+
+def paraphrase(question, rng):
+    text = question.replace("什麼", "甚麼") if rng.random() < 0.2 else question
+    return f"{rng.choice(PREFIXES)}{text}{rng.choice(SUFFIXES)}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=300, help="提問的學生數")
+    parser.add_argument("--latency", type=float, default=4.0, help="每次 Gemini 回答的秒數 (估算用，不實際等待)")
+    parser.add_argument("--filler", type=int, default=1500, help="預先放入其他講義的問答筆數")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cache = TutorAnswerCache()
+    for i in range(args.filler):
+        cache.store(note_key(f"其他講義 {i % 50}", "gemini-2.5-flash"), f"其他問題 {i} 的內容是什麼", f"答案 {i}", title=f"其他講義 {i % 50}")
+
+    note = note_key("# 第三週：供給與需求", "gemini-2.5-flash")
+    weights = [1 / (rank + 1) for rank in range(len(BASE_QUESTIONS))]
+    calls = mismatched = 0
+    lookups = []
+    for _ in range(args.students):
+        base = rng.choices(range(len(BASE_QUESTIONS)), weights)[0]
+        question = paraphrase(BASE_QUESTIONS[base], rng)
+        start = time.perf_counter()
+        answer = cache.lookup(note, question, title="第三週")
+        lookups.append(time.perf_counter() - start)
+        if answer is None:
+            calls += 1
+            cache.store(note, question, f"答案 {base}", title="第三週")
+        elif answer != f"答案 {base}":
+            mismatched += 1
+
+    lookups.sort()
+    stats = cache.stats("第三週")
+    print(f"🤖 {args.students} 位學生對同一份講義提問 ({len(BASE_QUESTIONS)} 個基本問題隨機改寫)，快取內另有 {args.filler} 筆其他講義的問答")
+    print(f"{'':<16}{'Gemini 呼叫':>12}{'學生等待總秒數':>16}")
+    print(f"{'每次都呼叫':<16}{args.students:>12}{args.students * args.latency:>16.0f}")
+    print(f"{'共用答案快取':<16}{calls:>12}{calls * args.latency:>16.0f}")
+    print(f"🎯 命中率 {stats['hit_rate']:.0%}，誤配 {mismatched} 次；查詢 p50 {percentile(lookups, 0.5) * 1e6:.0f}µs、p95 {percentile(lookups, 0.95) * 1e6:.0f}µs")
+    print("🔝 最常被問：" + "、".join(f"{q} ({n})" for q, n in stats["top"][:5]))
+
+
+if __name__ == "__main__":
+    main()
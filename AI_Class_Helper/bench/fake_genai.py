@@ -0,0 +1,133 @@
+import itertools
+import random
+import sys
+import threading
+import time
+import types
+from collections import Counter
+
+# --- 本機假的 google.generativeai ---
+# 介面與程式中用到的部分相同 (configure / upload_file / get_file / GenerativeModel)，
+# 可設定延遲、429 錯誤注入與固定回傳內容，不需要 API 金鑰也不會花錢。
+
+DEFAULT_NOTE = """1. 📖 課程核心摘要
+本堂課介紹供給與需求的基本概念。
+2. 🔑 關鍵名詞解釋
+| 名詞 | 解釋 |
+|---|---|
+| 需求 | 在各種價格下願意購買的數量 |
+3. 💡 重點觀念詳解
+- 價格上升，需求量下降。
+---TEACHER_ONLY---
+4. 📝 課後隨堂測驗
+5. 💡 學生易錯點提醒
+"""
+
+config = {
+    "upload_latency": 0.0,     # upload_file 花費秒數
+    "processing_polls": 0,     # 上傳後要經過幾次 get_file 才會變成 ACTIVE
+    "latency": 0.0,            # generate_content 花費秒數
+    "error_rate_429": 0.0,     # generate_content 丟出 429 的機率
+    "stream_interval": 0.0,    # stream=True 時每段之間的間隔秒數
+    "text": DEFAULT_NOTE,      # generate_content 回傳內容 (字串，或 f(contents) -> 字串)
+}
+calls = Counter()
+_lock = threading.Lock()
+_files = {}
+_ids = itertools.count(1)
+
+
+def reset(**overrides):
+    with _lock:
+        calls.clear()
+        _files.clear()
+    config.update(upload_latency=0.0, processing_polls=0, latency=0.0, error_rate_429=0.0, stream_interval=0.0, text=DEFAULT_NOTE)
+    config.update(overrides)
+
+
+def _count(name):
+    with _lock:
+        calls[name] += 1
+
+
+class _State:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeFile:
+    def __init__(self, name, path, polls_left):
+        self.name = name
+        self.path = path
+        self.polls_left = polls_left
+
+    @property
+    def state(self):
+        return _State("PROCESSING" if self.polls_left > 0 else "ACTIVE")
+
+
+def configure(api_key=None, **kwargs):
+    _count("configure")
+
+
+def upload_file(path, **kwargs):
+    _count("upload_file")
+    time.sleep(config["upload_latency"])
+    file = FakeFile(f"files/fake-{next(_ids)}", path, config["processing_polls"])
+    with _lock:
+        _files[file.name] = file
+    return file
+
+
+def get_file(name):
+    _count("get_file")
+    with _lock:
+        file = _files.get(name)
+    if file is None:
+        raise Exception(f"404 File {name} not found")
+    if file.polls_left > 0:
+        file.polls_left -= 1
+    return file
+
+
+def delete_file(name):
+    _count("delete_file")
+    with _lock:
+        _files.pop(name, None)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        _count("generate_content")
+        time.sleep(config["latency"])
+        if random.random() < config["error_rate_429"]:
+            _count("errors_429")
+            raise Exception("429 Resource has been exhausted (fake)")
+        text = config["text"](contents) if callable(config["text"]) else config["text"]
+        if stream:
+            return _stream(text)
+        return FakeResponse(text)
+
+
+def _stream(text, pieces=8):
+    # 把回答切成數段依序吐出，每段之間也有延遲，模擬真實串流
+    step = max(1, len(text) // pieces)
+    for i in range(0, len(text), step):
+        time.sleep(config["stream_interval"])
+        yield FakeResponse(text[i:i + step])
+
+
+def install():
+    """把本模組註冊成 google.generativeai，之後 import 到的都是假的後端。"""
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.generativeai = sys.modules[__name__]
+    sys.modules["google"] = google
+    sys.modules["google.generativeai"] = sys.modules[__name__]
@@ -0,0 +1,184 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+
+from live_quiz import FINISHED, QUESTION, LiveQuizHub
+from metrics import percentile
+from quiz_store import QuizResultStore
+
+# --- 即時測驗 (Kahoot 模式) 的負載測試 ---
+# 用法：python bench/load_live_quiz.py [--students 300] [--questions 10] [--time-limit 8] [--think 1 5]
+# 300 個學生執行緒同時連到同一個 LiveQuizHub (等同 300 個 Streamlit session 共用 st.cache_resource 的那一份)：
+# (直接呼叫 hub，不經過 Streamlit 的 fragment 與 rerun；量的是共用狀態與鎖的負載，不含畫面本身；
+#  經過真實 Streamlit session 的端到端延遲見 bench/load_live_quiz_sessions.py)
+#     加入房間 → 每題想 1-5 秒後作答 → 其餘時間照畫面的輪詢間隔讀快照與自己的名次
+# 另有一個訂閱執行緒用 wait_for_update 等狀態改變，量「老師換題 / 揭曉」到訂閱者收到的推送延遲；
+# 老師執行緒逐題推進，全員答完會自動揭曉，最後結束遊戲並把全班成績一次寫進成績庫。
+# 輸出：作答與輪詢呼叫的延遲 p50/p95/max、推送延遲、每題全員答完所需時間、寫入耗時與筆數檢查。
+
+QUIZ_FILE = "即時測驗.json"
+
+
+def make_quiz(n):
+    return [
+        {"question": f"第 {i + 1} 題：價格上升時需求量會？", "options": ["上升", "下降", "不變", "無法判斷"],
+         "answer": "下降", "explanation": "需求法則"}
+        for i in range(n)
+    ]
+
+
+class Timings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.values.setdefault(name, []).append(seconds)
+
+
+def timed(timings, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    timings.add(name, time.perf_counter() - start)
+    return result
+
+
+def student(hub, code, name, think, poll_interval, timings, rng, start_barrier):
+    timed(timings, "join", hub.join, code, name)
+    start_barrier.wait()
+    answered_index = -1
+    while True:
+        snapshot = timed(timings, "poll_snapshot", hub.snapshot, code)
+        timed(timings, "poll_status", hub.player_status, code, name)
+        if snapshot["phase"] == FINISHED:
+            return
+        if snapshot["phase"] == QUESTION and snapshot["index"] != answered_index:
+            answered_index = snapshot["index"]
+            # 看到題目後想一下再作答 (這段時間不輪詢，等同按鈕按下前畫面不變)
+            time.sleep(rng.uniform(*think))
+            option = 1 if rng.random() < 0.7 else rng.randrange(4)
+            timed(timings, "answer", hub.answer, code, name, option)
+            continue
+        time.sleep(poll_interval)
+
+
+def subscriber(hub, code, pushes, stop):
+    # 記下每次狀態改變 (版本號) 被訂閱者收到的時間；老師端在改變前記下發生時間，兩者相減就是推送延遲
+    version = 0
+    while not stop.is_set():
+        snapshot = hub.wait_for_update(code, version, timeout=1.0)
+        if snapshot["version"] > version:
+            pushes[snapshot["version"]] = time.perf_counter()
+            version = snapshot["version"]
+        if snapshot["phase"] == FINISHED:
+            return
+
+
+def advance(hub, code, sent):
+    # 換題前記下「換題後的版本號 → 換題時間」，對照訂閱者收到該版本的時間
+    sent[hub.snapshot(code)["version"] + 1] = time.perf_counter()
+    hub.next_question(code)
+
+
+def teacher(hub, code, n_questions, sent, round_times):
+    for _ in range(n_questions):
+        advance(hub, code, sent)
+        started = time.perf_counter()
+        # 全員答完會自動揭曉；時間到也會由下一個讀取的人揭曉
+        while hub.snapshot(code)["phase"] == QUESTION:
+            time.sleep(0.02)
+        snapshot = hub.snapshot(code)
+        round_times.append((time.perf_counter() - started, snapshot["answered"]))
+        time.sleep(0.5)  # 老師看一下答題分布再換題
+    advance(hub, code, sent)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=300, help="同時作答的學生數")
+    parser.add_argument("--questions", type=int, default=10, help="題數")
+    parser.add_argument("--time-limit", type=int, default=8, help="每題作答秒數")
+    parser.add_argument("--think", type=float, nargs=2, default=(1.0, 5.0), help="學生看到題目後的思考秒數範圍")
+    parser.add_argument("--poll", type=float, default=2.0, help="學生畫面的輪詢間隔 (秒)，與 app.py 的 fragment 相同")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="classroom_live_")
+    try:
+        store = QuizResultStore(os.path.join(workspace, "quiz_results.db"))
+        hub = LiveQuizHub(store)
+        code = hub.create_room(QUIZ_FILE, make_quiz(args.questions), "teacher", time_limit=args.time_limit)
+
+        timings = Timings()
+        barrier = threading.Barrier(args.students + 1)
+        threads = [
+            threading.Thread(
+                target=student, daemon=True,
+                args=(hub, code, f"學生{i:03d}", args.think, args.poll, timings, random.Random(args.seed + i), barrier),
+            )
+            for i in range(args.students)
+        ]
+        pushes, sent, round_times, stop = {}, {}, [], threading.Event()
+        sub = threading.Thread(target=subscriber, args=(hub, code, pushes, stop), daemon=True)
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        barrier.wait()
+        join_wall = time.perf_counter() - start
+        sub.start()
+
+        game_start = time.perf_counter()
+        teacher(hub, code, args.questions, sent, round_times)
+        for t in threads:
+            t.join(timeout=args.time_limit + 10)
+        stop.set()
+        sub.join(timeout=2)
+        game_wall = time.perf_counter() - game_start
+
+        save_start = time.perf_counter()
+        saved = hub.finish(code)
+        save_seconds = time.perf_counter() - save_start
+
+        conn = sqlite3.connect(store.db_path)
+        try:
+            persisted = conn.execute("SELECT COUNT(*) FROM quiz_results WHERE quiz = ?", (QUIZ_FILE,)).fetchone()[0]
+        finally:
+            conn.close()
+        stats = store.get_stats(QUIZ_FILE)
+        final = hub.snapshot(code)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    push_latency = sorted(pushes[v] - t for v, t in sent.items() if v in pushes)
+    alive = sum(t.is_alive() for t in threads)
+    print(f"🎯 {args.students} 位學生、{args.questions} 題、每題 {args.time_limit}s、思考 {args.think[0]:g}-{args.think[1]:g}s、輪詢每 {args.poll:g}s")
+    print(f"🙋 全員加入 {join_wall * 1000:.0f} ms；整場遊戲 {game_wall:.1f}s")
+    print(f"{'呼叫':<16}{'次數':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(timings.values.items()):
+        values.sort()
+        print(f"{name:<16}{len(values):>8}{percentile(values, 0.5) * 1000:>10.3f}{percentile(values, 0.95) * 1000:>10.3f}{values[-1] * 1000:>10.3f}")
+    if push_latency:
+        print(f"📣 換題推送延遲 (wait_for_update)：p50 {percentile(push_latency, 0.5) * 1000:.2f} ms、max {push_latency[-1] * 1000:.2f} ms")
+    for i, (seconds, answered) in enumerate(round_times):
+        print(f"  Q{i + 1}: {answered}/{args.students} 人作答，{seconds:.2f}s 後揭曉")
+    print(f"🏆 前三名：{final['leaderboard'][:3]}")
+    print(f"💾 結束時一次寫入 {saved} 筆，耗時 {save_seconds * 1000:.1f} ms；資料庫實際 {persisted} 筆，統計人數 {stats['count'] if stats else 0}")
+    if alive:
+        print(f"❌ 還有 {alive} 個學生執行緒沒結束")
+    assert persisted == args.students and saved == args.students, "成績寫入筆數不符"
+    assert all(answered == args.students for _, answered in round_times), "有學生的作答沒有被計入"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter, defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from load_live_quiz import make_quiz
+from load_test import APP_PATH, QUIZ_FILE, seed_workspace
+from metrics import percentile
+
+# --- 即時測驗的負載測試：透過 WebSocket 連到真的 `streamlit run` ---
+# 用法：python bench/load_live_quiz_sessions.py [--students 300] [--questions 5] [--time-limit 15] [--think 1 5]
+# 與 bench/load_live_quiz.py (直接呼叫 LiveQuizHub) 不同，這裡啟動一個 Streamlit 伺服器行程，
+# 每位學生是一條獨立的 WebSocket 連線 (= 一個瀏覽器分頁的 session)，照瀏覽器的做法送 BackMsg：
+#     登入 (整頁 rerun) → 切到「🎯 即時測驗」→ 輸入房間代碼與姓名加入 → 依伺服器的 auto_rerun 定時重跑 fragment
+#     → 看到新題目後想 1-5 秒再按選項按鈕 (fragment rerun)
+# 老師也是一條連線：開房間、等全員加入、逐題推進 (全員答完或時間到會自動揭曉)、最後寫入成績。
+# 量的是每次 rerun 從送出到收到 script_finished 的時間 (含伺服器排隊與畫面訊息傳輸)：
+#     student_poll (學生 fragment 定時重跑)、answer (按下選項)、host_poll、login、join 等；
+# 另外回報「輪詢落後」次數：計時到了但上一次 rerun 還沒跑完，這一輪只好跳過。
+# 伺服器套用專案的 .streamlit/config.toml；--server-option runner.postScriptGC=true 可比較 Streamlit 預設值。
+# 伺服器端用 bench/fake_genai.py，不會呼叫真的 Gemini；結束後檢查成績庫筆數。
+
+FINISHED_EARLY_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.Value("FINISHED_EARLY_FOR_RERUN")
+ROOM_CODE_RE = re.compile(r"房間代碼：`(\d+)`")
+PLAYERS_RE = re.compile(r"目前 (\d+) 人")
+QUESTION_RE = re.compile(r"^Q(\d+)/\d+：")
+SERVER_LAUNCHER = (
+    "import sys; sys.path.insert(0, {bench!r}); import fake_genai; fake_genai.install(); "
+    "from streamlit.web import cli; sys.argv = ['streamlit', 'run', {app!r}] + {flags!r}; cli.main()"
+)
+
+
+class Timings:
+    def __init__(self):
+        self.values = defaultdict(list)
+        self.events = Counter()
+
+    def add(self, name, seconds):
+        self.values[name].append(seconds)
+
+
+class Session:
+    """一個瀏覽器分頁：記住畫面上的元件 (標籤 / key → 元件編號與所屬 fragment)、輸入值與定時重跑的 fragment。"""
+
+    def __init__(self, url, timings, poll_name):
+        self.url = url
+        self.timings = timings
+        self.poll_name = poll_name
+        self.widgets = {}
+        self.options = {}       # 下拉選單標籤 -> 選項文字
+        self.states = {}        # 元件編號 -> (欄位, 值)，每次 rerun 都一起送出 (與瀏覽器相同)
+        self.timers = {}        # fragment 編號 -> 間隔秒數 (伺服器送來的 auto_rerun)
+        self.screen = {}        # fragment 編號 ("" 為 fragment 以外) -> 最近一次執行完成時畫面上的文字
+        self._drawing = defaultdict(list)
+        self._running = ()
+        self._done = None
+        self._busy = asyncio.Lock()
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None, ping_interval=None)
+        self._reader = asyncio.create_task(self._read())
+        await self.rerun("cold_start")
+
+    async def close(self):
+        await self.ws.close()
+        self._reader.cancel()
+
+    async def _read(self):
+        async for data in self.ws:
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self._drawing = defaultdict(list)
+                self._running = tuple(msg.new_session.fragment_ids_this_run)
+                # fragment 重跑也會送 new_session；只有整頁重跑時瀏覽器才清掉定時器，再依這次執行送來的 auto_rerun 重設
+                if not msg.new_session.fragment_ids_this_run:
+                    self.timers.clear()
+            elif kind == "auto_rerun":
+                self.timers[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                for fragment_id in msg.stop_auto_rerun.fragment_ids:
+                    self.timers.pop(fragment_id, None)
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._element(msg.delta.new_element, msg.delta.fragment_id)
+            elif kind == "script_finished" and msg.script_finished != FINISHED_EARLY_FOR_RERUN:
+                if self._running:
+                    for fragment_id in self._running:
+                        self.screen[fragment_id] = self._drawing.pop(fragment_id, [])
+                else:
+                    self.screen = dict(self._drawing)
+                if self._done is not None and not self._done.done():
+                    self._done.set_result(None)
+
+    @property
+    def texts(self):
+        return [text for texts in self.screen.values() for text in texts]
+
+    def _element(self, element, fragment_id):
+        kind = element.WhichOneof("type")
+        proto = getattr(element, kind)
+        for field in ("body", "text"):
+            value = getattr(proto, field, None)
+            if isinstance(value, str) and value:
+                self._drawing[fragment_id].append(value)
+        widget_id = getattr(proto, "id", "")
+        if widget_id and hasattr(proto, "label"):
+            self.widgets[proto.label] = (widget_id, fragment_id)
+            self.widgets[widget_id.rsplit("-", 1)[-1]] = (widget_id, fragment_id)  # 元件編號最後一段是 key
+            if kind == "selectbox":
+                self.options[proto.label] = list(proto.options)
+
+    def set_value(self, label, value):
+        self.states[self.widgets[label][0]] = ("string_value", value)
+
+    def set_slider(self, label, value):
+        self.states[self.widgets[label][0]] = ("double_array_value", [float(value)])
+
+    async def rerun(self, name, fragment_id="", click=None, auto=False):
+        async with self._busy:
+            msg = BackMsg()
+            state = msg.rerun_script
+            state.fragment_id = fragment_id
+            state.is_auto_rerun = auto
+            for widget_id, (field, value) in self.states.items():
+                widget = state.widget_states.widgets.add(id=widget_id)
+                if isinstance(value, list):
+                    getattr(widget, field).data.extend(value)  # 滑桿的值是 DoubleArray
+                else:
+                    setattr(widget, field, value)
+            if click is not None:
+                state.widget_states.widgets.add(id=click, trigger_value=True)
+            self._done = asyncio.get_running_loop().create_future()
+            start = time.perf_counter()
+            await self.ws.send(msg.SerializeToString())
+            await self._done
+            self.timings.add(name, time.perf_counter() - start)
+
+    async def click(self, name, label):
+        widget_id, fragment_id = self.widgets[label]
+        await self.rerun(name, fragment_id=fragment_id, click=widget_id)
+
+    async def login(self, username, password):
+        self.set_value("👤 帳號", username)
+        self.set_value("🔑 密碼", password)
+        await self.click("login", "登入系統")
+        self.states.clear()
+
+    async def open_tab(self, tab):
+        self.set_value("功能導覽", tab)
+        await self.rerun("switch_tab")
+
+    async def poll_forever(self):
+        # 與瀏覽器相同：每個 fragment 依自己的間隔定時送出 rerun；上一次還沒跑完就記一次落後
+        due = {}
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            for fragment_id, interval in list(self.timers.items()):
+                next_run = due.setdefault(fragment_id, now + interval)
+                if now < next_run:
+                    continue
+                due[fragment_id] = now + interval
+                if self._busy.locked():
+                    self.timings.events[f"{self.poll_name}_behind"] += 1
+                    continue
+                await self.rerun(self.poll_name, fragment_id=fragment_id, auto=True)
+            await asyncio.sleep(0.05)
+
+    def find(self, pattern):
+        for text in self.texts:
+            match = pattern.search(text)
+            if match:
+                return match
+        return None
+
+
+async def wait_until(session, predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate(session):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"等候畫面逾時，目前畫面：{[t for t in session.texts if len(t) < 200][-8:]}")
+        await asyncio.sleep(0.1)
+
+
+async def student(url, index, code, timings, think, rng, finished):
+    session = Session(url, timings, "student_poll")
+    await session.connect()
+    await session.login("student", "123")
+    await session.open_tab("🎯 即時測驗")
+    session.set_value("🔢 房間代碼", code)
+    session.set_value("👤 姓名或學號", f"學生{index:03d}")
+    await session.click("join", "🚀 加入房間")
+    poller = asyncio.create_task(session.poll_forever())
+    answered = set()
+    try:
+        while not any("測驗結束" in t for t in session.texts):
+            match = next((QUESTION_RE.match(t) for t in session.texts if QUESTION_RE.match(t)), None)
+            question = int(match.group(1)) - 1 if match else None
+            option_key = f"live_option_{question}_0"
+            if question is not None and question not in answered and option_key in session.widgets:
+                answered.add(question)
+                await asyncio.sleep(rng.uniform(*think))
+                choice = 1 if rng.random() < 0.7 else rng.randrange(4)
+                await session.click("answer", f"live_option_{question}_{choice}")
+            await asyncio.sleep(0.1)
+        finished.add(index)
+    finally:
+        poller.cancel()
+        await session.close()
+
+
+async def teacher_open_room(url, timings, time_limit):
+    session = Session(url, timings, "host_poll")
+    await session.connect()
+    await session.login("teacher", "456")
+    await session.open_tab("🎯 即時測驗")
+    label = "選擇要進行的測驗"
+    session.set_value(label, next(o for o in session.options[label] if o.startswith(QUIZ_FILE[:-5])))
+    session.set_slider("⏱️ 每題作答秒數", time_limit)
+    await session.rerun("select")
+    await session.click("open_room", "🚪 開放房間")
+    code = session.find(ROOM_CODE_RE).group(1)
+    return session, code
+
+
+async def teacher_run(session, students, n_questions, time_limit, round_times):
+    poller = asyncio.create_task(session.poll_forever())
+    try:
+        await wait_until(session, lambda s: (m := s.find(PLAYERS_RE)) and int(m.group(1)) == students, 600)
+        await session.click("host_action", "▶️ 開始第一題")
+        for q in range(n_questions):
+            started = time.perf_counter()
+            # 全員答完或時間到時自動揭曉，老師的 fragment 下一次重跑就會看到正確答案
+            await wait_until(session, lambda s: any(t.startswith("正確答案：") for t in s.texts), time_limit + 30)
+            round_times.append(time.perf_counter() - started)
+            await asyncio.sleep(1.0)  # 老師看一下答題分布再換題
+            await session.click("host_action", "➡️ 下一題" if q + 1 < n_questions else "🏁 結束並寫入成績")
+    finally:
+        poller.cancel()
+
+
+def server_cpu_seconds(pid):
+    # Linux 才有 /proc；其他系統回傳 None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workspace, port, options=()):
+    flags = [
+        "--server.port", str(port), "--server.headless", "true", "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ] + [f"--{option}" for option in options]
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER_LAUNCHER.format(bench=BENCH_DIR, app=APP_PATH, flags=flags)],
+        cwd=workspace, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.3)
+    server.kill()
+    raise RuntimeError("Streamlit 伺服器沒有啟動")
+
+
+async def run(args, url):
+    timings, round_times, finished = Timings(), [], set()
+    host, code = await teacher_open_room(url, timings, args.time_limit)
+    joins = []
+    for i in range(args.students):
+        joins.append(asyncio.create_task(
+            student(url, i, code, timings, args.think, random.Random(args.seed + i), finished),
+        ))
+        await asyncio.sleep(1 / args.connect_rate)  # 學生陸續打開網頁，不是同一毫秒
+    game_start = time.perf_counter()
+    await teacher_run(host, args.students, args.questions, args.time_limit, round_times)
+    await asyncio.wait(joins, timeout=30)
+    errors = [t.exception() for t in joins if t.done() and not t.cancelled() and t.exception()]
+    for t in joins:
+        t.cancel()
+    await host.close()
+    return timings, round_times, finished, errors, time.perf_counter() - game_start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=300, help="同時連線的學生 session 數")
+    parser.add_argument("--questions", type=int, default=5, help="題數")
+    parser.add_argument("--time-limit", type=int, default=15, help="每題作答秒數")
+    parser.add_argument("--think", type=float, nargs=2, default=(1.0, 5.0), help="學生看到題目後的思考秒數範圍")
+    parser.add_argument("--connect-rate", type=float, default=20.0, help="每秒新連上的學生數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-option", action="append", default=[], metavar="KEY=VALUE",
+                        help="額外傳給 streamlit run 的設定，例如 runner.postScriptGC=false (可重複)")
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="classroom_live_sessions_")
+    seed_workspace(workspace)
+    # 伺服器在暫存資料夾啟動，帶上專案的 .streamlit/config.toml 才是實際部署的設定
+    shutil.copy(os.path.join(APP_DIR, ".streamlit", "config.toml"), os.path.join(workspace, ".streamlit"))
+    with open(os.path.join(workspace, "shared_quizzes", QUIZ_FILE), "w", encoding="utf-8") as f:
+        json.dump(make_quiz(args.questions), f, ensure_ascii=False)
+    port = free_port()
+    server = start_server(workspace, port, args.server_option)
+    try:
+        cpu_before, client_before = server_cpu_seconds(server.pid), time.process_time()
+        timings, round_times, finished, errors, game_wall = asyncio.run(run(args, f"ws://127.0.0.1:{port}/_stcore/stream"))
+        cpu_after, client_cpu = server_cpu_seconds(server.pid), time.process_time() - client_before
+        conn = sqlite3.connect(os.path.join(workspace, "shared_quizzes", "quiz_results.db"))
+        try:
+            persisted = conn.execute("SELECT COUNT(*) FROM quiz_results WHERE quiz = ?", (QUIZ_FILE,)).fetchone()[0]
+        finally:
+            conn.close()
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"🎯 {args.students} 個學生 session (WebSocket 連到 streamlit run)、{args.questions} 題、每題 {args.time_limit}s、思考 {args.think[0]:g}-{args.think[1]:g}s")
+    server_cpu = f"伺服器 CPU {cpu_after - cpu_before:.1f}s、" if cpu_before is not None else ""
+    print(f"⏱️ 從開始加入到遊戲結束 {game_wall:.1f}s，{server_cpu}壓測端 CPU {client_cpu:.1f}s (兩者在同一台機器上會互搶)")
+    print(f"{'rerun':<14}{'次數':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(timings.values.items()):
+        values.sort()
+        print(f"{name:<14}{len(values):>8}{percentile(values, 0.5) * 1000:>10.0f}{percentile(values, 0.95) * 1000:>10.0f}{values[-1] * 1000:>10.0f}")
+    polls = len(timings.values["student_poll"])
+    behind = timings.events["student_poll_behind"]
+    print(f"🐢 學生輪詢落後 {behind} 次 (占 {behind / max(polls + behind, 1):.1%})，老師 {timings.events['host_poll_behind']} 次")
+    for i, seconds in enumerate(round_times):
+        print(f"  Q{i + 1}: {seconds:.1f}s 後揭曉")
+    print(f"💾 成績庫 {persisted} 筆；看到結束畫面的學生 {len(finished)}/{args.students}")
+    if errors:
+        print(f"❌ {len(errors)} 個學生 session 中途失敗，例如：{errors[0]!r}")
+    assert persisted == args.students and not errors, "有學生沒有完成整場測驗"
+
+
+if __name__ == "__main__":
+    main()
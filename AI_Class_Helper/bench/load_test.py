@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_genai
+fake_genai.install()
+
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+
+from metrics import percentile
+
+# --- 全班同時上線的負載測試 ---
+# 用法：python bench/load_test.py [--sessions 30] [--concurrency 10] [--latency 0.3] [--error-rate 0.05]
+# 以 Streamlit AppTest 模擬多個學生 session，各自走一遍真實流程：
+#     登入 → 載入老師講義 → 問 AI 助教 → 下載 PDF → 在留言板留言 → 作答並交卷
+# 後端是 bench/fake_genai.py (可設定延遲與 429 注入)，不會呼叫真的 Gemini。
+# AppTest 會替換全域的 Runtime 與 st.secrets，同一個行程裡不能平行跑，
+# 因此每個「同時在線」的 session 各用一個子行程，共用同一個資料夾 (等同多個伺服器行程共用資料)。
+# 所有資料寫在暫存資料夾，結束後檢查成績庫與留言分片裡的筆數，回報「寫入遺失」。
+# 輸出：整體吞吐量、各動作的 rerun 耗時 p50/p95/max、動作失敗數與寫入遺失數。
+
+APP_PATH = os.path.join(APP_DIR, "app.py")
+NOTE_FILE = "第一週_供需.md"
+QUIZ_FILE = "第一週_供需.json"
+QUIZ = [
+    {"question": f"第 {i + 1} 題：價格上升時需求量會？", "options": ["上升", "下降", "不變", "無法判斷"],
+     "answer": "下降", "explanation": "需求法則"}
+    for i in range(10)
+]
+
+# AppTest 每次 rerun 都重新編譯 app.py；真正的伺服器整個行程共用一份編譯結果，這裡比照辦理。
+_bytecode = {}
+_original_get_bytecode = ScriptCache.get_bytecode
+
+
+def _shared_get_bytecode(self, script_path):
+    if script_path not in _bytecode:
+        _bytecode[script_path] = _original_get_bytecode(self, script_path)
+    return _bytecode[script_path]
+
+
+ScriptCache.get_bytecode = _shared_get_bytecode
+
+
+def seed_workspace(workspace):
+    os.makedirs(os.path.join(workspace, "shared_notes"), exist_ok=True)
+    os.makedirs(os.path.join(workspace, "shared_quizzes"), exist_ok=True)
+    os.makedirs(os.path.join(workspace, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workspace, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write('GOOGLE_API_KEY = "fake"\n')
+    with open(os.path.join(workspace, "shared_notes", NOTE_FILE), "w", encoding="utf-8") as f:
+        f.write(fake_genai.DEFAULT_NOTE)
+    with open(os.path.join(workspace, "shared_quizzes", QUIZ_FILE), "w", encoding="utf-8") as f:
+        json.dump(QUIZ, f, ensure_ascii=False)
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.failures = Counter()
+        self.writes = Counter()
+
+    def run(self, at, action):
+        """執行一次 rerun 並記錄耗時；回傳是否成功 (沒有例外)。"""
+        start = time.perf_counter()
+        at.run()
+        self.timings[action].append(time.perf_counter() - start)
+        if at.exception:
+            self.failures[action] += 1
+            return False
+        return True
+
+    def wrote(self, store):
+        self.writes[store] += 1
+
+    def as_dict(self):
+        return {"timings": dict(self.timings), "failures": dict(self.failures), "writes": dict(self.writes)}
+
+    def merge(self, data):
+        for action, values in data["timings"].items():
+            self.timings[action].extend(values)
+        self.failures.update(data["failures"])
+        self.writes.update(data["writes"])
+
+
+def simulate_student(index, recorder, pdf_available):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    recorder.run(at, "cold_start")
+    at.text_input[0].input("student")
+    at.text_input[1].input("123")
+    at.button[0].click()
+    if not recorder.run(at, "login"):
+        return
+
+    # 載入老師講義
+    at.radio[0].set_value("📖 老師分享的講義")
+    recorder.run(at, "switch_tab")
+    next(s for s in at.selectbox if "複習" in s.label).set_value(NOTE_FILE)
+    recorder.run(at, "select")
+    next(b for b in at.button if "載入講義內容" in b.label).click()
+    if not recorder.run(at, "load_note"):
+        return
+
+    # AI 助教 (串流回答)
+    at.chat_input[0].set_value(f"請用更簡單的例子解釋需求法則 ({index})")
+    recorder.run(at, "tutor_chat")
+
+    # PDF 下載 (需要 WeasyPrint；沒有安裝時會顯示錯誤，不算在失敗數裡)
+    pdf_buttons = [b for b in at.button if "產生 PDF" in b.label]
+    if pdf_buttons and pdf_available:
+        pdf_buttons[0].click()
+        recorder.run(at, "pdf")
+
+    # 留言板
+    at.radio[0].set_value("💬 師生留言板")
+    recorder.run(at, "switch_tab")
+    next(s for s in at.selectbox if "提問" in s.label).set_value(NOTE_FILE)
+    recorder.run(at, "select")
+    at.text_input(key="student_comment_input").input(f"同學 {index} 的問題")
+    next(b for b in at.button if "送出給老師" in b.label).click()
+    if recorder.run(at, "post_comment"):
+        recorder.wrote("comments")
+
+    # 互動測驗
+    at.radio[0].set_value("🎮 互動測驗")
+    recorder.run(at, "switch_tab")
+    next(s for s in at.selectbox if "挑戰" in s.label).set_value(QUIZ_FILE)
+    recorder.run(at, "select")
+    next(t for t in at.text_input if "姓名" in t.label).input(f"學生{index:03d}")
+    for i in range(len(QUIZ)):
+        radio = at.radio(key=f"q_{i}")
+        radio.set_value(radio.options[index % len(radio.options)])
+    next(b for b in at.button if "交卷" in b.label).click()
+    if recorder.run(at, "submit_quiz"):
+        recorder.wrote("quiz_results")
+
+
+def _init_worker(workspace, latency, error_rate):
+    os.chdir(workspace)
+    fake_genai.reset(latency=latency, error_rate_429=error_rate, stream_interval=latency / 8)
+
+
+def run_session(index, pdf_available):
+    """子行程執行一個 session；回傳 (紀錄, 假 Gemini 呼叫次數, 例外或 None)。"""
+    recorder = Recorder()
+    fake_genai.calls.clear()
+    error = None
+    # AppTest 執行時會把 sys.modules["__main__"] 換成 app.py，結束後要換回來，行程池才找得到這支程式的函式
+    main_module = sys.modules["__main__"]
+    try:
+        simulate_student(index, recorder, pdf_available)
+    except Exception as e:
+        error = repr(e)
+    finally:
+        sys.modules["__main__"] = main_module
+    return recorder.as_dict(), dict(fake_genai.calls), error
+
+
+def count_persisted(workspace):
+    conn = sqlite3.connect(os.path.join(workspace, "shared_quizzes", "quiz_results.db"))
+    try:
+        quiz_rows = conn.execute("SELECT COUNT(*) FROM quiz_results WHERE quiz = ?", (QUIZ_FILE,)).fetchone()[0]
+    finally:
+        conn.close()
+    shard = os.path.join(workspace, "shared_notes", "comments", f"{NOTE_FILE}.jsonl")
+    with open(shard, "r", encoding="utf-8") as f:
+        comment_rows = sum(1 for line in f if line.strip())
+    return {"quiz_results": quiz_rows, "comments": comment_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=30, help="模擬的學生 session 數")
+    parser.add_argument("--concurrency", type=int, default=10, help="同時進行的 session 數 (子行程數)")
+    parser.add_argument("--latency", type=float, default=0.3, help="假 Gemini 每次回應延遲 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="假 Gemini 回傳 429 的機率")
+    parser.add_argument("--keep", action="store_true", help="保留暫存資料夾以便檢查")
+    args = parser.parse_args()
+
+    try:
+        import weasyprint  # noqa: F401
+        pdf_available = True
+    except Exception:
+        pdf_available = False
+
+    workspace = tempfile.mkdtemp(prefix="classroom_load_")
+    seed_workspace(workspace)
+    recorder = Recorder()
+    calls = Counter()
+    session_errors = []
+    try:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=args.concurrency, initializer=_init_worker, initargs=(workspace, args.latency, args.error_rate),
+        ) as pool:
+            futures = [pool.submit(run_session, i, pdf_available) for i in range(args.sessions)]
+            for future in futures:
+                session_record, session_calls, error = future.result()
+                recorder.merge(session_record)
+                calls.update(session_calls)
+                if error:
+                    session_errors.append(error)
+        wall = time.perf_counter() - start
+        persisted = count_persisted(workspace)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    total_reruns = sum(len(v) for v in recorder.timings.values())
+    print(f"🧪 {args.sessions} 個 session (同時 {args.concurrency} 個)，假 Gemini 延遲 {args.latency}s、429 機率 {args.error_rate:.0%}")
+    print(f"⏱️ 總耗時 {wall:.1f}s，共 {total_reruns} 次 rerun → {total_reruns / wall:.1f} rerun/s，{args.sessions / wall * 60:.1f} session/分鐘")
+    print(f"{'動作':<14}{'次數':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'失敗':>6}")
+    for action, values in sorted(recorder.timings.items(), key=lambda x: -sum(x[1])):
+        values.sort()
+        print(f"{action:<14}{len(values):>6}{percentile(values, 0.5) * 1000:>10.0f}{percentile(values, 0.95) * 1000:>10.0f}"
+              f"{values[-1] * 1000:>10.0f}{recorder.failures[action]:>6}")
+    for store, expected in recorder.writes.items():
+        lost = expected - persisted[store]
+        print(f"💾 {store}: 送出 {expected} 筆，實際寫入 {persisted[store]} 筆，遺失 {lost} 筆")
+    print(f"🤖 假 Gemini 呼叫：{dict(calls)}")
+    if not pdf_available:
+        print("ℹ️ 沒有安裝 WeasyPrint，略過 PDF 下載。")
+    if args.keep:
+        print(f"📂 資料保留在 {workspace}")
+    if session_errors:
+        print(f"❌ {len(session_errors)} 個 session 中途失敗，例如：{session_errors[0]}")
+    assert all(recorder.writes[s] == persisted[s] for s in recorder.writes), "有寫入遺失"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_genai
+
+import audio_tools
+import live_notes
+import prompts
+from ai_cache import AICache
+from ai_engine import configure, note_from_transcript, transcribe_audio
+from metrics import percentile
+
+# --- 即時筆記模擬器：把一份長錄音「即時」回放給 LiveNoteSession ---
+# 用法：python bench/replay_live_notes.py [--audio 錄音檔] [--minutes 20] [--segment-seconds 120] [--speed 10]
+# 依錄音時間軸每隔 segment-seconds 切出一段送進即時筆記 (等同老師每錄完一段按停止送出)，--speed 1 就是真實時間。
+# 沒有給 --audio 時用 ffmpeg 產生一段合成錄音；沒有給 --api-key 時使用假 Gemini，
+# 附錄音的呼叫延遲 = audio-base + audio-rtf x 錄音秒數 (錄音越長越慢)，純文字呼叫固定 text-latency 秒。
+# 輸出：每段從送出到聽寫完、到併入草稿的延遲，以及「停止錄音 → 完整講義」的時間，
+# 並與舊流程 (下課後才把整份錄音送去分析) 比較。
+
+MODEL = "gemini-2.5-flash"
+
+
+def synthesize_audio(path, seconds):
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+         "-ac", "1", "-ar", "16000", path],
+        check=True,
+    )
+
+
+def fake_backend(audio_base, audio_rtf, text_latency):
+    def respond(contents):
+        files = [part for part in contents if not isinstance(part, str)] if isinstance(contents, list) else []
+        if files:
+            seconds = audio_tools.probe_duration(files[0].path)
+            time.sleep(audio_base + audio_rtf * seconds)
+            return "\n".join(f"[{audio_tools.format_timestamp(t)}] 老師講解第 {t // 15 + 1} 個重點。" for t in range(0, int(seconds), 15))
+        time.sleep(text_latency)
+        return fake_genai.DEFAULT_NOTE
+    fake_genai.reset(text=respond)
+
+
+def replay(session, audio_path, duration, segment_seconds, speed, workspace):
+    """依錄音時間軸把每一段在「錄完的那一刻」送進即時筆記；回傳每段送出的時間。"""
+    start = time.monotonic()
+    sent = []
+    begin = 0.0
+    index = 0
+    while begin < duration:
+        end = min(begin + segment_seconds, duration)
+        time.sleep(max(0.0, start + end / speed - time.monotonic()))
+        path = audio_tools.extract_segment(audio_path, begin, end, os.path.join(workspace, f"live_{index:03d}.mp3"))
+        session.add_segment(path, duration=end - begin)
+        sent.append(time.time())
+        print(f"  ⏺️ 第 {index + 1} 段送出 ({audio_tools.format_timestamp(begin)} – {audio_tools.format_timestamp(end)})", flush=True)
+        begin, index = end, index + 1
+    return sent
+
+
+def watch_drafts(session, draft_times, stop):
+    # 記下草稿第一次涵蓋到每一段的時間
+    while not stop.is_set():
+        through = session.snapshot()["draft_through"]
+        now = time.time()
+        for i in range(len(draft_times), through):
+            draft_times.append(now)
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", help="要回放的錄音檔 (預設產生合成錄音)")
+    parser.add_argument("--minutes", type=float, default=20, help="合成錄音長度 (分鐘)")
+    parser.add_argument("--segment-seconds", type=float, default=120, help="每段錄音長度 (秒)")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍數 (1 = 真實時間)")
+    parser.add_argument("--audio-base", type=float, default=3.0, help="假 Gemini：附錄音呼叫的固定延遲 (秒)")
+    parser.add_argument("--audio-rtf", type=float, default=0.05, help="假 Gemini：每秒錄音增加的處理秒數")
+    parser.add_argument("--text-latency", type=float, default=4.0, help="假 Gemini：純文字呼叫延遲 (秒)")
+    parser.add_argument("--api-key", help="改用真的 Gemini")
+    args = parser.parse_args()
+
+    if not audio_tools.has_ffmpeg():
+        print("❌ 需要 ffmpeg 才能切出回放段落。")
+        return
+    if args.api_key:
+        configure(args.api_key)
+    else:
+        fake_genai.install()
+        fake_backend(args.audio_base, args.audio_rtf, args.text_latency)
+
+    with tempfile.TemporaryDirectory(prefix="classroom_live_notes_") as workspace:
+        audio_path = args.audio
+        if audio_path is None:
+            audio_path = os.path.join(workspace, "lecture.wav")
+            synthesize_audio(audio_path, args.minutes * 60)
+        duration = audio_tools.probe_duration(audio_path)
+        cache = AICache(os.path.join(workspace, "ai_cache.db"))
+        hub = live_notes.LiveNoteHub(cache)
+        session = hub.start("teacher", MODEL, "teacher", prompts.OUTPUT_LANGUAGES[0])
+
+        print(f"🎙️ 回放 {audio_tools.format_timestamp(duration)} 的錄音，每段 {args.segment_seconds:g}s，速度 x{args.speed:g}")
+        draft_times, stop = [], threading.Event()
+        watcher = threading.Thread(target=watch_drafts, args=(session, draft_times, stop), daemon=True)
+        watcher.start()
+        sent = replay(session, audio_path, duration, args.segment_seconds, args.speed, workspace)
+
+        stopped = time.time()
+        session.stop()
+        while session.snapshot()["status"] == live_notes.FINALIZING:
+            time.sleep(0.05)
+        stop_to_note = time.time() - stopped
+        stop.set()
+        watcher.join()
+        snapshot = session.snapshot()
+        transcribed = [s["transcribed"] for s in session.segments]
+
+        # 舊流程：下課後才把整份錄音送去分析
+        start = time.perf_counter()
+        baseline_prompt = prompts.note_prompt("teacher", prompts.OUTPUT_LANGUAGES[0])
+        note_from_transcript(MODEL, transcribe_audio(MODEL, audio_path), baseline_prompt)
+        baseline = time.perf_counter() - start
+
+    if snapshot["status"] != live_notes.DONE:
+        print(f"❌ 即時筆記失敗：{snapshot['error']}")
+        return
+    segment_lag = sorted(t - s for s, t in zip(sent, transcribed))
+    draft_lag = sorted(t - s for s, t in zip(sent, draft_times))
+    print(f"📝 段落送出 → 聽寫完成：p50 {percentile(segment_lag, 0.5):.1f}s、max {segment_lag[-1]:.1f}s ({len(segment_lag)} 段)")
+    if draft_lag:
+        print(f"🗒️ 段落送出 → 併入草稿：p50 {percentile(draft_lag, 0.5):.1f}s、max {draft_lag[-1]:.1f}s (草稿涵蓋 {len(draft_lag)} 段)")
+    print(f"⏹️ 停止錄音 → 完整講義：{stop_to_note:.1f}s")
+    print(f"🐢 舊流程 (下課後整份錄音分析)：{baseline:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
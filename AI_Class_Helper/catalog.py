@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+
+import metrics
+
+# --- 已發布講義 / 測驗目錄 ---
+# 記錄每個檔案的標題、發布時間、大小、內容雜湊，以及講義是否有對應的互動測驗。
+# 目錄的 mtime 沒變就直接使用行程內快取；變了才重新掃描，且大小與修改時間都沒變的檔案不會重算雜湊。
+# 索引同時寫到 index_path (不可放在被掃描的資料夾內)，伺服器重啟後不必重新計算。
+
+NOTE_SUFFIX = ".md"
+QUIZ_SUFFIX = ".json"
+QUIZ_EXCLUDE = {"quiz_results.json"}
+SORT_KEYS = {
+    "newest": (lambda e: e["created"], True),
+    "oldest": (lambda e: e["created"], False),
+    "title": (lambda e: e["title"], False),
+}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Catalog:
+    def __init__(self, notes_dir, quiz_dir, index_path):
+        self.dirs = {"notes": (notes_dir, NOTE_SUFFIX, set()), "quizzes": (quiz_dir, QUIZ_SUFFIX, QUIZ_EXCLUDE)}
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._state = {"notes": {"dir_mtime": None, "entries": {}}, "quizzes": {"dir_mtime": None, "entries": {}}}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def _entry(self, path, name, suffix, old=None):
+        info = os.stat(path)
+        if old and old["size"] == info.st_size and old["mtime_ns"] == info.st_mtime_ns:
+            return old
+        return {
+            "file": name,
+            "title": name[: -len(suffix)],
+            # 覆寫發布時保留第一次發布的時間
+            "created": old["created"] if old else info.st_mtime,
+            "mtime_ns": info.st_mtime_ns,
+            "size": info.st_size,
+            "sha256": file_sha256(path),
+        }
+
+    def _refresh(self, kind):
+        directory, suffix, exclude = self.dirs[kind]
+        dir_mtime = os.stat(directory).st_mtime_ns
+        state = self._state[kind]
+        if state["dir_mtime"] == dir_mtime:
+            return False
+        metrics.count("catalog.rescan")
+        old_entries = state["entries"]
+        entries = {}
+        for name in os.listdir(directory):
+            if not name.endswith(suffix) or name in exclude:
+                continue
+            try:
+                entries[name] = self._entry(os.path.join(directory, name), name, suffix, old_entries.get(name))
+            except FileNotFoundError:
+                continue
+        state.update(dir_mtime=dir_mtime, entries=entries)
+        return True
+
+    def _save(self):
+        with metrics.span("catalog.save"):
+            self._write_index()
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _ensure_fresh(self):
+        changed = self._refresh("notes")
+        changed = self._refresh("quizzes") or changed
+        if changed:
+            self._save()
+
+    def record(self, kind, name):
+        """發布 (或覆寫) 檔案後呼叫：覆寫不會改變目錄 mtime，所以直接更新這一筆。"""
+        directory, suffix, _ = self.dirs[kind]
+        with self._lock:
+            self._ensure_fresh()
+            entries = self._state[kind]["entries"]
+            entries[name] = self._entry(os.path.join(directory, name), name, suffix, entries.get(name))
+            self._save()
+            return dict(entries[name])
+
+    def query(self, kind, sort="newest", offset=0, limit=None):
+        """依排序方式取出一頁目錄項目；講義項目另外附上 has_quiz。"""
+        with self._lock:
+            self._ensure_fresh()
+            entries = [dict(e) for e in self._state[kind]["entries"].values()]
+            quiz_files = set(self._state["quizzes"]["entries"])
+        key, reverse = SORT_KEYS[sort]
+        entries.sort(key=key, reverse=reverse)
+        if kind == "notes":
+            for e in entries:
+                e["has_quiz"] = f"{e['title']}{QUIZ_SUFFIX}" in quiz_files
+        end = None if limit is None else offset + limit
+        return entries[offset:end]
+
+    def count(self, kind):
+        with self._lock:
+            self._ensure_fresh()
+            return len(self._state[kind]["entries"])
+
+    def get(self, kind, name):
+        with self._lock:
+            self._ensure_fresh()
+            entry = self._state[kind]["entries"].get(name)
+            return dict(entry) if entry else None
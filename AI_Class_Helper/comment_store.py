@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，退回單純的 O_APPEND 寫入
+    fcntl = None
+
+import metrics
+
+# --- 留言板儲存庫：每份講義一個 JSONL 分片 ---
+# shared_notes/comments/<講義檔名>.jsonl，一行一則留言，只會附加不會重寫。
+# 行程內快取以 (mtime, size) 為鍵；檔案變大時只讀新增的尾段，不用重新解析整串歷史。
+
+
+class CommentStore:
+    def __init__(self, comments_dir):
+        self.comments_dir = comments_dir
+        os.makedirs(comments_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache = {}  # 講義檔名 -> {"mtime", "size", "offset", "messages"}
+
+    def _shard_path(self, lecture):
+        return os.path.join(self.comments_dir, f"{lecture}.jsonl")
+
+    def append(self, lecture, role, content):
+        with metrics.span("comments.append"):
+            self._append(lecture, role, content)
+
+    def _append(self, lecture, role, content):
+        line = (json.dumps({"role": role, "content": content}, ensure_ascii=False) + "\n").encode("utf-8")
+        fd = os.open(self._shard_path(lecture), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            # 一次 write 寫完整行；再加上檔案鎖，多行程同時留言也不會交錯
+            if fcntl: fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, line)
+        finally:
+            if fcntl: fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def get_messages(self, lecture):
+        return list(self._refresh(lecture))
+
+    def read_since(self, lecture, cursor):
+        """回傳 cursor (已讀則數) 之後的新留言與新的 cursor。"""
+        messages = self._refresh(lecture)
+        return messages[cursor:], len(messages)
+
+    def _refresh(self, lecture):
+        path = self._shard_path(lecture)
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            entry = self._cache.get(lecture)
+            if entry and entry["mtime"] == info.st_mtime_ns and entry["size"] == info.st_size:
+                return entry["messages"]
+            if not entry or info.st_size < entry["offset"]:
+                # 第一次讀取或檔案被截短/重建 → 整份重讀
+                entry = {"offset": 0, "messages": []}
+            with metrics.span("comments.read"):
+                with open(path, "rb") as f:
+                    f.seek(entry["offset"])
+                    chunk = f.read(info.st_size - entry["offset"])
+                # 只處理到最後一個換行，半行 (正在寫入中) 留待下次
+                end = chunk.rfind(b"\n") + 1
+                new_messages = [json.loads(l) for l in chunk[:end].decode("utf-8").splitlines() if l.strip()]
+            entry = {
+                "mtime": info.st_mtime_ns,
+                "size": info.st_size,
+                "offset": entry["offset"] + end,
+                "messages": entry["messages"] + new_messages,
+            }
+            self._cache[lecture] = entry
+            return entry["messages"]
+
+    def migrate_from_json(self, json_path):
+        """一次性把舊版 comments.json 拆成各講義的分片，回傳匯入則數。"""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        count = 0
+        for lecture, comments in legacy.items():
+            if os.path.exists(self._shard_path(lecture)):
+                continue
+            tmp_path = self._shard_path(lecture) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for c in comments:
+                    f.write(json.dumps({"role": c["role"], "content": c["content"]}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self._shard_path(lecture))
+            count += len(comments)
+        try: os.replace(json_path, json_path + ".migrated")
+        except OSError: pass
+        return count
@@ -0,0 +1,168 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import as_completed
+
+import metrics
+from publishing import make_display_note
+
+# --- 期末課程包 (ZIP) ---
+# 內容：講義合輯 PDF、每份講義的 PDF 與 Markdown、所有測驗 JSON、成績試算表 (CSV，Excel 可直接開啟)。
+# 在背景工作裡執行：PDF 交給 PdfCache 的行程池平行排版，內容沒變的 PDF 直接沿用快取；
+# 每個檔案逐塊寫進硬碟上的 ZIP (PDF 從快取檔複製、成績逐筆寫出)，不會把整個課程包放在記憶體裡。
+# 整包以「所有講義、測驗的內容雜湊 + 成績版本」為鍵，什麼都沒變時直接沿用上次產生的 ZIP。
+
+PAGE_BREAK = '\n\n<div style="page-break-before: always"></div>\n\n'
+COMBINED_PDF = "講義合輯.pdf"
+RESULTS_SUMMARY = "成績/成績總表.csv"
+KEEP_PACKS = 3
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def pack_key(catalog, quiz_store, view="teacher"):
+    notes = [(e["file"], e["sha256"]) for e in catalog.query("notes", sort="oldest")]
+    quizzes = [(e["file"], e["sha256"]) for e in catalog.query("quizzes", sort="oldest")]
+    payload = json.dumps([view, notes, quizzes, quiz_store.results_version()], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def pack_path(out_dir, key):
+    return os.path.join(out_dir, f"{key}.zip")
+
+
+def _answer_letters(encoded, n_questions):
+    # 沒有逐題作答紀錄、或題數對不上 (測驗被重新出題) 的成績只匯出分數
+    if not encoded or len(encoded) != n_questions:
+        return [""] * n_questions
+    return ["" if a == "-" else chr(ord("A") + int(a)) for a in encoded]
+
+
+def _stored(name):
+    # PDF 本身已經壓縮過，不再 deflate
+    return zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+
+
+def _copy_pdf(zf, name, path):
+    with open(path, "rb") as src, zf.open(_stored(name), "w") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+
+
+def _write_pdf(zf, name, pdf_cache, md_content, view, future):
+    # 排版完成的檔案通常已寫進快取，逐塊複製；回呼還沒寫完時才直接用排版結果
+    path = pdf_cache.cached_path(md_content, view)
+    if path is None:
+        zf.writestr(_stored(name), future.result())
+    else:
+        _copy_pdf(zf, name, path)
+
+
+def _write_results(zf, quiz_dir, quizzes, quiz_store):
+    with zf.open(RESULTS_SUMMARY, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["測驗", "人數", "平均分數", "逐題答對率"])
+        for entry in quizzes:
+            stats = quiz_store.get_stats(entry["file"])
+            if not stats:
+                writer.writerow([entry["title"], 0, "", ""])
+                continue
+            rates = " / ".join(f"Q{i + 1} {r:.0%}" for i, r in enumerate(stats["correct_rate"]))
+            writer.writerow([entry["title"], stats["count"], f"{stats['mean']:.1f}", rates])
+
+    for entry in quizzes:
+        with open(os.path.join(quiz_dir, entry["file"]), "r", encoding="utf-8") as f:
+            n_questions = len(json.load(f))
+        with zf.open(f"成績/{entry['title']}.csv", "w") as raw, io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["姓名/學號", "分數", "交卷時間"] + [f"Q{i + 1}" for i in range(n_questions)])
+            for row in quiz_store.iter_results(entry["file"]):
+                writer.writerow([row["name"], row["score"], row["timestamp"]] + _answer_letters(row["answers"], n_questions))
+
+
+def build_course_pack(shared_dir, quiz_dir, catalog, quiz_store, pdf_cache, out_dir, view="teacher", report=None):
+    """產生 (或沿用) 課程包，回傳 {"path", "key", "size", "reused", "notes", "quizzes", "pdf_reused", "pdf_failed"}。
+
+    report(訊息, 進度 0-1) 用來回報進度 (背景工作的 report)。
+    有 PDF 排版失敗時仍會產生課程包 (含 Markdown)，但不會被當成完整版沿用，下次會重新嘗試排版。
+    """
+    report = report or (lambda message=None, progress=None: None)
+    os.makedirs(out_dir, exist_ok=True)
+    key = pack_key(catalog, quiz_store, view)
+    path = pack_path(out_dir, key)
+    notes = catalog.query("notes", sort="oldest")
+    quizzes = catalog.query("quizzes", sort="oldest")
+    summary = {"path": path, "key": key, "notes": len(notes), "quizzes": len(quizzes), "pdf_reused": 0, "pdf_failed": 0}
+    if os.path.exists(path):
+        os.utime(path)
+        metrics.count("course_pack.reused")
+        return dict(summary, size=os.path.getsize(path), reused=True)
+
+    # 先把所有 PDF 排入行程池 (已有快取的直接沿用)，排版的同時寫入其他檔案
+    report("🖨️ 排版講義 PDF 中...", 0.0)
+    pending = {}
+    combined = []
+    for entry in notes:
+        with open(os.path.join(shared_dir, entry["file"]), "r", encoding="utf-8") as f:
+            md_content = make_display_note(f.read(), view)
+        combined.append(f"# {entry['title']}\n\n{md_content}")
+        pending[f"講義/{entry['title']}.pdf"] = md_content
+    if combined:
+        pending[COMBINED_PDF] = PAGE_BREAK.join(combined)
+    del combined
+    cached = {}
+    futures = {}
+    for name, md_content in pending.items():
+        cached_pdf = pdf_cache.cached_path(md_content, view)
+        if cached_pdf is not None:
+            cached[name] = cached_pdf
+        else:
+            futures[pdf_cache.submit(md_content, view)] = name
+    summary["pdf_reused"] = len(cached)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with metrics.span("course_pack.build"), zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for entry in notes:
+                zf.write(os.path.join(shared_dir, entry["file"]), f"講義/{entry['file']}")
+            for entry in quizzes:
+                zf.write(os.path.join(quiz_dir, entry["file"]), f"測驗/{entry['file']}")
+            report("📊 匯出成績試算表中...", 0.05)
+            _write_results(zf, quiz_dir, quizzes, quiz_store)
+
+            for name, cached_pdf in cached.items():
+                _copy_pdf(zf, name, cached_pdf)
+            for done, future in enumerate(as_completed(futures), start=1):
+                name = futures[future]
+                if future.exception() is not None:
+                    # 沒有 WeasyPrint 或排版失敗時，課程包仍包含 Markdown 版本
+                    summary["pdf_failed"] += 1
+                else:
+                    _write_pdf(zf, name, pdf_cache, pending[name], view, future)
+                report(f"🖨️ PDF {done}/{len(futures)}：{name}", 0.1 + 0.9 * done / len(futures))
+        partial_path = os.path.join(out_dir, f"{key}.partial.zip")
+        if summary["pdf_failed"]:
+            path = summary["path"] = partial_path
+        os.replace(tmp_path, path)
+        if path != partial_path and os.path.exists(partial_path):
+            os.remove(partial_path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    _evict(out_dir)
+    return dict(summary, size=os.path.getsize(path), reused=False)
+
+
+def _evict(out_dir, keep=KEEP_PACKS):
+    packs = sorted(
+        (os.path.join(out_dir, name) for name in os.listdir(out_dir) if name.endswith(".zip")),
+        key=os.path.getmtime, reverse=True,
+    )
+    for path in packs[keep:]:
+        try: os.remove(path)
+        except OSError: pass
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# --- 背景工作佇列 ---
+# 生成講義、出題等耗時工作交給整個伺服器行程共用的工作池執行，
+# Streamlit 腳本只拿到一個工作編號並定時查詢，切換頁面、rerun 或重新整理都不會中斷或重複執行。
+# 每個工作的狀態與結果都會寫入 jobs/<編號>.json，伺服器重啟後仍查得到。
+# 已結束的工作只保留一段時間與固定筆數，較舊的連同 json 檔一起清掉。
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+DEDUPE_DONE_SECONDS = 10 * 60           # 剛完成的工作在這段時間內仍算重複 (連點、rerun)；之後重新送出會重跑
+KEEP_FINISHED_SECONDS = 7 * 24 * 3600
+MAX_FINISHED_JOBS = 500
+
+
+class JobManager:
+    def __init__(self, jobs_dir, max_workers=2):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._load()
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _load(self):
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job["status"] in (QUEUED, RUNNING):
+                # 上一個行程結束時還沒跑完的工作已經無法接續
+                job.update(status=FAILED, error="伺服器重新啟動，工作中斷，請重新送出。", finished=time.time())
+                self._save(job)
+            self._jobs[job["id"]] = job
+        self._prune()
+
+    def _prune(self):
+        # 呼叫時必須持有鎖 (或在建構時)；排隊中、執行中的工作不會被清掉
+        now = time.time()
+        finished = sorted(
+            (j for j in self._jobs.values() if j["status"] in (DONE, FAILED)),
+            key=lambda j: j["finished"] or j["created"], reverse=True,
+        )
+        for rank, job in enumerate(finished):
+            if rank < MAX_FINISHED_JOBS and now - (job["finished"] or job["created"]) <= KEEP_FINISHED_SECONDS:
+                continue
+            del self._jobs[job["id"]]
+            try:
+                os.remove(self._path(job["id"]))
+            except OSError:
+                pass
+
+    def _save(self, job):
+        with metrics.span("jobs.save"):
+            self._write(job)
+
+    def _write(self, job):
+        tmp_path = self._path(job["id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            self._save(job)
+
+    def submit(self, kind, owner, title, fn, *args, dedupe_key=None, on_duplicate=None, **kwargs):
+        """送出工作並回傳工作編號。fn(report, *args, **kwargs) 的回傳值 (需可轉成 JSON) 即為工作結果。
+
+        相同 dedupe_key 的工作還在排隊、執行中，或在 DEDUPE_DONE_SECONDS 內剛完成時，
+        會直接回傳原本的編號，不會重複執行；此時會呼叫 on_duplicate()，讓呼叫端清掉原本要交給工作的資源 (例如暫存檔)。
+        """
+        with self._lock:
+            existing = self._find(dedupe_key)
+            if not existing:
+                self._prune()
+                job_id = uuid.uuid4().hex[:12]
+                job = {
+                    "id": job_id, "kind": kind, "owner": owner, "title": title, "dedupe_key": dedupe_key,
+                    "status": QUEUED, "progress": 0.0, "message": "排隊中...",
+                    "created": time.time(), "started": None, "finished": None, "result": None, "error": None,
+                }
+                self._jobs[job_id] = job
+                self._save(job)
+        if existing:
+            if on_duplicate: on_duplicate()
+            return existing
+        self._pool.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def find(self, dedupe_key):
+        """回傳相同 dedupe_key、還在進行或剛完成的工作編號，沒有則回傳 None。"""
+        with self._lock:
+            return self._find(dedupe_key)
+
+    def _find(self, dedupe_key):
+        if dedupe_key is None:
+            return None
+        now = time.time()
+        for job in self._jobs.values():
+            if job.get("dedupe_key") != dedupe_key:
+                continue
+            if job["status"] in (QUEUED, RUNNING) or (job["status"] == DONE and now - job["finished"] <= DEDUPE_DONE_SECONDS):
+                return job["id"]
+        return None
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status=RUNNING, started=time.time(), message="執行中...")
+
+        def report(message=None, progress=None):
+            fields = {}
+            if message is not None: fields["message"] = message
+            if progress is not None: fields["progress"] = progress
+            self._update(job_id, **fields)
+
+        try:
+            # 每種工作的整體耗時 (例如 job.note、job.quiz)；失敗次數記在 job.<種類>.errors
+            with metrics.span(f"job.{self._jobs[job_id]['kind']}"):
+                result = fn(report, *args, **kwargs)
+            self._update(job_id, status=DONE, result=result, progress=1.0, message="完成", finished=time.time())
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), message="失敗", finished=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def has_active(self, owner):
+        """owner 是否有排隊中或執行中的工作。"""
+        with self._lock:
+            return any(j["owner"] == owner and j["status"] in (QUEUED, RUNNING) for j in self._jobs.values())
+
+    def list_jobs(self, owner, limit=20):
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values() if j["owner"] == owner]
+        return sorted(jobs, key=lambda j: j["created"], reverse=True)[:limit]
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import audio_tools
+import metrics
+import prompts
+from ai_engine import generate_with_retry, get_model, note_from_transcript, shift_timestamps, transcribe_audio
+from rate_limiter import PRIORITY_STUDENT
+
+# --- 上課中即時筆記 ---
+# 錄音一段一段送進來 (網頁上每錄完一段就送出，或由模擬器即時回放)，每段一進來就在背景聽寫成逐字稿；
+# 草稿隨新的逐字稿增量更新：只把「目前草稿 + 新片段」交給 Gemini，不必重讀整堂課，
+# 更新進行中又有新片段完成時會合併成下一次更新，不會排隊重複呼叫。
+# 停止錄音後只剩最後一段的聽寫，加上一次從完整逐字稿產生講義的文字呼叫，下課幾秒後就有完整講義；
+# 完整逐字稿也存進 AI 快取，之後可以照常衍生其他語言版本。
+
+RECORDING, FINALIZING, DONE, FAILED = "recording", "finalizing", "done", "failed"
+SESSION_IDLE_SECONDS = 6 * 60 * 60
+
+DRAFT_PROMPT = """
+你正在上課中幫忙即時整理筆記。以下是目前的筆記草稿，以及剛聽寫好的新逐字稿片段 (每行開頭是時間戳記)。
+請把新片段的重點併入草稿：條列式、依課程順序、保留重要名詞與例子，不要刪掉草稿裡原有的重點，輸出更新後的完整草稿。
+{lang_instruction}
+
+【目前草稿】：
+{draft}
+
+【新逐字稿片段】：
+{new_transcript}
+"""
+
+
+def segment_duration(path):
+    # 網頁錄音 (st.audio_input) 是 WAV，沒有 ffmpeg 也量得出長度
+    if audio_tools.has_ffmpeg():
+        return audio_tools.probe_duration(path)
+    with wave.open(path, "rb") as f:
+        return f.getnframes() / f.getframerate()
+
+
+def transcript_key(session_id):
+    # 即時筆記沒有單一的錄音檔，完整逐字稿以工作階段編號存進 AI 快取
+    return f"live:{session_id}"
+
+
+class LiveNoteSession:
+    def __init__(self, session_id, owner, model_name, view, language, cache, pool, priority):
+        self.id = session_id
+        self.owner = owner
+        self.model_name = model_name
+        self.view = view
+        self.language = language
+        self.cache = cache
+        self.priority = priority
+        self.status = RECORDING
+        self.error = None
+        self.segments = []        # 每段：{"offset", "duration", "transcript", "added", "transcribed"}
+        self.draft = ""
+        self.draft_through = 0    # 草稿已經涵蓋前幾段
+        self.final_note = None
+        self.version = 0
+        self.last_active = time.time()
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._futures = []
+        self._draft_running = False
+        self._stopped_at = None
+
+    # --- 錄音端 ---
+    def add_segment(self, path, duration=None, release=None):
+        """送進下一段錄音 (暫存檔由這裡負責刪除，完成後呼叫 release)；回傳段落編號。"""
+        try:
+            if duration is None:
+                duration = segment_duration(path)
+            with self._lock:
+                if self.status != RECORDING:
+                    raise ValueError("即時筆記已經停止錄音。")
+                index = len(self.segments)
+                offset = sum(s["duration"] for s in self.segments)
+                self.segments.append({"offset": offset, "duration": duration, "transcript": None, "added": time.time(), "transcribed": None})
+                self._bump()
+                self._futures.append(self._pool.submit(self._transcribe, index, path, release))
+        except BaseException:
+            _discard(path, release)
+            raise
+        metrics.count("live_notes.segments")
+        return index
+
+    def stop(self):
+        """停止錄音，等剩下的段落聽寫完後從完整逐字稿產生講義 (在背景進行)。"""
+        with self._lock:
+            if self.status != RECORDING:
+                return
+            self.status = FINALIZING
+            self._stopped_at = time.time()
+            self._bump()
+        threading.Thread(target=self._finalize, name=f"live-notes-{self.id}", daemon=True).start()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "error": self.error,
+                "segments": len(self.segments),
+                "transcribed": sum(bool(s["transcript"]) for s in self.segments),
+                "recorded_seconds": sum(s["duration"] for s in self.segments),
+                "draft": self.draft,
+                "draft_through": self.draft_through,
+                "final_note": self.final_note,
+                "version": self.version,
+            }
+
+    def transcript(self):
+        with self._lock:
+            return "\n".join(s["transcript"] for s in self.segments if s["transcript"])
+
+    # --- 背景工作 ---
+    def _transcribe(self, index, path, release):
+        try:
+            with self._lock:
+                offset = self.segments[index]["offset"]
+            with metrics.span("live_notes.transcribe_segment"):
+                text = transcribe_audio(self.model_name, path, priority=self.priority)
+        except Exception as e:
+            # 標成空白讓草稿可以越過這一段繼續更新；停止錄音時仍會讓最終講義失敗
+            with self._lock:
+                self.segments[index]["transcript"] = ""
+                self.error = f"第 {index + 1} 段聽寫失敗：{e}"
+                self._bump()
+            raise
+        finally:
+            _discard(path, release)
+        with self._lock:
+            segment = self.segments[index]
+            segment["transcript"] = shift_timestamps(text.strip(), offset)
+            segment["transcribed"] = time.time()
+            metrics.observe("live_notes.segment_lag", segment["transcribed"] - segment["added"])
+            self._bump()
+            start_draft = self.status == RECORDING and not self._draft_running
+            if start_draft:
+                self._draft_running = True
+        if start_draft:
+            self._pool.submit(self._update_draft)
+
+    def _update_draft(self):
+        # 同一時間只有一個草稿更新；每次把已完成、還沒併入草稿的連續段落一起併入
+        try:
+            while True:
+                with self._lock:
+                    end = self.draft_through
+                    while end < len(self.segments) and self.segments[end]["transcript"] is not None:
+                        end += 1
+                    if self.status != RECORDING or end == self.draft_through:
+                        self._draft_running = False
+                        return
+                    start, draft = self.draft_through, self.draft
+                    new_transcript = "\n".join(s["transcript"] for s in self.segments[start:end] if s["transcript"])
+                prompt = DRAFT_PROMPT.format(
+                    lang_instruction=prompts.language_instruction(self.language), draft=draft or "(尚無，這是第一段)",
+                    new_transcript=new_transcript,
+                )
+                with metrics.span("live_notes.update_draft"):
+                    text = generate_with_retry(get_model(self.model_name), prompt, priority=self.priority)
+                with self._lock:
+                    self.draft, self.draft_through = text, end
+                    self._bump()
+        except Exception:
+            # 草稿只是預覽，失敗就等下一段再試；最終講義不依賴草稿
+            with self._lock:
+                self._draft_running = False
+            metrics.count("live_notes.draft_failed")
+
+    def _finalize(self):
+        try:
+            with self._lock:
+                futures = list(self._futures)
+            wait(futures)
+            for future in futures:
+                future.result()  # 有段落聽寫失敗就讓整份講義失敗，避免漏掉內容
+            transcript = self.transcript()
+            if not transcript:
+                raise ValueError("沒有收到任何錄音。")
+            if self.cache is not None:
+                self.cache.put_transcript(transcript_key(self.id), self.model_name, transcript)
+            with metrics.span("live_notes.final_note"):
+                note = note_from_transcript(
+                    self.model_name, transcript, prompts.note_prompt(self.view, self.language), cache=self.cache, priority=self.priority,
+                )
+            with self._lock:
+                self.final_note = note
+                self.status = DONE
+                metrics.observe("live_notes.stop_to_note", time.time() - self._stopped_at)
+                self._bump()
+        except Exception as e:
+            with self._lock:
+                self.status, self.error = FAILED, str(e)
+                self._bump()
+
+    def _bump(self):
+        # 呼叫時必須持有鎖
+        self.version += 1
+        self.last_active = time.time()
+
+
+def _discard(path, release):
+    try: os.remove(path)
+    except OSError: pass
+    if release: release()
+
+
+class LiveNoteHub:
+    """整個伺服器行程共用 (app.py 以 st.cache_resource 建立)；所有即時筆記共用一個背景執行緒池。"""
+
+    def __init__(self, cache=None, max_workers=4):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="live-notes")
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def start(self, owner, model_name, view, language, priority=PRIORITY_STUDENT):
+        now = time.time()
+        with self._lock:
+            for session_id in [k for k, s in self._sessions.items() if now - s.last_active > SESSION_IDLE_SECONDS]:
+                del self._sessions[session_id]
+            session = LiveNoteSession(uuid.uuid4().hex[:12], owner, model_name, view, language, self.cache, self._pool, priority)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -0,0 +1,270 @@
+import random
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+# --- 即時課堂測驗 (Kahoot 模式) ---
+# 老師開房間並逐題推進，學生輸入房間代碼加入，在倒數時間內作答，每題揭曉後排行榜即時更新。
+# 整個伺服器行程共用一個 LiveQuizHub (app.py 以 st.cache_resource 建立)，狀態全部放在記憶體：
+#   - 作答只是上鎖後寫進 dict，幾百人同時按下去也不必排隊等資料庫。
+#   - 每次狀態改變 (有人加入、作答、換題、揭曉) 房間版本號 +1 並通知訂閱者 (wait_for_update)；
+#     畫面用的快照依版本號只組一次，所有 session 的輪詢拿到的是同一份。
+#   - 分數與排行榜只在揭曉時計算一次，不會隨每次作答重新排序。
+#   - 遊戲結束時全班成績在同一個交易內寫進成績庫，老師端的成績總覽與逐題分析照常可用。
+
+LOBBY, QUESTION, REVEAL, FINISHED = "lobby", "question", "reveal", "finished"
+QUESTION_SECONDS = 20
+MAX_POINTS = 1000
+LEADERBOARD_SIZE = 10
+ROOM_IDLE_SECONDS = 3 * 60 * 60  # 超過這麼久沒有動靜的房間在開新房間時清掉
+
+
+class LiveQuizError(Exception):
+    pass
+
+
+def question_points(elapsed, time_limit):
+    """答對的得分：越快越高，時間用完前答對最少拿一半。"""
+    return round(MAX_POINTS * (1 - 0.5 * min(max(elapsed / time_limit, 0.0), 1.0)))
+
+
+class _Room:
+    def __init__(self, code, quiz_file, quiz, host, time_limit, now):
+        self.code = code
+        self.quiz_file = quiz_file
+        self.quiz = quiz
+        # 舊版或手動修改過的測驗，正確答案可能對不上任何選項：記為 -1，該題沒有人答對
+        self.key_indices = [q["options"].index(q["answer"]) if q["answer"] in q["options"] else -1 for q in quiz]
+        self.host = host
+        self.time_limit = time_limit
+        self.phase = LOBBY
+        self.index = -1
+        self.deadline = None
+        self.question_started = None
+        self.players = {}     # 名字 -> {"score", "answers": [選項編號或 None], "last_points"}
+        self.current = {}     # 這一題的作答：名字 -> (選項編號, 作答秒數)
+        self.distribution = []
+        self.leaderboard = []
+        self.ranks = {}
+        self.version = 0
+        self.saved = False
+        self.last_active = now
+        self._snapshot = None
+
+
+class LiveQuizHub:
+    def __init__(self, results_store=None, time_limit=QUESTION_SECONDS, clock=time.time):
+        self.results_store = results_store
+        self.time_limit = time_limit
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._rooms = {}
+
+    # --- 老師端 ---
+    def create_room(self, quiz_file, quiz, host, time_limit=None):
+        """開一個新房間並回傳 4 位數房間代碼。"""
+        now = self.clock()
+        with self._lock:
+            for code in [c for c, r in self._rooms.items() if now - r.last_active > ROOM_IDLE_SECONDS]:
+                del self._rooms[code]
+            code = f"{random.randrange(10000):04d}"
+            while code in self._rooms:
+                code = f"{random.randrange(10000):04d}"
+            self._rooms[code] = _Room(code, quiz_file, quiz, host, time_limit or self.time_limit, now)
+        metrics.count("live.rooms")
+        return code
+
+    def next_question(self, code):
+        """進到下一題並開始倒數；最後一題揭曉後呼叫則結束遊戲。"""
+        with self._lock:
+            room = self._room(code)
+            self._tick(room)
+            if room.phase == QUESTION:
+                raise LiveQuizError("這一題還在作答中。")
+            if room.phase == FINISHED:
+                return
+            if room.index + 1 >= len(room.quiz):
+                room.phase = FINISHED
+            else:
+                room.index += 1
+                room.phase = QUESTION
+                room.current = {}
+                room.question_started = self.clock()
+                room.deadline = room.question_started + room.time_limit
+            self._bump(room)
+
+    def reveal(self, code):
+        """提前結束本題並揭曉答案。"""
+        with self._lock:
+            room = self._room(code)
+            if room.phase == QUESTION:
+                self._reveal(room)
+
+    def finish(self, code):
+        """結束遊戲並把全班成績寫進成績庫 (只寫一次)；回傳寫入筆數。"""
+        with self._lock:
+            room = self._room(code)
+            self._tick(room)
+            if room.phase == QUESTION:
+                self._reveal(room)
+            if room.phase != FINISHED:
+                room.phase = FINISHED
+                self._bump(room)
+            if room.saved or self.results_store is None:
+                return 0
+            room.saved = True
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            n = len(room.quiz)
+            rows = [
+                (name, int(sum(a == k for a, k in zip(p["answers"], room.key_indices)) / n * 100), timestamp, list(p["answers"]))
+                for name, p in room.players.items()
+            ]
+            quiz_file, key_indices = room.quiz_file, room.key_indices
+        # 資料庫寫入在鎖外進行，不會卡住其他房間的作答
+        if rows:
+            with metrics.span("live.save_results"):
+                self.results_store.add_results(quiz_file, rows, key_indices=key_indices)
+        return len(rows)
+
+    def close_room(self, code):
+        with self._lock:
+            room = self._rooms.pop(code, None)
+            if room is not None:
+                room.version += 1
+                self._changed.notify_all()
+
+    # --- 學生端 ---
+    def join(self, code, name):
+        """加入房間；同名視為同一人 (重新整理頁面後可以接著玩)。"""
+        name = name.strip()
+        if not name:
+            raise LiveQuizError("請輸入姓名或學號。")
+        with self._lock:
+            room = self._room(code)
+            if room.phase == FINISHED:
+                raise LiveQuizError("這場測驗已經結束了。")
+            if name not in room.players:
+                room.players[name] = {"score": 0, "answers": [None] * len(room.quiz), "last_points": None}
+                self._bump(room)
+
+    def answer(self, code, name, option_index):
+        """送出本題答案；時間到、已經作答過或不在作答階段時回傳 False。"""
+        now = self.clock()
+        with self._lock:
+            room = self._room(code)
+            self._tick(room)
+            if room.phase != QUESTION or name not in room.players or name in room.current:
+                return False
+            if not 0 <= option_index < len(room.quiz[room.index]["options"]):
+                return False
+            room.current[name] = (option_index, now - room.question_started)
+            room.players[name]["answers"][room.index] = option_index
+            metrics.count("live.answers")
+            if len(room.current) >= len(room.players):
+                # 全員都答完就直接揭曉，不必等倒數結束
+                self._reveal(room)
+            else:
+                self._bump(room)
+            return True
+
+    # --- 讀取與訂閱 ---
+    def snapshot(self, code):
+        """目前題目、作答人數、分布與排行榜；同一版本的快照所有 session 共用，不可修改。"""
+        with self._lock:
+            room = self._room(code)
+            self._tick(room)
+            if room._snapshot is None:
+                room._snapshot = self._build_snapshot(room)
+            return room._snapshot
+
+    def player_status(self, code, name):
+        with self._lock:
+            room = self._room(code)
+            player = room.players.get(name)
+            if player is None:
+                return None
+            choice = player["answers"][room.index] if room.index >= 0 else None
+            return {"score": player["score"], "rank": room.ranks.get(name), "choice": choice, "last_points": player["last_points"]}
+
+    def wait_for_update(self, code, since_version, timeout=None):
+        """等到房間版本號大於 since_version (或逾時) 後回傳最新快照；給不經過 Streamlit 輪詢的訂閱者使用。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                room = self._room(code)
+                self._tick(room)
+                if room.version > since_version:
+                    break
+                # 作答中要在倒數結束時醒來自動揭曉
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if room.phase == QUESTION:
+                    until_deadline = max(0.0, room.deadline - self.clock())
+                    remaining = until_deadline if remaining is None else min(remaining, until_deadline)
+                if remaining is not None and remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            if room._snapshot is None:
+                room._snapshot = self._build_snapshot(room)
+            return room._snapshot
+
+    # --- 內部 (呼叫時必須持有鎖) ---
+    def _room(self, code):
+        room = self._rooms.get(code)
+        if room is None:
+            raise LiveQuizError(f"找不到房間 {code}，請確認代碼是否正確。")
+        return room
+
+    def _bump(self, room):
+        room.version += 1
+        room.last_active = self.clock()
+        room._snapshot = None
+        self._changed.notify_all()
+
+    def _tick(self, room):
+        # 倒數結束時由下一個讀取或作答的人順手揭曉，不需要另開計時執行緒
+        if room.phase == QUESTION and self.clock() >= room.deadline:
+            self._reveal(room)
+
+    def _reveal(self, room):
+        key = room.key_indices[room.index]
+        counts = [0] * len(room.quiz[room.index]["options"])
+        for player in room.players.values():
+            player["last_points"] = 0
+        for name, (option, elapsed) in room.current.items():
+            counts[option] += 1
+            if option == key:
+                points = question_points(elapsed, room.time_limit)
+                room.players[name]["score"] += points
+                room.players[name]["last_points"] = points
+        room.distribution = counts
+        ranked = sorted(room.players.items(), key=lambda item: -item[1]["score"])
+        room.ranks = {name: rank for rank, (name, _) in enumerate(ranked, start=1)}
+        room.leaderboard = [(name, p["score"]) for name, p in ranked[:LEADERBOARD_SIZE]]
+        room.phase = REVEAL
+        self._bump(room)
+
+    def _build_snapshot(self, room):
+        question = room.quiz[room.index] if room.index >= 0 else None
+        revealed = room.phase in (REVEAL, FINISHED)
+        return {
+            "code": room.code,
+            "quiz_file": room.quiz_file,
+            "version": room.version,
+            "phase": room.phase,
+            "index": room.index,
+            "total": len(room.quiz),
+            "question": question["question"] if question else None,
+            "options": list(question["options"]) if question else [],
+            "answer": question["answer"] if question and revealed else None,
+            "explanation": question.get("explanation", "") if question and revealed else None,
+            "deadline": room.deadline,
+            "time_limit": room.time_limit,
+            "players": len(room.players),
+            "answered": len(room.current),
+            "distribution": list(room.distribution) if revealed else [],
+            "leaderboard": list(room.leaderboard),
+            "saved": room.saved,
+        }
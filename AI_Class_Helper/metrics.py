@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+# --- 各階段耗時與事件計數 ---
+# with span("gemini.upload"): ... 記錄一次耗時；count("gemini.429") 累加事件次數。
+# 每個階段只保留最近 RECENT_SAMPLES 筆耗時 (計算 p50/p95 用) 與累計次數/總秒數，
+# 一次記錄只是 perf_counter + 一次上鎖的 append，可以長期開著。
+# 整個行程共用一份 (shared_metrics)；start_export() 後由背景執行緒定時輸出
+# Prometheus 文字格式 (每次整份覆寫) 與 JSONL 快照 (有新資料才追加一行)。
+# JSONL 超過 JSONL_MAX_BYTES 時改名為 <檔名>.1 (覆蓋上一份) 再重新開始，硬碟上最多約兩倍大小。
+
+RECENT_SAMPLES = 2048
+EXPORT_INTERVAL_SECONDS = 15
+JSONL_MAX_BYTES = 5 * 1024 * 1024
+METRIC_PREFIX = "classroom"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        # 串流被呼叫端中途關閉 (GeneratorExit) 不算錯誤
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.metrics.count(f"{self.stage}.errors")
+        return False
+
+
+class Metrics:
+    def __init__(self, recent_samples=RECENT_SAMPLES):
+        self.recent_samples = recent_samples
+        self._lock = threading.Lock()
+        self._recent = {}
+        self._totals = {}
+        self._counters = Counter()
+        self._version = 0
+        self._exported_version = None
+        self._exporter = None
+
+    def span(self, stage):
+        return _Span(self, stage)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            recent = self._recent.get(stage)
+            if recent is None:
+                recent = self._recent[stage] = deque(maxlen=self.recent_samples)
+                self._totals[stage] = [0, 0.0]
+            recent.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+            self._version += 1
+
+    def count(self, event, n=1):
+        with self._lock:
+            self._counters[event] += n
+            self._version += 1
+
+    def snapshot(self):
+        """回傳 {"stages": {階段: {count, sum, p50, p95, max}}, "counters": {...}}；百分位數以最近的樣本計算。"""
+        with self._lock:
+            recent = {stage: list(values) for stage, values in self._recent.items()}
+            totals = {stage: tuple(t) for stage, t in self._totals.items()}
+            counters = dict(self._counters)
+        stages = {}
+        for stage, values in recent.items():
+            values.sort()
+            stages[stage] = {
+                "count": totals[stage][0],
+                "sum": totals[stage][1],
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "max": values[-1] if values else 0.0,
+            }
+        return {"time": time.time(), "stages": stages, "counters": counters}
+
+    def to_prometheus(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = [f"# TYPE {METRIC_PREFIX}_stage_seconds summary"]
+        for stage, s in sorted(snapshot["stages"].items()):
+            label = f'stage="{stage}"'
+            lines.append(f'{METRIC_PREFIX}_stage_seconds{{{label},quantile="0.5"}} {s["p50"]:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds{{{label},quantile="0.95"}} {s["p95"]:.6f}')
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_sum{{{label}}} {s['sum']:.6f}")
+            lines.append(f"{METRIC_PREFIX}_stage_seconds_count{{{label}}} {s['count']}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_events_total counter")
+        for event, n in sorted(snapshot["counters"].items()):
+            lines.append(f'{METRIC_PREFIX}_events_total{{event="{event}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, prom_path=None, jsonl_path=None):
+        """立即輸出一次；JSONL 只在有新資料時追加，太大時先輪替。"""
+        with self._lock:
+            version = self._version
+        snapshot = self.snapshot()
+        if prom_path:
+            tmp_path = f"{prom_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus(snapshot))
+            os.replace(tmp_path, prom_path)
+        if jsonl_path and version != self._exported_version:
+            try:
+                if os.path.getsize(jsonl_path) >= JSONL_MAX_BYTES:
+                    os.replace(jsonl_path, f"{jsonl_path}.1")
+            except FileNotFoundError:
+                pass
+            with open(jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+        self._exported_version = version
+
+    def start_export(self, prom_path=None, jsonl_path=None, interval=EXPORT_INTERVAL_SECONDS):
+        """啟動背景輸出執行緒 (重複呼叫不會啟動第二個)。"""
+        with self._lock:
+            if self._exporter is not None:
+                return
+            self._exporter = threading.Thread(
+                target=self._export_loop, args=(prom_path, jsonl_path, interval), name="metrics-export", daemon=True,
+            )
+        self._exporter.start()
+
+    def _export_loop(self, prom_path, jsonl_path, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.export(prom_path, jsonl_path)
+            except OSError:
+                pass
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_metrics():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Metrics()
+        return _shared
+
+
+def span(stage):
+    return shared_metrics().span(stage)
+
+
+def observe(stage, seconds):
+    shared_metrics().observe(stage, seconds)
+
+
+def count(event, n=1):
+    shared_metrics().count(event, n)
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# --- PDF 產生與快取 ---
+# PDF 以「講義內容 + 身分視角」的雜湊為鍵存放在硬碟上，總量超過上限時淘汰最久沒用的檔案 (LRU)。
+# WeasyPrint 排版在獨立的子行程 (pdf_worker.py) 裡執行，Streamlit 的執行緒只負責等待結果 (有逾時)。
+
+WORKER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Worker:
+    """一個常駐的 `python -m pdf_worker` 子行程，一次排版一份講義。"""
+
+    def __init__(self):
+        # fork + exec 出全新的直譯器，不會複製 Streamlit 執行緒持有的鎖
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "pdf_worker"], cwd=WORKER_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+    def alive(self):
+        return self._proc.poll() is None
+
+    def render(self, md_content):
+        try:
+            pickle.dump(md_content, self._proc.stdin)
+            self._proc.stdin.flush()
+            status, value = pickle.load(self._proc.stdout)
+        except (BrokenPipeError, EOFError):
+            self._proc.kill()
+            raise RuntimeError("PDF 排版行程意外結束") from None
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+
+class PdfCache:
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, max_workers=2, timeout=60):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+        # 每個執行緒各自擁有一個排版子行程 (第一次用到才啟動，掛掉時換新的)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf")
+        self._workers = threading.local()
+        self._lock = threading.Lock()
+        self._inflight = {}  # 雜湊 -> 進行中的 Future，同一份講義同時只排版一次
+
+    def key(self, md_content, view):
+        return hashlib.sha256(f"{view}\0{md_content}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get_cached(self, md_content, view):
+        path = self._path(self.key(md_content, view))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            metrics.count("pdf.cache_miss")
+            return None
+        metrics.count("pdf.cache_hit")
+        # 更新 mtime 作為 LRU 的「最近使用時間」
+        try: os.utime(path)
+        except OSError: pass
+        return data
+
+    def cached_path(self, md_content, view):
+        """已排版好的 PDF 檔案路徑 (不讀進記憶體，給打包大量 PDF 時逐塊複製)；沒有則回傳 None。"""
+        path = self._path(self.key(md_content, view))
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def submit(self, md_content, view):
+        """排入背景排版 (不等待)，回傳 Future；已在排版中的同一份講義會共用同一個 Future。"""
+        key = self.key(md_content, view)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._pool.submit(self._render_in_worker, md_content)
+            self._inflight[key] = future
+        # 排版在子行程裡進行，耗時以「送出 → 完成」計算 (含排隊)；
+        # 回呼要在鎖外註冊：已經完成的 Future 會在這裡立刻執行回呼，而回呼本身也要取得鎖
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: self._on_done(key, f, started))
+        return future
+
+    def _render_in_worker(self, md_content):
+        worker = getattr(self._workers, "worker", None)
+        if worker is None or not worker.alive():
+            worker = self._workers.worker = _Worker()
+        return worker.render(md_content)
+
+    def render(self, md_content, view):
+        """先查快取；沒有的話交給行程池排版，最多等待 timeout 秒 (逾時丟出 TimeoutError，排版仍會在背景完成)。"""
+        data = self.get_cached(md_content, view)
+        if data is not None:
+            return data
+        return self.submit(md_content, view).result(timeout=self.timeout)
+
+    def _on_done(self, key, future, started):
+        with self._lock:
+            self._inflight.pop(key, None)
+        metrics.observe("pdf.render", time.perf_counter() - started)
+        if future.cancelled() or future.exception() is not None:
+            metrics.count("pdf.render.errors")
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(future.result())
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                info = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try: os.remove(os.path.join(self.cache_dir, name))
+            except OSError: pass
+            total -= size
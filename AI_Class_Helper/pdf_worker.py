@@ -0,0 +1,49 @@
+import pickle
+import sys
+
+import markdown
+
+# --- PDF 排版子行程 ---
+# 由 pdf_cache 以 `python -m pdf_worker` 啟動：入口是這個可匯入的模組，不是 multiprocessing 的 spawn，
+# 所以不會把 Streamlit 登記成 __main__ 的頁面腳本 (app.py) 在子行程裡再跑一次。
+# 從 stdin 逐筆讀入 Markdown (pickle)，把 ("ok", PDF) 或 ("error", 訊息) 寫回 stdout；stdin 關閉時結束。
+
+
+def create_pdf(md_content):
+    from weasyprint import HTML
+    html = markdown.markdown(md_content, extensions=['tables'])
+    html_template = f"""
+    <html>
+      <head>
+        <meta charset="UTF-8">
+        <style>
+          body {{ font-family: "Noto Sans CJK TC", sans-serif; line-height: 1.6; padding: 2em; }}
+          table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
+          th, td {{ border: 1px solid #ccc; padding: 10px; text-align: left; }}
+          th {{ background-color: #f8f9fa; font-weight: bold; }}
+        </style>
+      </head>
+      <body>{html}</body>
+    </html>
+    """
+    return HTML(string=html_template).write_pdf()
+
+
+def main():
+    requests, replies = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr  # stdout 只留給排版結果，套件印出的訊息改到 stderr
+    while True:
+        try:
+            md_content = pickle.load(requests)
+        except EOFError:
+            return
+        try:
+            reply = ("ok", create_pdf(md_content))
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        pickle.dump(reply, replies)
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()
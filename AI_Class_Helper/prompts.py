@@ -0,0 +1,62 @@
+import functools
+
+# --- 提示詞 ---
+# 網頁介面與批次命令列工具共用同一份提示詞，兩邊產生的講義結構一致，AI 快取也能互相命中。
+# 講義提示詞只有 (身分 x 語言) 幾種組合，組好一次就重複使用，每次重跑不必重新排版長字串。
+
+OUTPUT_LANGUAGES = ["繁體中文", "English", "日本語", "한국어", "Español", "簡體中文", "自動偵測 (與錄音相同)"]
+
+TEACHER_NOTE_PROMPT = """
+你是一位專業教學助理。請仔細聆聽這段授課錄音，產出課後教材。
+【自動區分機制】：請嚴格分辨錄音中的「課內教學重點」與「課外閒聊/延伸補充」，並將其分開整理。
+{lang_instruction}
+
+請嚴格遵守以下結構，並務必在第3點和第4點之間插入「---TEACHER_ONLY---」作為系統分隔線：
+1. 📚 課程內容大綱 (僅限課內核心教學內容)
+2. 🌍 課外話題與閒聊紀錄 (請摘要老師分享的課外故事、時事補充、笑話或與主課程無關的閒聊，若無則寫「無特別課外延伸」)
+3. 🎯 核心教學目標
+---TEACHER_ONLY---
+4. 📝 課後隨堂測驗 (3題單選含解析，請僅針對課內重點出題)
+5. 💡 學生易錯點提醒
+
+請直接輸出 Markdown 內容。
+"""
+
+STUDENT_NOTE_PROMPT = """
+你是一位學霸助教。請仔細聆聽這段課堂錄音，幫學生整理出一份結構清晰的 Markdown 複習筆記。
+【自動區分機制】：請幫學生過濾雜訊，明確區分出「考試必考的課內重點」與「老師分享的課外話題」。
+{lang_instruction}
+
+結構請嚴格包含以下 5 點：
+1. 📖 課程核心摘要 (摘要本次課堂重點)
+2. 🔑 關鍵名詞解釋 (請用表格呈現：名詞 | 解釋)
+3. 💡 重點觀念詳解 (針對課內核心知識進行條列式說明)
+4. 🌍 課外補充與趣事 (請摘要老師在錄音中提到的課外故事、生活經驗分享、時事或非考試範圍的閒聊，若無則寫「無特別課外延伸」)
+5. 🎯 考試重點預測
+
+請直接輸出 Markdown 內容。
+"""
+
+CHAT_PROMPT = """
+你是一位友善的 AI 助教。請根據【課堂筆記相關段落】來回答學生的問題。如果超出範圍，請溫柔提醒。
+{chat_context}
+學生最新問題: {question}
+AI助教回答:
+"""
+
+
+def language_instruction(output_language):
+    if "自動偵測" in output_language:
+        return "【重要指令】請使用與錄音檔相同的語言來輸出內容。"
+    return f"【重要指令】不論錄音檔原本是什麼語言，請務必將所有輸出的內容翻譯並撰寫為：「{output_language}」。"
+
+
+@functools.lru_cache(maxsize=None)
+def note_prompt(view, output_language):
+    """view 為 "teacher" (含教師專屬分隔線的教材) 或 "student" (學生複習筆記)。"""
+    template = TEACHER_NOTE_PROMPT if view == "teacher" else STUDENT_NOTE_PROMPT
+    return template.format(lang_instruction=language_instruction(output_language))
+
+
+def chat_prompt(chat_context, question):
+    return CHAT_PROMPT.format(chat_context=chat_context, question=question)
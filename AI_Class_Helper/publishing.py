@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+
+import metrics
+
+from quiz_schema import make_variants
+
+# --- 發布講義與測驗 ---
+# 網頁介面與批次命令列工具共用：一律先寫暫存檔再原子替換，學生不會讀到寫一半的檔案；
+# 寫完後更新目錄 (與搜尋索引)，講義另外可以預先排版 PDF。
+
+TEACHER_ONLY_MARK = "---TEACHER_ONLY---"
+
+
+def make_display_note(raw_note, view):
+    # 學生只看得到分隔線之前的內容；教師則以提示標語取代分隔線
+    if view == "student":
+        return raw_note.split(TEACHER_ONLY_MARK)[0].strip()
+    return raw_note.replace(TEACHER_ONLY_MARK, "\n\n---\n**🔒 以下為教師專屬內容 (課後隨堂測驗 & 易錯提醒，學生端不可見)：**\n\n")
+
+
+def _atomic_write(path, write):
+    # 暫存檔名帶行程與執行緒編號：網頁與批次工具同時發布同一份檔案也不會互相覆寫暫存檔
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with metrics.span("publish.write"):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+
+def publish_note(shared_dir, note_filename, raw_note, catalog, search_index=None, pdf_cache=None):
+    """寫入講義並更新目錄；有傳入搜尋索引 / PDF 快取時一併更新。回傳目錄項目。"""
+    _atomic_write(os.path.join(shared_dir, note_filename), lambda f: f.write(raw_note))
+    entry = catalog.record("notes", note_filename)
+    if search_index is not None:
+        search_index.update(note_filename, entry["sha256"], raw_note)
+    if pdf_cache is not None:
+        # 發布時就先在背景排版好兩種視角的 PDF，之後下載直接命中快取
+        for view in ("student", "teacher"):
+            pdf_cache.submit(make_display_note(raw_note, view), view)
+    return entry
+
+
+def publish_quiz(quiz_dir, variants_dir, safe_title, quiz, catalog, n_variants=1):
+    """寫入測驗與洗牌版本並更新目錄，回傳測驗檔名。"""
+    # 版本檔先寫：學生一看到新測驗，對應的洗牌版本就已經存在
+    _atomic_write(os.path.join(variants_dir, f"{safe_title}.json"), lambda f: json.dump(make_variants(quiz, n_variants), f))
+    _atomic_write(
+        os.path.join(quiz_dir, f"{safe_title}.json"), lambda f: json.dump(quiz, f, ensure_ascii=False, indent=2),
+    )
+    catalog.record("quizzes", f"{safe_title}.json")
+    return f"{safe_title}.json"
@@ -0,0 +1,145 @@
+import json
+import random
+import re
+
+# --- 互動測驗題目格式 ---
+# 每題固定 4 個不重複選項，answer 必須與其中一個選項完全相同；一份測驗固定 10 題。
+# AI 回傳的題目先在本機修補常見小錯 (選項前的「A.」、答案寫成字母或編號、多餘空白)，
+# 修不好的題目才交給 ai_engine 逐題重新生成，不必整份重出。
+#
+# 洗牌版本只記錄「題目順序 + 每題選項順序」，題目內容與原測驗相同；
+# 作答可換回原測驗的題號與選項編號，成績統計與試題分析不受版本影響。
+
+QUIZ_LENGTH = 10
+OPTION_COUNT = 4
+
+ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {"type": "array", "items": {"type": "string"}},
+        "answer": {"type": "string"},
+        "explanation": {"type": "string"},
+    },
+    "required": ["question", "options", "answer", "explanation"],
+}
+QUIZ_SCHEMA = {"type": "array", "items": ITEM_SCHEMA}
+
+OPTION_LABEL_RE = re.compile(r"^\s*(?:\(\s*([A-Da-d1-4])\s*\)|([A-Da-d1-4])\s*[\.\)、:：](?!\d))\s*")
+ARRAY_RE = re.compile(r"\[\s*\{.*\}\s*\]", re.DOTALL)
+
+
+def parse_quiz_json(text):
+    """解析 AI 回傳的 JSON；不是純 JSON 時退回擷取文字中的陣列，仍失敗則回傳空清單。"""
+    for candidate in (text, *(m.group(0) for m in [ARRAY_RE.search(text or "")] if m)):
+        try:
+            data = json.loads(candidate)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(data, dict):
+            # 單題物件視為只有一題；有些回應則會包成 {"questions": [...]}
+            data = [data] if "question" in data else next((v for v in data.values() if isinstance(v, list)), [])
+        return data if isinstance(data, list) else []
+    return []
+
+
+def _strip_label(text):
+    return OPTION_LABEL_RE.sub("", text, count=1).strip()
+
+
+def _label_index(label):
+    label = label.upper()
+    return "ABCD".index(label) if label in "ABCD" else int(label) - 1
+
+
+def repair_item(raw):
+    """回傳 (修補後的題目, None) 或 (None, 錯誤原因)。"""
+    if not isinstance(raw, dict):
+        return None, "不是題目物件"
+    question = raw.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return None, "缺少題目"
+    options = raw.get("options")
+    if not isinstance(options, list) or not all(isinstance(o, (str, int, float)) for o in options):
+        return None, "選項格式錯誤"
+    options = [str(o).strip() for o in options]
+    if len(options) != OPTION_COUNT:
+        return None, f"選項數為 {len(options)}"
+    # 四個選項依序帶「A.」「(B)」這類標號時才去掉，避免誤刪選項本身的文字
+    labels = [OPTION_LABEL_RE.match(o) for o in options]
+    if all(labels) and [_label_index(m.group(1) or m.group(2)) for m in labels] == list(range(OPTION_COUNT)):
+        options = [_strip_label(o) for o in options]
+    if len(set(options)) != OPTION_COUNT or not all(options):
+        return None, "選項重複或空白"
+
+    answer = raw.get("answer")
+    if isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < OPTION_COUNT:
+        answer = options[answer]
+    elif isinstance(answer, str):
+        answer = answer.strip()
+        if answer not in options:
+            label = OPTION_LABEL_RE.match(answer)
+            stripped = _strip_label(answer)
+            lowered = {o.lower(): o for o in options}
+            if stripped in options:
+                answer = stripped
+            elif stripped.lower() in lowered:
+                answer = lowered[stripped.lower()]
+            elif len(answer) == 1 and answer.upper() in "ABCD1234":
+                answer = options[_label_index(answer)]
+            elif label and not stripped:
+                answer = options[_label_index(label.group(1) or label.group(2))]
+    if answer not in options:
+        return None, "答案不在選項中"
+
+    explanation = raw.get("explanation")
+    return {
+        "question": question.strip(),
+        "options": options,
+        "answer": answer,
+        "explanation": explanation.strip() if isinstance(explanation, str) else "",
+    }, None
+
+
+def validate_quiz(raw_items, limit=QUIZ_LENGTH):
+    """逐題檢查與修補。回傳 (有效題目, [(原題號, 錯誤原因), ...])；重複的題目只保留第一題。"""
+    items, problems, seen = [], [], set()
+    for i, raw in enumerate(raw_items):
+        item, problem = repair_item(raw)
+        if item is not None and question_key(item["question"]) in seen:
+            item, problem = None, "題目重複"
+        if item is None:
+            problems.append((i, problem))
+            continue
+        if len(items) < limit:
+            items.append(item)
+            seen.add(question_key(item["question"]))
+    return items, problems
+
+
+def question_key(question):
+    return "".join(question.split()).lower()
+
+
+def make_variants(quiz, n, seed=None):
+    """產生 n 個洗牌版本；第 1 版維持原順序。每個版本是 [[原題號, [選項順序]], ...]。"""
+    rng = random.Random(seed)
+    variants = [[[q, list(range(len(item["options"])))] for q, item in enumerate(quiz)]]
+    for _ in range(n - 1):
+        order = list(range(len(quiz)))
+        rng.shuffle(order)
+        variant = []
+        for q in order:
+            option_order = list(range(len(quiz[q]["options"])))
+            rng.shuffle(option_order)
+            variant.append([q, option_order])
+        variants.append(variant)
+    return variants
+
+
+def apply_variant(quiz, variant):
+    """依版本排出題目；每題多一個 source 欄位記錄原題號 (answer 是選項文字，洗牌後不必改)。"""
+    return [
+        {**quiz[q], "options": [quiz[q]["options"][i] for i in option_order], "source": q}
+        for q, option_order in variant
+    ]
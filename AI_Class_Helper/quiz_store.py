@@ -0,0 +1,310 @@
+import json
+import os
+import sqlite3
+import threading
+
+import metrics
+
+# --- 測驗成績儲存庫 (SQLite WAL 模式) ---
+# 每次交卷只是一筆 INSERT，不再整份重寫 quiz_results.json；
+# WAL + busy_timeout 讓多個 Streamlit session / 多個行程同時寫入也不會互相覆蓋。
+#
+# 每筆成績另外以「每題一個字元」的緊湊字串保存作答 (選項編號 0-9，未作答為 "-")，
+# 同一份測驗的所有作答可以直接轉成 numpy 矩陣做試題分析；
+# quiz_stats 表則在每次交卷時於同一個交易內更新累計統計，老師端不必重新掃描全部成績。
+# numpy 只有老師端的試題分析用得到，用到時才匯入，學生端冷啟動不必載入。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    quiz TEXT NOT NULL,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quiz_results_quiz ON quiz_results (quiz, id);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS quiz_stats (
+    quiz TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    histogram TEXT NOT NULL,
+    n_questions INTEGER NOT NULL,
+    answered INTEGER NOT NULL,
+    correct TEXT NOT NULL,
+    options TEXT NOT NULL
+);
+"""
+
+UNANSWERED = "-"
+HISTOGRAM_BINS = 11  # 0-9, 10-19, ..., 90-99, 100
+
+
+def encode_answers(answer_indices):
+    return "".join(UNANSWERED if a is None else str(a) for a in answer_indices)
+
+
+def decode_answer_matrix(encoded_rows, n_questions):
+    """把多筆作答字串轉成 (人數 x 題數) 的 int8 矩陣，未作答為 -1。"""
+    import numpy as np
+    if not encoded_rows:
+        return np.empty((0, n_questions), dtype=np.int8)
+    raw = np.frombuffer("".join(encoded_rows).encode("ascii"), dtype=np.uint8).reshape(len(encoded_rows), n_questions)
+    matrix = raw.astype(np.int8) - ord("0")
+    matrix[raw == ord(UNANSWERED)] = -1
+    return matrix
+
+
+def encode_answer_matrix(matrix):
+    """decode_answer_matrix 的反向：把 (人數 x 題數) 矩陣一次轉成每列一個作答字串。"""
+    import numpy as np
+    raw = (matrix + ord("0")).astype(np.uint8)
+    raw[matrix < 0] = ord(UNANSWERED)
+    flat = raw.tobytes().decode("ascii")
+    width = matrix.shape[1]
+    return [flat[i:i + width] for i in range(0, len(flat), width)] if width else [""] * matrix.shape[0]
+
+
+class QuizResultStore:
+    def __init__(self, db_path, busy_timeout=30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # 舊版資料庫補上作答欄位
+        columns = [r["name"] for r in conn.execute("PRAGMA table_info(quiz_results)")]
+        if "answers" not in columns:
+            conn.execute("ALTER TABLE quiz_results ADD COLUMN answers TEXT")
+        self._backfill_stats()
+
+    def _backfill_stats(self):
+        # 累計統計表建立前就存在的成績，依分數補算一次
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'stats_built'").fetchone():
+                return
+            quizzes = [r["quiz"] for r in conn.execute("SELECT DISTINCT quiz FROM quiz_results")]
+            for quiz in quizzes:
+                scores = [r["score"] for r in conn.execute("SELECT score FROM quiz_results WHERE quiz = ?", (quiz,))]
+                self._update_stats(conn, quiz, scores, [], None)
+            conn.execute("INSERT INTO store_meta (key, value) VALUES ('stats_built', '1')")
+
+    def _conn(self):
+        # 每個執行緒各自持有一條連線 (sqlite3 連線不可跨執行緒共用)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def add_result(self, quiz, name, score, timestamp, answer_indices=None, key_indices=None):
+        """新增一筆成績。answer_indices 為每題所選的選項編號 (未作答為 None)，key_indices 為正確答案的選項編號。"""
+        encoded = encode_answers(answer_indices) if answer_indices is not None else None
+        with metrics.span("quiz_store.add_result"), self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO quiz_results (quiz, name, score, timestamp, answers) VALUES (?, ?, ?, ?, ?)",
+                (quiz, name, int(score), timestamp, encoded),
+            )
+            self._update_stats(conn, quiz, [int(score)], [answer_indices] if encoded else [], key_indices)
+
+    def add_results(self, quiz, rows, key_indices=None):
+        """在同一個交易內新增多筆成績 (每筆為 (姓名, 分數, 時間, answer_indices 或 None))，統計也只更新一次。"""
+        records = [
+            (quiz, name, int(score), timestamp, encode_answers(answers) if answers is not None else None)
+            for name, score, timestamp, answers in rows
+        ]
+        with metrics.span("quiz_store.add_results"), self._transaction() as conn:
+            conn.executemany("INSERT INTO quiz_results (quiz, name, score, timestamp, answers) VALUES (?, ?, ?, ?, ?)", records)
+            self._update_stats(
+                conn, quiz, [r[2] for r in records], [answers for *_, answers in rows if answers is not None], key_indices,
+            )
+
+    def add_answer_matrix(self, quiz, names, scores, timestamps, matrix, key_indices):
+        """批次匯入已向量化批改的成績 (matrix 為 decode_answer_matrix 格式)：同一個交易內寫入，統計以矩陣運算更新。"""
+        scores = [int(s) for s in scores]
+        records = list(zip([quiz] * len(names), names, scores, timestamps, encode_answer_matrix(matrix)))
+        with metrics.span("quiz_store.add_answer_matrix"), self._transaction() as conn:
+            conn.executemany("INSERT INTO quiz_results (quiz, name, score, timestamp, answers) VALUES (?, ?, ?, ?, ?)", records)
+            self._update_stats(conn, quiz, scores, matrix, key_indices)
+        return len(records)
+
+    def _update_stats(self, conn, quiz, scores, answer_rows, key_indices):
+        row = conn.execute("SELECT * FROM quiz_stats WHERE quiz = ?", (quiz,)).fetchone()
+        if row is None:
+            stats = {"count": 0, "score_sum": 0, "histogram": [0] * HISTOGRAM_BINS,
+                     "n_questions": 0, "answered": 0, "correct": [], "options": []}
+        else:
+            stats = dict(row)
+            for field in ("histogram", "correct", "options"):
+                stats[field] = json.loads(stats[field])
+
+        stats["count"] += len(scores)
+        stats["score_sum"] += sum(scores)
+        for s in scores:
+            stats["histogram"][min(max(s, 0) // 10, HISTOGRAM_BINS - 1)] += 1
+
+        if len(answer_rows) and key_indices is not None:
+            n_questions = len(key_indices)
+            if stats["n_questions"] != n_questions:
+                # 題數改變 (測驗被重新出題) 時，逐題統計重新累計
+                stats.update(n_questions=n_questions, answered=0, correct=[0] * n_questions, options=[[] for _ in range(n_questions)])
+            if not isinstance(answer_rows, list):
+                _tally_matrix(stats, answer_rows, key_indices)
+                answer_rows = []
+            for answers in answer_rows:
+                stats["answered"] += 1
+                for q, (a, k) in enumerate(zip(answers, key_indices)):
+                    if a is None:
+                        continue
+                    if a == k:
+                        stats["correct"][q] += 1
+                    counts = stats["options"][q]
+                    counts.extend([0] * (a + 1 - len(counts)))
+                    counts[a] += 1
+
+        conn.execute(
+            "INSERT OR REPLACE INTO quiz_stats (quiz, count, score_sum, histogram, n_questions, answered, correct, options) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (quiz, stats["count"], stats["score_sum"], json.dumps(stats["histogram"]), stats["n_questions"],
+             stats["answered"], json.dumps(stats["correct"]), json.dumps(stats["options"])),
+        )
+
+    def get_stats(self, quiz):
+        """回傳累計統計 (人數、平均、分數分布、逐題答對率與各選項人數)；沒有任何成績時回傳 None。"""
+        row = self._conn().execute("SELECT * FROM quiz_stats WHERE quiz = ?", (quiz,)).fetchone()
+        if row is None:
+            return None
+        stats = dict(row)
+        for field in ("histogram", "correct", "options"):
+            stats[field] = json.loads(stats[field])
+        stats["mean"] = stats["score_sum"] / stats["count"] if stats["count"] else 0.0
+        stats["correct_rate"] = [c / stats["answered"] if stats["answered"] else 0.0 for c in stats["correct"]]
+        return stats
+
+    def get_results(self, quiz, limit=None):
+        # 依交卷先後排序，格式與舊版 quiz_results.json 內的每一筆相同；limit 只取最新的幾筆
+        if limit is None:
+            rows = self._conn().execute(
+                "SELECT name, score, timestamp FROM quiz_results WHERE quiz = ? ORDER BY id",
+                (quiz,),
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT name, score, timestamp FROM quiz_results WHERE quiz = ? ORDER BY id DESC LIMIT ?",
+                (quiz, limit),
+            ).fetchall()[::-1]
+        return [dict(r) for r in rows]
+
+    def iter_results(self, quiz):
+        """依交卷先後逐筆產生成績 (含作答字串)，不會一次把全部成績讀進記憶體。"""
+        cursor = self._conn().execute(
+            "SELECT name, score, timestamp, answers FROM quiz_results WHERE quiz = ? ORDER BY id", (quiz,),
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def results_version(self):
+        """(總筆數, 最後一筆編號)：有新成績就會改變，用來判斷匯出的成績表是否需要重做。"""
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM quiz_results").fetchone()
+        return [row[0], row[1]]
+
+    def get_answer_matrix(self, quiz, n_questions):
+        """回傳 (作答矩陣, 分數陣列)，只包含有逐題作答紀錄且題數相符的成績。"""
+        rows = self._conn().execute(
+            "SELECT answers, score FROM quiz_results WHERE quiz = ? AND answers IS NOT NULL AND length(answers) = ?",
+            (quiz, n_questions),
+        ).fetchall()
+        matrix = decode_answer_matrix([r["answers"] for r in rows], n_questions)
+        import numpy as np
+        return matrix, np.array([r["score"] for r in rows], dtype=np.int16)
+
+    def migrate_from_json(self, json_path):
+        """一次性把舊版 quiz_results.json 匯入資料庫，回傳匯入筆數。"""
+        if not os.path.exists(json_path):
+            return 0
+        with self._transaction() as conn:
+            # 用 store_meta 標記避免多個行程重複匯入
+            done = conn.execute("SELECT value FROM store_meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return 0
+            with open(json_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            rows = [
+                (quiz, r["name"], int(r["score"]), r.get("timestamp", ""))
+                for quiz, results in legacy.items()
+                for r in results
+            ]
+            conn.executemany(
+                "INSERT INTO quiz_results (quiz, name, score, timestamp) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            for quiz, results in legacy.items():
+                self._update_stats(conn, quiz, [int(r["score"]) for r in results], [], None)
+            conn.execute("INSERT INTO store_meta (key, value) VALUES ('json_migrated', ?)", (json_path,))
+        try: os.replace(json_path, json_path + ".migrated")
+        except OSError: pass
+        return len(rows)
+
+
+def _tally_matrix(stats, matrix, key_indices):
+    # 與逐筆累計相同的統計，整個作答矩陣一次算完 (批次匯入上萬筆時不必逐格迴圈)
+    import numpy as np
+    key = np.asarray(key_indices, dtype=np.int8)
+    answered = matrix >= 0
+    stats["answered"] += matrix.shape[0]
+    stats["correct"] = [c + int(n) for c, n in zip(stats["correct"], ((matrix == key) & answered).sum(axis=0))]
+    width = int(matrix.max()) + 1 if matrix.size else 0
+    if width <= 0:
+        return
+    # 每格換成 (題號 x 寬度 + 選項) 後一次 bincount，得到每題每個選項的人數
+    flat = (np.arange(matrix.shape[1]) * width + matrix)[answered]
+    counts = np.bincount(flat, minlength=matrix.shape[1] * width).reshape(matrix.shape[1], width)
+    for q, row in enumerate(counts.tolist()):
+        used = max((i + 1 for i, n in enumerate(row) if n), default=0)
+        options = stats["options"][q]
+        options.extend([0] * (used - len(options)))
+        for i in range(used):
+            options[i] += row[i]
+
+
+def item_analysis(matrix, scores, key_indices, group_fraction=0.27):
+    """向量化試題分析。回傳每題的難度 (答對率) 與鑑別度 (高分組答對率 - 低分組答對率)。"""
+    import numpy as np
+    key = np.asarray(key_indices, dtype=np.int8)
+    n = matrix.shape[0]
+    if n == 0:
+        zeros = np.zeros(len(key))
+        return {"difficulty": zeros, "discrimination": zeros}
+    # 未作答 (-1) 不能和對不上選項的正確答案 (-1) 算成答對
+    correct = (matrix == key[np.newaxis, :]) & (matrix >= 0)
+    difficulty = correct.mean(axis=0)
+    group = max(1, int(round(n * group_fraction)))
+    order = np.argsort(scores, kind="stable")
+    discrimination = correct[order[-group:]].mean(axis=0) - correct[order[:group]].mean(axis=0)
+    return {"difficulty": difficulty, "discrimination": discrimination}
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE 先取得寫入鎖，確保「檢查 + 寫入」在多行程下是原子操作
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
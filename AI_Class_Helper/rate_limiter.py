@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# --- 全行程共用的 Gemini 流量控制 ---
+# 每分鐘請求數 (RPM) 與每分鐘 token 數 (TPM) 兩個令牌桶，所有 generate_content 都要先排隊取得額度；
+# 排隊依優先順序：教師教材 > 學生筆記 > AI 助教聊天。遇到 429 以指數退避 + 隨機抖動重試。
+
+PRIORITY_TEACHER = 0
+PRIORITY_STUDENT = 1
+PRIORITY_CHAT = 2
+PRIORITY_NAMES = {PRIORITY_TEACHER: "教師教材", PRIORITY_STUDENT: "學生筆記", PRIORITY_CHAT: "AI 助教"}
+
+# 粗估 token 數：中日韓文字約 1 字 1 token；音訊依檔案大小估算 (Gemini 音訊約 32 token/秒)
+AUDIO_BYTES_PER_TOKEN = 500
+
+
+def estimate_tokens(contents):
+    if isinstance(contents, str):
+        return len(contents) + 1
+    total = 0
+    for part in contents:
+        if isinstance(part, str):
+            total += len(part) + 1
+        else:
+            total += getattr(part, "size_bytes", 0) // AUDIO_BYTES_PER_TOKEN or 1000
+    return total
+
+
+class _Bucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, rpm=60, tpm=1_000_000, max_retries=6, base_delay=2.0, max_delay=60.0, max_streams=32):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiters = []  # (優先順序, 序號)
+        self._seq = itertools.count()
+        self.counters = {"calls": 0, "queued": 0, "throttled": 0, "retried": 0, "errors_429": 0, "failed": 0}
+        self.queued_by_lane = {p: 0 for p in PRIORITY_NAMES}
+        # 串流回答會佔住連線直到結束，另外限制同時進行的串流數
+        self._stream_slots = threading.BoundedSemaphore(max_streams)
+        self.streams_active = 0
+
+    def acquire(self, priority=PRIORITY_STUDENT, tokens=1):
+        # 單次請求最多算滿一整桶，避免超大請求永遠等不到
+        tokens = min(tokens, self.tokens.capacity)
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            self.counters["queued"] += 1
+            self.queued_by_lane[priority] += 1
+            throttled = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if self._waiters[0] == ticket and wait == 0:
+                        self.requests.level -= 1
+                        self.tokens.level -= tokens
+                        return
+                    if not throttled and wait > 0:
+                        self.counters["throttled"] += 1
+                        throttled = True
+                    self._cond.wait(timeout=wait if self._waiters[0] == ticket and wait > 0 else 0.5)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self.counters["queued"] -= 1
+                self.queued_by_lane[priority] -= 1
+                self._cond.notify_all()
+
+    def backoff(self, attempt):
+        # 指數退避 + full jitter，避免整班同時重試又一起撞上限制
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn, priority=PRIORITY_STUDENT, tokens=1, notify=None):
+        """在限流下執行 fn()，遇到 429 自動退避重試；其他錯誤直接往外丟。"""
+        for attempt in range(self.max_retries):
+            with metrics.span("limiter.wait"):
+                self.acquire(priority, tokens)
+            with self._cond:
+                self.counters["calls"] += 1
+            metrics.count("gemini.calls")
+            try:
+                return fn()
+            except Exception as e:
+                if "429" not in str(e):
+                    raise
+                wait_time = self.backoff(attempt)
+                with self._cond:
+                    self.counters["errors_429"] += 1
+                    self.counters["retried"] += 1
+                    # 伺服器已經說超量了，把本地的請求額度清空，讓其他排隊者也一起放慢
+                    self.requests.level = min(self.requests.level, 0.0)
+                metrics.count("gemini.429")
+                metrics.count("gemini.retries")
+                if notify: notify(f"⚠️ 伺服器忙碌中。冷卻 {wait_time:.0f} 秒後重試...")
+                with metrics.span("limiter.backoff"):
+                    time.sleep(wait_time)
+        with self._cond:
+            self.counters["failed"] += 1
+        metrics.count("gemini.failures")
+        raise Exception("系統忙碌中，請過幾分鐘再試。")
+
+    @contextmanager
+    def stream_slot(self):
+        self._stream_slots.acquire()
+        with self._cond:
+            self.streams_active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.streams_active -= 1
+            self._stream_slots.release()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats["streams_active"] = self.streams_active
+            stats["queued_by_lane"] = {PRIORITY_NAMES[p]: n for p, n in self.queued_by_lane.items()}
+            return stats
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_limiter(**kwargs):
+    """整個行程共用同一個限流器；第一次呼叫時的參數決定 RPM/TPM 設定。"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter(**kwargs)
+        return _shared
@@ -0,0 +1,151 @@
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from tutor_context import tokenize
+
+# --- 全部講義全文搜尋 ---
+# 持久化的倒排索引 (SQLite)：詞 = 中日韓字元雙字組或英數單字，以 BM25 排序並附上含關鍵字的摘錄。
+# 只索引學生看得到的部分 (---TEACHER_ONLY--- 之前)，教師專屬內容永遠不會出現在搜尋結果裡。
+# 發布講義時逐篇更新；另外會對照目錄的內容雜湊，補上在程式外新增或修改的講義。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file TEXT UNIQUE NOT NULL,
+    sha256 TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc_id);
+"""
+
+SNIPPET_RADIUS = 40
+
+
+def student_visible(note):
+    return note.split("---TEACHER_ONLY---")[0]
+
+
+class SearchIndex:
+    def __init__(self, db_path, k1=1.2, b=0.75):
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, file, sha256, note):
+        """新增或更新一篇講義 (傳入完整講義，只會索引學生可見的部分)。"""
+        content = student_visible(note)
+        term_freqs = Counter(tokenize(content))
+        with self._write() as conn:
+            self._delete(conn, file)
+            doc_id = conn.execute(
+                "INSERT INTO docs (file, sha256, length, content) VALUES (?, ?, ?, ?)",
+                (file, sha256, sum(term_freqs.values()), content),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                ((term, doc_id, tf) for term, tf in term_freqs.items()),
+            )
+
+    def remove(self, file):
+        with self._write() as conn:
+            self._delete(conn, file)
+
+    def _delete(self, conn, file):
+        row = conn.execute("SELECT doc_id FROM docs WHERE file = ?", (file,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+            conn.execute("DELETE FROM docs WHERE doc_id = ?", (row[0],))
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def sync(self, catalog_entries, read_note):
+        """對照目錄 (file, sha256)：重建雜湊不同的講義、移除已不存在的講義。回傳更新篇數。"""
+        indexed = dict(self._conn().execute("SELECT file, sha256 FROM docs").fetchall())
+        current = {e["file"]: e["sha256"] for e in catalog_entries}
+        changed = 0
+        for file, sha in current.items():
+            if indexed.get(file) != sha:
+                self.update(file, sha, read_note(file))
+                changed += 1
+        for file in set(indexed) - set(current):
+            self.remove(file)
+            changed += 1
+        return changed
+
+    def search(self, query, limit=10):
+        """回傳 [{"file", "score", "snippet"}, ...]，依 BM25 分數由高到低。"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._conn()
+        n_docs, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        if not n_docs:
+            return []
+        avg_length = total_length / n_docs
+
+        scores = Counter()
+        placeholders = ",".join("?" * len(terms))
+        rows = conn.execute(
+            f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id "
+            f"WHERE p.term IN ({placeholders})",
+            terms,
+        ).fetchall()
+        doc_freq = Counter(term for term, _, _, _ in rows)
+        for term, doc_id, tf, length in rows:
+            idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+
+        results = []
+        for doc_id, score in scores.most_common(limit):
+            file, content = conn.execute("SELECT file, content FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            results.append({"file": file, "score": score, "snippet": make_snippet(content, query, terms)})
+        return results
+
+
+def make_snippet(content, query, terms, radius=SNIPPET_RADIUS):
+    # 優先找完整查詢字串，找不到再找第一個出現的詞；關鍵字以粗體標示
+    text = " ".join(content.split())
+    candidates = [w for w in re.split(r"\s+", query.strip()) if w] + terms
+    pos, hit = -1, ""
+    for word in candidates:
+        pos = text.lower().find(word.lower())
+        if pos >= 0:
+            hit = text[pos:pos + len(word)]
+            break
+    if pos < 0:
+        return text[: radius * 2] + ("…" if len(text) > radius * 2 else "")
+    start, end = max(0, pos - radius), min(len(text), pos + len(hit) + radius)
+    snippet = text[start:pos] + f"**{hit}**" + text[pos + len(hit):end]
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
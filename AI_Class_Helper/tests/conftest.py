@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "bench"))
+
+# 測試一律用本機假的 google.generativeai (bench/fake_genai.py)，不需要 API 金鑰
+import fake_genai
+fake_genai.install()
+
+
+@pytest.fixture
+def genai():
+    fake_genai.reset()
+    yield fake_genai
+    fake_genai.reset()
@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+from ai_cache import AICache, hash_file
+from ai_engine import analyze_audio_with_ai
+
+MODEL = "gemini-2.5-flash"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AICache(str(tmp_path / "ai_cache.db"))
+
+
+@pytest.fixture
+def audio(tmp_path):
+    path = tmp_path / "lecture.wav"
+    path.write_bytes(os.urandom(64 * 1024))
+    return str(path)
+
+
+def test_same_recording_and_prompt_hits_cache(genai, cache, audio):
+    first = analyze_audio_with_ai(MODEL, audio, "教師講義", cache=cache)
+    second = analyze_audio_with_ai(MODEL, audio, "教師講義", cache=cache)
+    assert first == second
+    assert genai.calls["upload_file"] == 1
+    assert genai.calls["generate_content"] == 1
+    assert cache.stats["result_hits"] == 1 and cache.stats["result_misses"] == 1
+
+
+def test_new_prompt_reuses_uploaded_file(genai, cache, audio):
+    analyze_audio_with_ai(MODEL, audio, "教師講義", cache=cache)
+    analyze_audio_with_ai(MODEL, audio, "學生筆記", cache=cache)
+    # 換提示詞要重新生成，但 Gemini 上的檔案還有效，不必重新上傳
+    assert genai.calls["generate_content"] == 2
+    assert genai.calls["upload_file"] == 1
+    assert cache.stats["file_hits"] == 1
+
+
+def test_result_key_includes_model_prompt_and_file_hash(cache, audio, tmp_path):
+    sha = hash_file(audio)
+    cache.put_result(sha, MODEL, "教師講義", "講義內容")
+    assert cache.get_result(sha, MODEL, "教師講義") == "講義內容"
+    assert cache.get_result(sha, "gemini-2.5-pro", "教師講義") is None
+    assert cache.get_result(sha, MODEL, "學生筆記") is None
+
+    other = tmp_path / "other.wav"
+    other.write_bytes(os.urandom(64 * 1024))
+    assert cache.get_result(hash_file(str(other)), MODEL, "教師講義") is None
+
+
+def test_changed_recording_misses(genai, cache, audio):
+    analyze_audio_with_ai(MODEL, audio, "教師講義", cache=cache)
+    with open(audio, "ab") as f:
+        f.write(b"\0")
+    analyze_audio_with_ai(MODEL, audio, "教師講義", cache=cache)
+    assert genai.calls["upload_file"] == 2
+    assert genai.calls["generate_content"] == 2
+
+
+def test_expired_remote_file_is_uploaded_again(genai, cache, audio):
+    analyze_audio_with_ai(MODEL, audio, "教師講義", cache=cache)
+    genai.delete_file(next(iter(genai._files)))
+    analyze_audio_with_ai(MODEL, audio, "學生筆記", cache=cache)
+    assert genai.calls["upload_file"] == 2
+    assert cache.stats["file_misses"] == 2
+
+
+def test_evicts_least_recently_used_over_size_limit(tmp_path):
+    cache = AICache(str(tmp_path / "small.db"), max_bytes=250)
+    for name in ("a", "b"):
+        cache.put_result(name, MODEL, "p", "x" * 100)
+        time.sleep(0.01)
+    cache.get_result("a", MODEL, "p")  # a 變成最近使用
+    time.sleep(0.01)
+    cache.put_result("c", MODEL, "p", "x" * 100)
+    assert cache.get_result("b", MODEL, "p") is None
+    assert cache.get_result("a", MODEL, "p") is not None
+    assert cache.get_result("c", MODEL, "p") is not None
+
+
+def test_evicts_results_older_than_max_age(tmp_path):
+    cache = AICache(str(tmp_path / "aged.db"), max_age=60)
+    cache.put_result("a", MODEL, "p", "舊講義")
+    cache._conn().execute("UPDATE results SET created = created - 120")
+    assert cache.get_result("a", MODEL, "p") is None
+    cache.evict()
+    assert cache._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0
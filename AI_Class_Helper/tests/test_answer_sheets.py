@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from answer_sheets import grade_matrix, grade_sheet, locate_columns, read_sheet
+
+OPTIONS = ["上升", "下降", "不變", "無法判斷"]
+QUIZ = [
+    {"question": "第 1 題", "options": OPTIONS, "answer": "上升"},
+    {"question": "第 2 題", "options": OPTIONS, "answer": "下降"},
+    {"question": "第 3 題", "options": OPTIONS, "answer": "不變"},
+    {"question": "第 4 題", "options": OPTIONS, "answer": "無法判斷"},
+]
+
+
+def sheet(*lines, encoding="utf-8-sig"):
+    return "\r\n".join(lines).encode(encoding)
+
+
+def test_grade_matrix_scores_and_ignores_unanswered_cells():
+    matrix = np.array([[0, 1, 2, 3], [0, -1, -1, -1], [3, 2, 1, 0], [-1, -1, -1, -1]], dtype=np.int8)
+    scores, correct = grade_matrix(matrix, [0, 1, 2, -1])
+    assert scores.tolist() == [75, 25, 0, 0]
+    assert correct.sum(axis=0).tolist() == [2, 1, 1, 0]
+
+
+def test_grade_matrix_with_no_students():
+    scores, correct = grade_matrix(np.empty((0, 4), dtype=np.int8), [0, 1, 2, 3])
+    assert scores.tolist() == [] and correct.shape == (0, 4)
+
+
+def test_grade_sheet_accepts_letters_numbers_and_option_text():
+    data = sheet(
+        "姓名/學號,Q1,Q2,Q3,Q4,交卷時間",
+        "S001,A,2,不變,d,2024-05-01 10:00",
+        "S002,a,B,,無法判斷,",
+        "S003,E,1,3,4,2024-05-01 10:05",
+        ",A,B,C,D,",
+    )
+    graded = grade_sheet(QUIZ, data, "sheet.csv", timestamp="預設時間")
+    assert graded["names"] == ["S001", "S002", "S003"]
+    assert graded["scores"].tolist() == [100, 75, 50]
+    assert graded["matrix"].tolist() == [[0, 1, 2, 3], [0, 1, -1, 3], [-1, 0, 2, 3]]
+    assert graded["unknown"] == 1 and graded["skipped"] == 1
+    assert graded["timestamps"] == ["2024-05-01 10:00", "預設時間", "2024-05-01 10:05"]
+    assert graded["key_indices"] == [0, 1, 2, 3]
+
+
+def test_grade_sheet_reads_big5_csv_and_reordered_columns():
+    data = sheet("第2題,學生,第1題,第4題,第3題,分數", "B,王小明,A,D,C,100", encoding="cp950")
+    graded = grade_sheet(QUIZ, data, "sheet.csv")
+    assert graded["names"] == ["王小明"] and graded["scores"].tolist() == [100]
+    assert len(graded["timestamps"]) == 1
+
+
+def test_read_sheet_pads_short_rows_and_drops_blank_ones():
+    header, rows = read_sheet(sheet("姓名,Q1,Q2", "S001,A", ",,", " S002 , B ,C"), "sheet.csv")
+    assert header == ["姓名", "Q1", "Q2"]
+    assert rows == [["S001", "A", ""], ["S002", "B", "C"]]
+
+
+def test_locate_columns_falls_back_to_first_other_column():
+    assert locate_columns(["座號", "Q2", "Q1"], 2) == (0, None, [2, 1])
+
+
+@pytest.mark.parametrize("header, message", [
+    (["姓名", "Q1", "Q2"], "Q1 到 Q4"),
+    (["分數", "Q1", "Q2", "Q3", "Q4"], "姓名/學號"),
+])
+def test_locate_columns_rejects_mismatched_sheets(header, message):
+    with pytest.raises(ValueError, match=message):
+        locate_columns(header, 4)
+
+
+def test_empty_and_nameless_sheets_are_rejected():
+    with pytest.raises(ValueError, match="空的"):
+        read_sheet(b"", "sheet.csv")
+    with pytest.raises(ValueError, match="沒有任何學生"):
+        grade_sheet(QUIZ, sheet("姓名,Q1,Q2,Q3,Q4", ",A,B,C,D"), "sheet.csv")
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+
+import pytest
+
+from comment_store import CommentStore
+
+LECTURE = "第三週.md"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CommentStore(str(tmp_path / "comments"))
+
+
+def test_append_and_read_back_in_order(store):
+    assert store.get_messages(LECTURE) == []
+    store.append(LECTURE, "學生", "第二點看不懂")
+    store.append(LECTURE, "老師", "下課來問我")
+    assert store.get_messages(LECTURE) == [{"role": "學生", "content": "第二點看不懂"}, {"role": "老師", "content": "下課來問我"}]
+    assert store.get_messages("其他講義.md") == []
+
+
+def test_read_since_returns_only_new_messages(store):
+    store.append(LECTURE, "學生", "一")
+    new, cursor = store.read_since(LECTURE, 0)
+    assert [m["content"] for m in new] == ["一"] and cursor == 1
+    store.append(LECTURE, "學生", "二")
+    store.append(LECTURE, "學生", "三")
+    new, cursor = store.read_since(LECTURE, cursor)
+    assert [m["content"] for m in new] == ["二", "三"] and cursor == 3
+    assert store.read_since(LECTURE, cursor) == ([], 3)
+
+
+def test_sees_messages_written_by_another_instance(store, tmp_path):
+    other = CommentStore(str(tmp_path / "comments"))
+    store.append(LECTURE, "學生", "一")
+    assert len(store.get_messages(LECTURE)) == 1
+    other.append(LECTURE, "學生", "二")
+    assert [m["content"] for m in store.get_messages(LECTURE)] == ["一", "二"]
+
+
+def test_half_written_line_waits_for_next_read(store):
+    store.append(LECTURE, "學生", "一")
+    with open(store._shard_path(LECTURE), "ab") as f:
+        f.write('{"role": "學生", "content": "寫到一半'.encode("utf-8"))
+    assert len(store.get_messages(LECTURE)) == 1
+    with open(store._shard_path(LECTURE), "ab") as f:
+        f.write('"}\n'.encode("utf-8"))
+    assert [m["content"] for m in store.get_messages(LECTURE)] == ["一", "寫到一半"]
+
+
+def test_rewritten_shard_is_read_again(store):
+    store.append(LECTURE, "學生", "一")
+    store.append(LECTURE, "學生", "二")
+    store.get_messages(LECTURE)
+    os.remove(store._shard_path(LECTURE))
+    store.append(LECTURE, "老師", "重新開始")
+    assert store.get_messages(LECTURE) == [{"role": "老師", "content": "重新開始"}]
+
+
+def test_concurrent_appends_are_not_lost(store):
+    def post(n):
+        for i in range(50):
+            store.append(LECTURE, "學生", f"{n}-{i}")
+
+    threads = [threading.Thread(target=post, args=(n,)) for n in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(store.get_messages(LECTURE)) == 200
+
+
+def test_migrate_from_json_skips_existing_shards(store, tmp_path):
+    store.append(LECTURE, "學生", "已經有的留言")
+    legacy = tmp_path / "comments.json"
+    legacy.write_text(json.dumps({
+        LECTURE: [{"role": "學生", "content": "舊留言"}],
+        "第一週.md": [{"role": "學生", "content": "a"}, {"role": "老師", "content": "b"}],
+    }), encoding="utf-8")
+    assert store.migrate_from_json(str(legacy)) == 2
+    assert not legacy.exists()
+    assert [m["content"] for m in store.get_messages("第一週.md")] == ["a", "b"]
+    assert [m["content"] for m in store.get_messages(LECTURE)] == ["已經有的留言"]
@@ -0,0 +1,24 @@
+from live_quiz import FINISHED, REVEAL, LiveQuizHub
+from quiz_store import QuizResultStore
+
+OPTIONS = ["上升", "下降", "不變", "無法判斷"]
+
+
+def test_answer_missing_from_options_scores_nobody(tmp_path):
+    store = QuizResultStore(str(tmp_path / "quiz.db"))
+    hub = LiveQuizHub(results_store=store)
+    quiz = [
+        {"question": "第 1 題", "options": OPTIONS, "answer": "上升", "explanation": ""},
+        {"question": "第 2 題", "options": OPTIONS, "answer": "大幅上升", "explanation": ""},  # 手動改壞的正確答案
+    ]
+    code = hub.create_room("手動修改.json", quiz, "teacher")
+    hub.join(code, "小明")
+    for choice in (0, 0):
+        hub.next_question(code)
+        assert hub.answer(code, "小明", choice)
+        hub.reveal(code)
+        assert hub.snapshot(code)["phase"] == REVEAL
+    assert hub.finish(code) == 1
+    assert hub.snapshot(code)["phase"] == FINISHED
+    assert store.get_results("手動修改.json")[0]["score"] == 50
+    assert store.get_stats("手動修改.json")["correct"] == [1, 0]
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import types
+
+import pytest
+
+from pdf_cache import PdfCache
+
+# 假的 WeasyPrint：子行程透過 PYTHONPATH 載入，把 HTML 原樣當成 PDF 內容；內容有「壞掉」時排版失敗
+FAKE_WEASYPRINT = '''
+class HTML:
+    def __init__(self, string):
+        self.string = string
+
+    def write_pdf(self):
+        if "壞掉" in self.string:
+            raise ValueError("排版失敗")
+        return b"%PDF-" + self.string.encode("utf-8")
+'''
+
+
+def wait_until_cached(cache, md_content, view):
+    # 結果寫入快取是在 Future 完成後的回呼裡做的，稍等一下
+    for _ in range(100):
+        if cache.cached_path(md_content, view) is not None:
+            return
+        time.sleep(0.05)
+    raise AssertionError("PDF 沒有寫入快取")
+
+
+@pytest.fixture
+def fake_weasyprint(tmp_path, monkeypatch):
+    stub_dir = tmp_path / "stub"
+    stub_dir.mkdir()
+    (stub_dir / "weasyprint.py").write_text(FAKE_WEASYPRINT, encoding="utf-8")
+    monkeypatch.setenv("PYTHONPATH", str(stub_dir))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PdfCache(str(tmp_path / "pdf"), timeout=30)
+
+
+def test_render_caches_by_content_and_view(fake_weasyprint, cache):
+    assert cache.get_cached("# 第一週", "teacher") is None
+    data = cache.render("# 第一週", "teacher")
+    assert data.startswith(b"%PDF-") and "第一週".encode("utf-8") in data
+    cache.submit("# 第一週", "student").result(timeout=30)
+    wait_until_cached(cache, "# 第一週", "teacher")
+    wait_until_cached(cache, "# 第一週", "student")
+    assert cache.get_cached("# 第一週", "teacher") == data
+    assert cache.cached_path("# 第二週", "teacher") is None
+
+
+def test_same_note_in_flight_shares_one_future(fake_weasyprint, cache):
+    first = cache.submit("# 第一週", "teacher")
+    assert cache.submit("# 第一週", "teacher") is first
+    first.result(timeout=30)
+
+
+def test_worker_does_not_rerun_page_script(fake_weasyprint, cache, tmp_path, monkeypatch):
+    # Streamlit 把頁面腳本登記成 __main__；排版子行程不可以再執行它
+    marker = tmp_path / "ran"
+    script = tmp_path / "page.py"
+    script.write_text(f"open({str(marker)!r}, 'w').close()\n", encoding="utf-8")
+    page = types.ModuleType("__main__")
+    page.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", page)
+    cache.render("# 第一週", "teacher")
+    assert not marker.exists()
+
+
+def test_render_error_is_raised_and_worker_keeps_serving(fake_weasyprint, cache):
+    with pytest.raises(RuntimeError, match="ValueError: 排版失敗"):
+        cache.render("# 壞掉的講義", "teacher")
+    assert cache.render("# 第一週", "teacher").startswith(b"%PDF-")
+    wait_until_cached(cache, "# 第一週", "teacher")
+    assert cache.cached_path("# 壞掉的講義", "teacher") is None
+    assert len(os.listdir(cache.cache_dir)) == 1
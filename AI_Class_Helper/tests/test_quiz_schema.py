@@ -0,0 +1,78 @@
+import json
+
+from quiz_schema import apply_variant, make_variants, parse_quiz_json, repair_item, validate_quiz
+
+
+def item(question="價格上升時需求量會？", options=("上升", "下降", "不變", "無法判斷"), answer="下降", **extra):
+    return {"question": question, "options": list(options), "answer": answer, "explanation": "需求法則", **extra}
+
+
+def test_parse_plain_array_and_wrapped_objects():
+    assert parse_quiz_json(json.dumps([item()])) == [item()]
+    assert parse_quiz_json(json.dumps({"questions": [item()]})) == [item()]
+    assert parse_quiz_json(json.dumps(item())) == [item()]
+
+
+def test_parse_extracts_array_from_surrounding_text():
+    text = "好的，以下是測驗：\n```json\n" + json.dumps([item()], ensure_ascii=False) + "\n```"
+    assert parse_quiz_json(text) == [item()]
+
+
+def test_parse_garbage_returns_empty_list():
+    assert parse_quiz_json("抱歉，我無法出題") == []
+    assert parse_quiz_json(None) == []
+
+
+def test_repair_strips_option_labels_and_maps_letter_answer():
+    fixed, problem = repair_item(item(options=["A. 上升", "B. 下降", "C. 不變", "D. 無法判斷"], answer="B"))
+    assert problem is None
+    assert fixed["options"] == ["上升", "下降", "不變", "無法判斷"]
+    assert fixed["answer"] == "下降"
+
+
+def test_repair_keeps_options_that_only_look_like_labels():
+    # 只有部分選項看起來像標號時不能去掉 (例如「1. 5 元」是選項本身)
+    options = ["1. 5 元", "2 元", "3 元", "4 元"]
+    fixed, _ = repair_item(item(options=options, answer="2 元"))
+    assert fixed["options"] == options
+
+
+def test_repair_maps_index_and_labelled_answers():
+    assert repair_item(item(answer=1))[0]["answer"] == "下降"
+    assert repair_item(item(answer="(B)"))[0]["answer"] == "下降"
+    assert repair_item(item(answer="B. 下降"))[0]["answer"] == "下降"
+
+
+def test_repair_rejects_broken_items():
+    assert repair_item("不是物件")[1] == "不是題目物件"
+    assert repair_item(item(question=" "))[1] == "缺少題目"
+    assert repair_item(item(options=["上升", "下降", "不變"]))[1] == "選項數為 3"
+    assert repair_item(item(options=["上升", "上升", "不變", "下降"]))[1] == "選項重複或空白"
+    assert repair_item(item(answer="大幅上升"))[1] == "答案不在選項中"
+    assert repair_item(item(answer=True))[1] == "答案不在選項中"
+
+
+def test_validate_drops_duplicates_and_reports_problems():
+    raw = [item(), item(question="價格上升時 需求量會？"), item(question="均衡價格？", answer="E"), item(question="供給？")]
+    items, problems = validate_quiz(raw)
+    assert [q["question"] for q in items] == ["價格上升時需求量會？", "供給？"]
+    assert problems == [(1, "題目重複"), (2, "答案不在選項中")]
+
+
+def test_validate_limits_number_of_items():
+    items, problems = validate_quiz([item(question=f"第 {i} 題") for i in range(12)], limit=10)
+    assert len(items) == 10 and problems == []
+
+
+def test_variants_keep_answers_and_cover_every_question():
+    quiz = [item(question=f"第 {i} 題", answer=["上升", "下降", "不變", "無法判斷"][i % 4]) for i in range(6)]
+    variants = make_variants(quiz, 3, seed=1)
+    assert len(variants) == 3
+    assert apply_variant(quiz, variants[0]) == [{**q, "source": i} for i, q in enumerate(quiz)]
+    assert make_variants(quiz, 3, seed=1) == variants
+    for variant in variants[1:]:
+        shuffled = apply_variant(quiz, variant)
+        assert sorted(q["source"] for q in shuffled) == list(range(len(quiz)))
+        for q in shuffled:
+            assert q["answer"] == quiz[q["source"]]["answer"] and q["answer"] in q["options"]
+            assert sorted(q["options"]) == sorted(quiz[q["source"]]["options"])
@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pytest
+
+from quiz_store import QuizResultStore, decode_answer_matrix, encode_answer_matrix, encode_answers, item_analysis
+
+QUIZ = "第三週.json"
+KEY = [1, 0, -1]  # 第 3 題的正確答案對不上任何選項
+ROWS = [
+    ("小明", 100, "2024-01-01 10:00", [1, 0, 2]),
+    ("小華", 33, "2024-01-01 10:01", [None, 0, None]),
+    ("小美", 0, "2024-01-01 10:02", [2, 3, 0]),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return QuizResultStore(str(tmp_path / "quiz.db"))
+
+
+def test_stats_accumulate_per_submission(store):
+    for name, score, timestamp, answers in ROWS:
+        store.add_result(QUIZ, name, score, timestamp, answers, KEY)
+    stats = store.get_stats(QUIZ)
+    assert stats["count"] == 3 and stats["mean"] == pytest.approx(133 / 3)
+    assert stats["histogram"][10] == 1 and stats["histogram"][3] == 1 and stats["histogram"][0] == 1
+    assert stats["answered"] == 3
+    assert stats["correct"] == [1, 2, 0]
+    assert stats["options"] == [[0, 1, 1], [2, 0, 0, 1], [1, 0, 1]]
+    assert [r["name"] for r in store.get_results(QUIZ)] == ["小明", "小華", "小美"]
+    assert [r["name"] for r in store.get_results(QUIZ, limit=2)] == ["小華", "小美"]
+
+
+def test_batch_and_matrix_imports_match_single_submissions(tmp_path, store):
+    for name, score, timestamp, answers in ROWS:
+        store.add_result(QUIZ, name, score, timestamp, answers, KEY)
+
+    batch = QuizResultStore(str(tmp_path / "batch.db"))
+    batch.add_results(QUIZ, ROWS, KEY)
+
+    bulk = QuizResultStore(str(tmp_path / "bulk.db"))
+    matrix = np.array([[-1 if a is None else a for a in answers] for *_, answers in ROWS], dtype=np.int8)
+    names, scores, timestamps, _ = zip(*ROWS)
+    assert bulk.add_answer_matrix(QUIZ, names, scores, timestamps, matrix, KEY) == 3
+
+    expected = store.get_stats(QUIZ)
+    assert batch.get_stats(QUIZ) == expected
+    assert bulk.get_stats(QUIZ) == expected
+
+
+def test_answer_matrix_round_trip(store):
+    store.add_results(QUIZ, ROWS + [("舊紀錄", 50, "", None)], KEY)
+    matrix, scores = store.get_answer_matrix(QUIZ, 3)
+    assert matrix.tolist() == [[1, 0, 2], [-1, 0, -1], [2, 3, 0]]
+    assert scores.tolist() == [100, 33, 0]
+    assert encode_answer_matrix(matrix) == [encode_answers(answers) for *_, answers in ROWS]
+    assert decode_answer_matrix(encode_answer_matrix(matrix), 3).tolist() == matrix.tolist()
+
+
+def test_changed_question_count_restarts_item_stats(store):
+    store.add_result(QUIZ, "小明", 100, "", [1, 0, 2], KEY)
+    store.add_result(QUIZ, "小華", 50, "", [1, 1], [1, 0])
+    stats = store.get_stats(QUIZ)
+    assert stats["count"] == 2
+    assert stats["n_questions"] == 2 and stats["answered"] == 1 and stats["correct"] == [1, 0]
+
+
+def test_item_analysis_ignores_unanswered_cells():
+    matrix = np.array([[1, 0, -1], [1, 1, -1], [0, 1, -1], [0, 0, -1]], dtype=np.int8)
+    result = item_analysis(matrix, [100, 67, 33, 0], KEY, group_fraction=0.5)
+    assert result["difficulty"].tolist() == [0.5, 0.5, 0.0]
+    assert result["discrimination"].tolist() == [1.0, 0.0, 0.0]
+
+
+def test_migrate_from_json_runs_once(tmp_path, store):
+    legacy = tmp_path / "quiz_results.json"
+    legacy.write_text(json.dumps({QUIZ: [{"name": "小明", "score": 80, "timestamp": "t"}]}), encoding="utf-8")
+    assert store.migrate_from_json(str(legacy)) == 1
+    assert not legacy.exists()
+    legacy.write_text(json.dumps({QUIZ: [{"name": "小明", "score": 80}]}), encoding="utf-8")
+    assert store.migrate_from_json(str(legacy)) == 0
+    assert store.get_stats(QUIZ)["count"] == 1
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from tutor_cache import TutorAnswerCache, minhash, normalize_question, note_key, shingles
+
+NOTE = note_key("# 第三週：供給與需求", "gemini-2.5-flash")
+TITLE = "第三週"
+
+
+def test_normalize_drops_fillers_punctuation_and_variants():
+    assert normalize_question("請問，第二點是甚麼意思？") == "第二點是什麼意思"
+    assert normalize_question("老師 想問 ＡＢＣ 是什么?") == "abc是什麼"
+    assert normalize_question("請問") == "請問"  # 只剩開頭語時保留原字
+
+
+def test_minhash_is_stable_across_calls():
+    pieces = shingles(normalize_question("供給曲線為什麼向右上方"))
+    assert minhash(pieces) == minhash(set(pieces))
+    assert shingles("甲") == {"甲"}
+
+
+def test_paraphrased_question_hits():
+    cache = TutorAnswerCache()
+    assert cache.lookup(NOTE, "第二點是什麼意思", title=TITLE) is None
+    cache.store(NOTE, "第二點是什麼意思", "答案二", title=TITLE)
+    assert cache.lookup(NOTE, "請問第二點是甚麼意思？", title=TITLE) == "答案二"
+    assert cache.lookup(NOTE, "第二點是什麼意思呢", title=TITLE) == "答案二"
+
+
+def test_different_question_or_note_misses():
+    cache = TutorAnswerCache()
+    cache.store(NOTE, "供給曲線為什麼向右上方", "供給的答案", title=TITLE)
+    assert cache.lookup(NOTE, "需求曲線為什麼向右下方", title=TITLE) is None
+    other_note = note_key("# 第三週：供給與需求 (修訂版)", "gemini-2.5-flash")
+    assert cache.lookup(other_note, "供給曲線為什麼向右上方") is None
+    assert note_key("講義", "gemini-2.5-flash") != note_key("講義", "gemini-2.5-pro")
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = TutorAnswerCache(ttl=60)
+    cache.store(NOTE, "第二點是什麼意思", "答案二")
+    now = time.time()
+    monkeypatch.setattr("tutor_cache.time.time", lambda: now + 61)
+    assert cache.lookup(NOTE, "第二點是什麼意思") is None
+    assert cache.lookup(NOTE, "請問第二點是什麼意思") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TutorAnswerCache(max_entries=2)
+    cache.store(NOTE, "第一點可以再解釋一次嗎", "答案一")
+    cache.store(NOTE, "第二點是什麼意思", "答案二")
+    assert cache.lookup(NOTE, "第一點可以再解釋一次嗎") == "答案一"
+    cache.store(NOTE, "均衡價格是怎麼決定的", "均衡")
+    assert cache.lookup(NOTE, "第二點是什麼意思") is None
+    assert cache.lookup(NOTE, "第一點可以再解釋一次嗎") == "答案一"
+    assert len(cache._entries) == 2
+    assert not any(cache._buckets.get(key) == set() for key in cache._buckets)
+
+
+def test_storing_same_question_replaces_answer():
+    cache = TutorAnswerCache()
+    cache.store(NOTE, "第二點是什麼意思", "舊答案")
+    cache.store(NOTE, "請問第二點是什麼意思？", "新答案")
+    assert cache.lookup(NOTE, "第二點是什麼意思") == "新答案"
+    assert len(cache._entries) == 1
+
+
+@pytest.mark.parametrize("question, answer", [("？？", "答案"), ("第二點是什麼意思", "")])
+def test_blank_questions_and_answers_are_not_stored(question, answer):
+    cache = TutorAnswerCache()
+    cache.store(NOTE, question, answer)
+    assert not cache._entries
+
+
+def test_stats_per_note_title():
+    cache = TutorAnswerCache()
+    cache.lookup(NOTE, "第二點是什麼意思", title=TITLE)
+    cache.store(NOTE, "第二點是什麼意思", "答案二", title=TITLE)
+    cache.lookup(NOTE, "請問第二點是什麼意思", title=TITLE)
+    cache.lookup(NOTE, "第二點是甚麼意思？", title=TITLE)
+    stats = cache.stats(TITLE)
+    assert stats["asks"] == 3 and stats["hits"] == 2
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["top"] == [("第二點是什麼意思", 3)]
+    assert cache.stats("其他講義") == {"asks": 0, "hits": 0, "hit_rate": 0.0, "top": []}
@@ -0,0 +1,163 @@
+import hashlib
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+# --- AI 助教共用答案快取 ---
+# 很多學生會對同一份講義問幾乎一樣的問題 (「第二點是什麼意思」「請問第二點是什麼意思？」)，
+# 第一個人問完後把答案存起來，之後相近的問題直接回答，不必再呼叫 Gemini。
+# 以「講義內容 + 模型」的雜湊分開存放：講義改版後舊答案自然不會再被用到。
+#
+# 問題先正規化 (全半形、大小寫、去掉標點空白與「請問」之類的開頭)，再切成兩字一組的字元片段 (shingle)；
+# 用 MinHash 簽章分帶 (LSH) 找出候選，再以片段集合的 Jaccard 相似度確認，超過門檻才算同一個問題。
+# 整個伺服器行程共用一份 (app.py 以 st.cache_resource 建立)，有存活時間 (TTL) 與筆數上限 (LRU 淘汰)。
+# 另外依講義記錄提問次數、命中率與最常被問的問題，給老師端查看。
+
+SHINGLE_SIZE = 2
+NUM_PERM = 64
+BANDS = 16                      # 每帶 NUM_PERM // BANDS = 4 個雜湊值
+SIMILARITY_THRESHOLD = 0.7
+DEFAULT_TTL = 7 * 24 * 3600
+MAX_ENTRIES = 2000
+TOP_QUESTIONS = 10
+
+FILLER_RE = re.compile(r"^(?:請問|老師|想問|我想問|請教|不好意思|助教)+")
+VARIANTS = {"为什么": "為什麼", "甚麼": "什麼", "什么": "什麼", "怎么": "怎麼"}  # 依序取代，長的放前面
+_PRIME = (1 << 61) - 1
+# 固定種子：同一個問題在任何行程裡都得到同一組簽章
+_rng = random.Random(2024)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_question(text):
+    text = re.sub(r"[\W_]+", "", unicodedata.normalize("NFKC", text).lower())
+    for variant, canonical in VARIANTS.items():
+        text = text.replace(variant, canonical)
+    return FILLER_RE.sub("", text) or text
+
+
+def shingles(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingle_set]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature):
+    rows = NUM_PERM // BANDS
+    return [(band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+
+def note_key(note_text, model_name):
+    return hashlib.sha256(f"{model_name}\0{note_text}".encode("utf-8")).hexdigest()
+
+
+class TutorAnswerCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES, threshold=SIMILARITY_THRESHOLD):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 編號 -> 問答 (依最近使用排序，最舊的在前面)
+        self._exact = {}               # (講義, 正規化問題) -> 編號
+        self._buckets = {}             # (講義, 帶, 帶內雜湊) -> {編號}
+        self._stats = {}               # 講義標題 -> {"hits", "misses"}
+        self._next_id = 0
+
+    def lookup(self, note, question, title=None):
+        """找相近問題的答案；沒有則回傳 None。note 為 note_key()，title 用來統計 (可省略)。"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        pieces = shingles(normalized)
+        signature = minhash(pieces)
+        now = time.time()
+        with self._lock:
+            entry_id = self._exact.get((note, normalized))
+            if entry_id is None:
+                entry_id = self._best_match(note, pieces, signature, now)
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            if entry is not None and now - entry["created"] > self.ttl:
+                self._remove(entry_id)
+                entry = None
+            stats = self._stats.setdefault(title, {"hits": 0, "misses": 0})
+            if entry is None:
+                stats["misses"] += 1
+                metrics.count("tutor_cache.miss")
+                return None
+            self._entries.move_to_end(entry_id)
+            entry["asks"] += 1
+            stats["hits"] += 1
+        metrics.count("tutor_cache.hit")
+        return entry["answer"]
+
+    def _best_match(self, note, pieces, signature, now):
+        # 呼叫時必須持有鎖；LSH 只負責縮小候選範圍，最後以實際的 Jaccard 相似度決定
+        candidates = set()
+        for band, values in _bands(signature):
+            candidates |= self._buckets.get((note, band, values), set())
+        best_id, best_score = None, self.threshold
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if now - entry["created"] > self.ttl:
+                continue
+            score = len(pieces & entry["shingles"]) / len(pieces | entry["shingles"])
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+        return best_id
+
+    def store(self, note, question, answer, title=None):
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        pieces = shingles(normalized)
+        signature = minhash(pieces)
+        with self._lock:
+            old_id = self._exact.get((note, normalized))
+            if old_id is not None:
+                self._remove(old_id)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "note": note, "title": title, "question": question.strip(), "normalized": normalized,
+                "shingles": pieces, "signature": signature, "answer": answer, "created": time.time(), "asks": 1,
+            }
+            self._exact[(note, normalized)] = entry_id
+            for band, values in _bands(signature):
+                self._buckets.setdefault((note, band, values), set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                metrics.count("tutor_cache.evicted")
+
+    def _remove(self, entry_id):
+        # 呼叫時必須持有鎖
+        entry = self._entries.pop(entry_id)
+        self._exact.pop((entry["note"], entry["normalized"]), None)
+        for band, values in _bands(entry["signature"]):
+            bucket = self._buckets.get((entry["note"], band, values))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(entry["note"], band, values)]
+
+    def stats(self, title):
+        """某份講義的提問統計：{"asks", "hits", "hit_rate", "top": [(問題, 次數), ...]}。"""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._stats.get(title, {"hits": 0, "misses": 0}))
+            top = sorted(
+                ((e["question"], e["asks"]) for e in self._entries.values() if e["title"] == title and now - e["created"] <= self.ttl),
+                key=lambda x: -x[1],
+            )[:TOP_QUESTIONS]
+        asks = counts["hits"] + counts["misses"]
+        return {"asks": asks, "hits": counts["hits"], "hit_rate": counts["hits"] / asks if asks else 0.0, "top": top}
@@ -0,0 +1,145 @@
+import math
+import re
+from collections import Counter
+
+from rate_limiter import estimate_tokens
+
+# --- AI 助教的上下文視窗 ---
+# 講義依 Markdown 標題切成段落，以「中日韓字元雙字組 + 英數單字」建立 BM25 索引；
+# 每次提問只送出最相關的幾個段落 + 較早對話的摘要 + 最近幾輪原文，並控制在 token 預算內。
+
+HEADING_RE = re.compile(r"^(#{1,6}\s+.+|\d+\.\s*\S.*)$")
+CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+WORD_RE = re.compile(r"[A-Za-z0-9]+")
+MAX_SECTION_CHARS = 1200
+RECENT_TURN_MAX_CHARS = 800
+
+
+def tokenize(text):
+    """中日韓文字切成相鄰雙字組 (單字則保留單字)，英數則以單字為單位 (轉小寫)。"""
+    tokens = [w.lower() for w in WORD_RE.findall(text)]
+    for run in CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def split_sections(note, max_chars=MAX_SECTION_CHARS):
+    """依標題行 (# 標題 或 講義格式中的「1. 📖 …」) 切段，過長的段落再依空行切小。"""
+    sections = []
+    current = []
+    for line in note.splitlines():
+        if HEADING_RE.match(line.strip()) and not line.startswith((" ", "\t")) and current:
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+
+    result = []
+    for section in filter(None, sections):
+        if len(section) <= max_chars:
+            result.append(section)
+            continue
+        title = section.splitlines()[0]
+        chunk = ""
+        for para in re.split(r"\n\s*\n", section):
+            if chunk and len(chunk) + len(para) > max_chars:
+                result.append(chunk.strip())
+                chunk = f"{title} (續)\n"
+            chunk += para + "\n\n"
+        if chunk.strip():
+            result.append(chunk.strip())
+    return result
+
+
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(d)) for d in documents]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if documents else 0.0
+        doc_freq = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(documents)
+        self.idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+    def scores(self, query):
+        query_terms = Counter(tokenize(query))
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1))
+            for term, qf in query_terms.items():
+                f = tf.get(term)
+                if f:
+                    score += self.idf[term] * f * (self.k1 + 1) / (f + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query, k=3):
+        """回傳 [(段落編號, 分數), ...]，依分數由高到低。"""
+        ranked = sorted(enumerate(self.scores(query)), key=lambda x: x[1], reverse=True)
+        return [(i, s) for i, s in ranked[:k] if s > 0]
+
+
+class NoteIndex:
+    def __init__(self, note):
+        self.sections = split_sections(note)
+        self.bm25 = BM25Index(self.sections)
+
+    def relevant_sections(self, query, k=3, token_budget=2000):
+        # 第一段 (通常是課程摘要) 永遠當作背景；其他依相關度加入直到超過預算，輸出時恢復講義原本順序
+        picked = [0] if self.sections else []
+        used = estimate_tokens(self.sections[0]) if self.sections else 0
+        for i, _ in self.bm25.search(query, k=k + 1):
+            if i in picked:
+                continue
+            cost = estimate_tokens(self.sections[i])
+            if used + cost > token_budget or len(picked) > k:
+                continue
+            picked.append(i)
+            used += cost
+        return [self.sections[i] for i in sorted(picked)]
+
+
+def summarize_turns(turns, max_chars=600):
+    """把較早的對話壓成每輪一行的摘要，只保留最近、放得下的幾行。"""
+    lines = []
+    for msg in turns:
+        content = " ".join(msg["content"].split())
+        if msg["role"] == "user":
+            lines.append(f"學生問：{content[:60]}")
+        else:
+            lines.append(f"助教答：{content[:80]}")
+    kept = []
+    total = 0
+    for line in reversed(lines):
+        if total + len(line) > max_chars:
+            break
+        kept.append(line)
+        total += len(line)
+    return "\n".join(reversed(kept))
+
+
+def build_chat_context(index, history, question, token_budget=3000, k=3, recent_turns=4):
+    """組出送給 AI 助教的上下文：相關講義段落 + 較早對話摘要 + 最近幾輪原文。"""
+    recent = history[-recent_turns:] if recent_turns else []
+    older = history[:-recent_turns] if recent_turns else history
+    recent_text = "".join(
+        f"{'學生' if m['role'] == 'user' else 'AI助教'}: {m['content'][:RECENT_TURN_MAX_CHARS]}\n" for m in recent
+    )
+    summary = summarize_turns(older, max_chars=max(0, token_budget // 5))
+    # 先扣掉對話部分，剩下的預算給講義段落 (檢索時同時參考最近一輪提問，讓「那第二點呢？」也找得到)
+    note_budget = max(token_budget // 4, token_budget - estimate_tokens(recent_text) - estimate_tokens(summary))
+    query = question + " " + " ".join(m["content"] for m in recent if m["role"] == "user")
+    sections = index.relevant_sections(query, k=k, token_budget=note_budget)
+
+    context = "【課堂筆記相關段落】\n" + "\n\n".join(sections) + "\n\n"
+    if summary:
+        context += f"【較早的對話摘要】\n{summary}\n\n"
+    context += f"【最近的對話紀錄】\n{recent_text}"
+    return context
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import metrics
+
+# --- 上傳錄音的落地與流量管制 ---
+# 上傳的錄音以固定大小的區塊直接寫到暫存檔，不再用 getvalue() 複製出一份完整的 bytes；
+# 寫入失敗時暫存檔一定會刪除。
+# UploadBudget 限制「已寫到暫存檔但還沒處理完」的錄音總位元組數 (每個 session 與整個伺服器各一個上限)，
+# 多位老師同時上傳長錄音時暫存空間有上限，超過時請使用者稍後再送。
+# 它只管暫存檔：腳本拿到 UploadedFile 時，Streamlit 已經把整個檔案收進記憶體，
+# 記憶體尖峰要靠 .streamlit/config.toml 的 server.maxUploadSize 限制單一檔案大小。
+
+CHUNK_BYTES = 1024 * 1024
+
+
+def upload_size(buffer):
+    size = getattr(buffer, "size", None)
+    if size is None:
+        position = buffer.tell()
+        size = buffer.seek(0, os.SEEK_END)
+        buffer.seek(position)
+    return size
+
+
+def spool_to_disk(buffer, suffix, chunk_bytes=CHUNK_BYTES):
+    """把檔案物件逐塊寫到暫存檔並回傳路徑；記憶體用量固定為一個區塊。"""
+    buffer.seek(0)
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out, metrics.span("upload.spool"):
+            shutil.copyfileobj(buffer, out, chunk_bytes)
+    except BaseException:
+        try: os.remove(path)
+        except OSError: pass
+        raise
+    return path
+
+
+class UploadBudget:
+    def __init__(self, global_max_bytes, session_max_bytes):
+        self.global_max_bytes = global_max_bytes
+        self.session_max_bytes = session_max_bytes
+        self._lock = threading.Lock()
+        self._total = 0
+        self._sessions = {}
+
+    def try_acquire(self, session_id, nbytes):
+        """額度足夠就記帳並回傳 True；否則回傳 False，不會等待。"""
+        with self._lock:
+            used = self._sessions.get(session_id, 0)
+            if used + nbytes > self.session_max_bytes or self._total + nbytes > self.global_max_bytes:
+                return False
+            self._sessions[session_id] = used + nbytes
+            self._total += nbytes
+            return True
+
+    def release(self, session_id, nbytes):
+        with self._lock:
+            remaining = self._sessions.get(session_id, 0) - nbytes
+            if remaining > 0:
+                self._sessions[session_id] = remaining
+            else:
+                self._sessions.pop(session_id, None)
+            self._total = max(0, self._total - nbytes)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight_bytes": self._total, "sessions": len(self._sessions)}